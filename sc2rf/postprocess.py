@@ -4,10 +4,15 @@ import pandas as pd
 import click
 import os
 import logging
-import requests
 import sys
 import time
-from Bio import Phylo
+from profiling import PhaseProfiler
+
+# The lineage tree is shared with the pipeline scripts
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+from lineage_tree import read_lineage_tree  # noqa: E402
 
 NO_DATA_CHAR = "NA"
 
@@ -202,7 +207,7 @@ def reverse_iter_collapse(
 )
 @click.option(
     "--lineage-tree",
-    help="Newick tree of pangolin lineage hierarchies",
+    help="Tree of pangolin lineage hierarchies (newick or npz index)",
     required=False,
 )
 @click.option(
@@ -227,6 +232,22 @@ def reverse_iter_collapse(
     required=False,
     default="lineage",
 )
+@click.option(
+    "--profile-out",
+    help="Write the wall time, CPU time and item counts of each phase (json)",
+    required=False,
+)
+@click.option(
+    "--profile-cprofile",
+    help="Write cProfile statistics, readable with pstats or snakeviz",
+    required=False,
+)
+@click.option(
+    "--profile-sample",
+    help="With --profile-cprofile, only profile every Nth call of each phase",
+    required=False,
+    default=1,
+)
 def main(
     csv,
     ansi,
@@ -249,6 +270,9 @@ def main(
     dup_method,
     lapis,
     gisaid_access_key,
+    profile_out,
+    profile_cprofile,
+    profile_sample,
 ):
     """Detect recombinant seqences from sc2rf. Dependencies: pandas, click"""
 
@@ -259,9 +283,18 @@ def main(
     # create logger
     logger = create_logger(logfile=log)
 
+    profiler = PhaseProfiler(
+        "postprocess",
+        enabled=profile_out is not None,
+        cprofile_path=profile_cprofile,
+        sample=profile_sample,
+    )
+
     # -----------------------------------------------------------------------------
     # Import Optional Data Files
 
+    profiler.start("read_inputs")
+
     # (Optional) issues.tsv of pango-designation issues
     #            lineage assignment by parent+breakpoint matching
     if issues:
@@ -324,7 +357,9 @@ def main(
     # (Optional) phylogenetic tree of pangolineage lineages
     if lineage_tree:
         logger.info("Parsing lineage tree: {}".format(lineage_tree))
-        tree = Phylo.read(lineage_tree, "newick")
+        tree = read_lineage_tree(lineage_tree)
+
+    profiler.stop("read_inputs")
 
     # -----------------------------------------------------------------------------
     # Import Dataframes of Potential Positive Recombinants
@@ -335,6 +370,7 @@ def main(
     # sc2rf csv output (required)
     df = pd.DataFrame()
     csv_split = csv.split(",")
+    profiler.start("merge_csv")
     # Store a dict of duplicate strains
     duplicate_strains = {}
 
@@ -388,6 +424,7 @@ def main(
             df = pd.concat([df, temp_df])
 
     df.fillna("", inplace=True)
+    profiler.stop("merge_csv", items=len(df))
 
     # -------------------------------------------------------------------------
     # Initialize new stat columns to NA
@@ -409,6 +446,7 @@ def main(
 
     if metadata:
 
+        profiler.start("add_negatives")
         logger.info("Reporting non-recombinants in metadata as negatives")
         for strain in list(metadata_df["strain"]):
             # Ignore this strain if it's already in dataframe (it's a recombinant)
@@ -419,12 +457,14 @@ def main(
             df.at[strain, "strain"] = strain
             df.at[strain, "sc2rf_status"] = "negative"
             sc2rf_details_dict[strain] = []
+        profiler.stop("add_negatives", items=len(metadata_df))
 
     # ---------------------------------------------------------------------
     # Auto-pass lineages from nextclade assignment, that were also detected by sc2rf
 
     if nextclade and nextclade_auto_pass:
 
+        profiler.start("auto_pass", items=len(auto_pass_df))
         logger.info(
             "Auto-passing lineages: {}".format(",".join(nextclade_auto_pass_lineages))
         )
@@ -466,10 +506,12 @@ def main(
 
                 row_df = pd.DataFrame(row_dict).set_index("strain")
                 df = pd.concat([df, row_df], ignore_index=False)
+        profiler.stop("auto_pass")
 
     # -------------------------------------------------------------------------
     # Begin Post-Processing
     logger.info("Post-processing table")
+    profiler.start("filter_pass", items=len(df))
 
     # Iterate through all positive and negative recombinantions
     for rec in df.iterrows():
@@ -917,10 +959,13 @@ def main(
 
         df.at[strain, "sc2rf_details"] = ";".join(sc2rf_details_dict[strain])
 
+    profiler.stop("filter_pass")
+
     # ---------------------------------------------------------------------
     # Resolve strains with duplicate results
 
     logger.info("Reconciling duplicate results with method: {}".format(dup_method))
+    profiler.start("resolve_duplicates", items=len(duplicate_strains))
     for strain in duplicate_strains:
 
         # Check if this strain was auto-passed
@@ -1063,6 +1108,7 @@ def main(
             sc2rf_details_dict[strain_orig] = sc2rf_details_dict[strain]
 
     false_positives_dict = false_positives_filter
+    profiler.stop("resolve_duplicates")
 
     # ---------------------------------------------------------------------
     # Identify parent lineages by querying cov-spectrum mutations
@@ -1074,6 +1120,9 @@ def main(
 
     if nextclade_no_recomb and lapis:
 
+        # Only needed to query LAPIS, which is disabled by default
+        import requests
+
         logger.info(
             "Identifying parent lineages based on nextclade no-recomb substitutions"
         )
@@ -1089,6 +1138,7 @@ def main(
         positive_df = df[df["sc2rf_status"] == "positive"]
         total_positives = len(positive_df)
         progress_i = 0
+        profiler.start("lapis", items=total_positives)
 
         # keys = query, value = json
         query_subs_dict = {}
@@ -1240,13 +1290,9 @@ def main(
                     # Combine counts of sublineages into the max lineage total
                     # This requires the pangolin lineage tree!
                     if lineage_tree:
-                        max_lineage_tree = [c for c in tree.find_clades(max_lineage)]
+                        max_lineage_children = tree.descendants(max_lineage)
                         # Make sure we found this lineage in the tree
-                        if len(max_lineage_tree) == 1:
-                            max_lineage_tree = max_lineage_tree[0]
-                            max_lineage_children = [
-                                c.name for c in max_lineage_tree.find_clades()
-                            ]
+                        if len(max_lineage_children) > 0:
 
                             # Search for counts in the lapis data that
                             # descend from the max lineage
@@ -1275,6 +1321,7 @@ def main(
                 for c in parent_lineages_confidence
             )
             df.at[strain, "cov-spectrum_parents_subs"] = ";".join(parent_lineages_subs)
+        profiler.stop("lapis")
 
     # ---------------------------------------------------------------------
     # Identify parent conflict
@@ -1284,6 +1331,7 @@ def main(
         logger.info("Identifying parental conflict between lineage and clade.")
 
         positive_df = df[df["sc2rf_status"] == "positive"]
+        profiler.start("parent_conflict", items=len(positive_df))
 
         for rec in positive_df.iterrows():
 
@@ -1325,25 +1373,23 @@ def main(
                     continue
 
                 # Check if parents_lineage is descendant of parents_clade
-                c_node = [c for c in tree.find_clades(c)][0]
-                l_node = [c for c in c_node.find_clades(l)]
-                if len(l_node) != 1:
+                if l not in tree.descendants(c):
                     lineage_is_descendant = True
 
                 # Check if parents_lineage is ancestor of parents_clade
-                l_node = [c for c in tree.find_clades(l)][0]
-                c_node = [c for c in l_node.find_clades(c)]
-                if len(c_node) != 1:
+                if c not in tree.descendants(l):
                     lineage_is_ancestor = True
 
                 if not lineage_is_descendant and not lineage_is_ancestor:
                     conflict = True
 
             df.at[strain, "sc2rf_parents_conflict"] = conflict
+        profiler.stop("parent_conflict")
 
     # ---------------------------------------------------------------------
     # Write exclude strains (false positives)
 
+    profiler.start("write_exclude", items=len(false_positives_dict))
     outpath_exclude = os.path.join(outdir, prefix + ".exclude.tsv")
     logger.info("Writing strains to exclude: {}".format(outpath_exclude))
     if len(false_positives_dict) > 0:
@@ -1354,12 +1400,14 @@ def main(
     else:
         cmd = "touch {outpath}".format(outpath=outpath_exclude)
         os.system(cmd)
+    profiler.stop("write_exclude")
 
     # -------------------------------------------------------------------------
     # write output table
 
     # Drop old columns, if there were only negative samples, these columns don't exist
     logger.info("Formatting output columns.")
+    profiler.start("write_table", items=len(df))
     if set(df["sc2rf_status"]) != set(["negative"]):
         df.drop(
             [
@@ -1406,6 +1454,7 @@ def main(
     strains_txt = "\n".join(strains)
     with open(outpath_strains, "w") as outfile:
         outfile.write(strains_txt)
+    profiler.stop("write_table")
 
     # -------------------------------------------------------------------------
     # filter the ansi output
@@ -1413,6 +1462,7 @@ def main(
 
         ansi_split = ansi.split(",")
         outpath_ansi = os.path.join(outdir, prefix + ".ansi.txt")
+        profiler.start("write_ansi", items=len(ansi_split))
 
         for i, ansi_file in enumerate(ansi_split):
             logger.info("Parsing ansi: {}".format(ansi_file))
@@ -1435,6 +1485,7 @@ def main(
             logger.info("Writing filtered ansi: {}".format(outpath_ansi))
             # logger.info(cmd)
             os.system(cmd)
+        profiler.stop("write_ansi")
 
     # -------------------------------------------------------------------------
     # write alignment
@@ -1447,7 +1498,11 @@ def main(
             aligned=aligned,
             outpath_fasta=outpath_fasta,
         )
+        profiler.start("write_alignment", items=len(strains))
         os.system(cmd)
+        profiler.stop("write_alignment")
+
+    profiler.write(profile_out)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+"""
+Opt-in instrumentation of the phases of sc2rf.py and postprocess.py.
+
+Phases record their wall time, CPU time, number of calls and number of items,
+and are written as JSON (--profile-out). A phase that runs many times (ex. once
+per match set) is summarized as a single entry. cProfile statistics can also be
+collected on demand (--profile-cprofile), for a sample of the calls of each
+phase (--profile-sample).
+"""
+
+import cProfile
+import json
+import os
+import time
+from contextlib import contextmanager
+
+
+class PhaseProfiler:
+    def __init__(self, name, enabled=False, cprofile_path=None, sample=1):
+        """
+        :param name:  str, name of the profiled program
+        :param enabled:  bool, record phases (otherwise a no-op)
+        :param cprofile_path:  str, path to write cProfile statistics (optional)
+        :param sample:  int, run cProfile for every Nth call of a phase
+        """
+        self.name = name
+        self.enabled = enabled or cprofile_path is not None
+        self.cprofile_path = cprofile_path
+        self.sample = max(1, sample)
+        self.phases = dict()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.cprofile = cProfile.Profile() if cprofile_path else None
+        self.cprofile_active = False
+        # Start times of the phases that are currently running
+        self.running = dict()
+
+    def start(self, name, items=None):
+        """
+        Start timing a phase of the program.
+
+        :param name:  str, name of the phase, repeated calls are summarized
+        :param items:  int, number of items processed by the phase (optional)
+        """
+        if not self.enabled:
+            return
+
+        record = self.phases.setdefault(
+            name,
+            {
+                "name": name,
+                "calls": 0,
+                "items": 0,
+                "wall_s": 0.0,
+                "cpu_s": 0.0,
+                "max_wall_s": 0.0,
+            },
+        )
+        record["calls"] += 1
+        if items:
+            record["items"] += items
+
+        # Nested phases are covered by the profile of their parent
+        profile = (
+            self.cprofile is not None
+            and not self.cprofile_active
+            and (record["calls"] - 1) % self.sample == 0
+        )
+        if profile:
+            self.cprofile_active = True
+            self.cprofile.enable()
+
+        self.running[name] = (time.perf_counter(), time.process_time(), profile)
+
+    def stop(self, name, items=None):
+        """
+        Stop timing a phase of the program.
+
+        :param name:  str, name of a phase that was started
+        :param items:  int, number of items processed by the phase (optional)
+        """
+        if not self.enabled or name not in self.running:
+            return
+
+        start_wall, start_cpu, profile = self.running.pop(name)
+        wall = time.perf_counter() - start_wall
+        record = self.phases[name]
+        record["wall_s"] += wall
+        record["cpu_s"] += time.process_time() - start_cpu
+        record["max_wall_s"] = max(record["max_wall_s"], wall)
+        if items:
+            record["items"] += items
+        if profile:
+            self.cprofile.disable()
+            self.cprofile_active = False
+
+    @contextmanager
+    def phase(self, name, items=None):
+        """Time a phase of the program, as a context manager."""
+        self.start(name, items)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def to_dict(self):
+        """
+        :return:  dict, the program summary and its phases in order of first call
+        """
+        phases = []
+        for record in self.phases.values():
+            record = dict(record)
+            for key in ["wall_s", "cpu_s", "max_wall_s"]:
+                record[key] = round(record[key], 6)
+            record["items_per_s"] = (
+                round(record["items"] / record["wall_s"], 3)
+                if record["items"] and record["wall_s"]
+                else None
+            )
+            phases.append(record)
+
+        return {
+            "program": self.name,
+            "wall_s": round(time.perf_counter() - self.start_wall, 6),
+            "cpu_s": round(time.process_time() - self.start_cpu, 6),
+            "cprofile_sample": self.sample if self.cprofile else None,
+            "phases": phases,
+        }
+
+    def write(self, path):
+        """Write the phases as JSON, and the cProfile statistics if requested."""
+        if not self.enabled:
+            return
+        if path:
+            outdir = os.path.dirname(path)
+            if outdir and not os.path.exists(outdir):
+                os.makedirs(outdir)
+            with open(path, "w") as outfile:
+                json.dump(self.to_dict(), outfile, indent=2)
+                outfile.write("\n")
+        if self.cprofile:
+            self.cprofile.dump_stats(self.cprofile_path)
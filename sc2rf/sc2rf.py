@@ -2,21 +2,35 @@
 
 import csv
 import enum
+from collections.abc import Mapping
 from typing import NamedTuple
+import numpy as np
 from termcolor import colored, cprint
 import json
 import argparse
 import os
-import requests
 from tqdm import tqdm
 import urllib.parse
 import itertools
+import contextlib
+import signal
+import socket
+import sys
+import tempfile
+import time
+from profiling import PhaseProfiler
 
 
 colors = ["red", "green", "blue", "yellow", "magenta", "cyan"]
 
 width_override = None
 
+# Replaced in main() when --profile-out or --profile-cprofile are provided
+profiler = PhaseProfiler("sc2rf")
+
+# Inputs that are the same for many scans, kept between the jobs of --serve
+warm = dict()
+
 # I removed "ORF" from the names, because often we only see the first one or two letters of a name, and "ORF" provides no information
 genes = {
     "1a": (266, 13468),
@@ -70,11 +84,6 @@ class Interval:
 
 def main():
     """Command line interface"""
-    global mappings
-    global width_override
-    global dot_character
-
-    dot_character = "•"
 
     # This strange line should enable handling of
     # ANSI / VT 100 codes in windows terminal
@@ -180,6 +189,11 @@ def main():
         type=Interval,
         help="Use only a specific range of input sequences. DOES NOT YET WORK WITH MULTIPLE INPUT FILES.",
     )
+    parser.add_argument(
+        "--select-names",
+        metavar="FILE",
+        help="Use only the input sequences named in FILE (one name per line).",
+    )
     parser.add_argument(
         "--enable-deletions",
         "-d",
@@ -255,14 +269,83 @@ def main():
         "--gisaid-access-key",
         help="covSPECTRUM accessKey for GISAID data.",
     )
-
-    sc2rf_dir = os.path.dirname(os.path.realpath(__file__))
+    parser.add_argument(
+        "--profile-out",
+        metavar="FILE",
+        help="Path to write the wall time, CPU time and item counts of each phase in JSON format.",
+    )
+    parser.add_argument(
+        "--profile-cprofile",
+        metavar="FILE",
+        help="Path to write cProfile statistics, readable with pstats or snakeviz.",
+    )
+    parser.add_argument(
+        "--profile-sample",
+        metavar="NUM",
+        default=1,
+        type=int,
+        help="With --profile-cprofile, only profile every NUM-th call of each phase (e.g. match sets).",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run as a service that keeps the reference and examples in memory, and reads scan jobs as JSON lines from stdin (or --socket).",
+    )
+    parser.add_argument(
+        "--socket",
+        metavar="PATH",
+        help="With --serve, accept jobs on this unix socket instead of stdin. Each job runs in a forked process.",
+    )
+    parser.add_argument(
+        "--serve-jobs",
+        metavar="NUM",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="With --socket, the maximum number of jobs that run at the same time. Further jobs wait until one finishes.",
+    )
+    parser.add_argument(
+        "--connect",
+        metavar="PATH",
+        help="Send this scan to the service listening on the unix socket PATH, instead of running it here.",
+    )
 
     global args
     args = parser.parse_args()
 
+    if args.serve:
+        serve(parser, args.socket, args.serve_jobs)
+    elif args.connect:
+        exit_code = connect(args.connect)
+        if exit_code is None:
+            run(parser)
+        else:
+            sys.exit(exit_code)
+    else:
+        run(parser)
+
+
+def run(parser: argparse.ArgumentParser):
+    """Scan the input sequences with the options in args"""
+    global mappings
+    global width_override
+    global dot_character
+
+    dot_character = "•"
+
+    sc2rf_dir = os.path.dirname(os.path.realpath(__file__))
+
+    global profiler
+    profiler = PhaseProfiler(
+        "sc2rf",
+        enabled=args.profile_out is not None,
+        cprofile_path=args.profile_cprofile,
+        sample=args.profile_sample,
+    )
+
     mapping_path = os.path.join(sc2rf_dir, "mapping.csv")
-    mappings = read_mappings(mapping_path)
+    mappings = read_warm(
+        ("mappings",) + file_key(mapping_path), read_mappings, mapping_path
+    )
 
     if args.ansi:
         dot_character = "."
@@ -274,6 +357,7 @@ def main():
 
     if args.rebuild_examples:
         rebuild_examples()
+        warm.clear()
         if len(args.input) == 0:
             print(
                 "Examples were rebuilt, and no input sequences were provided. Program exits."
@@ -289,13 +373,8 @@ def main():
         print("mutation-threshold must be between 0.05 and 1.0")
         return
 
-    global reference
     vprint("Reading reference genome, lineage definitions...")
-    reference_path = os.path.join(sc2rf_dir, "reference.fasta")
-    reference = read_fasta(reference_path, None)["MN908947 (Wuhan-Hu-1/2019)"]
-
-    virus_properties_path = os.path.join(sc2rf_dir, "virus_properties.json")
-    all_examples = read_examples(virus_properties_path)
+    examples_key, all_examples = read_inputs(sc2rf_dir)
 
     used_examples = []
     if "all" in args.clades:
@@ -336,32 +415,59 @@ def main():
             primer_sets[path] = pools
         vprint("Done.")
 
-    calculate_relations(used_examples)
+    relations_key = examples_key + tuple(ex["name"] for ex in used_examples)
+    with profiler.phase("calculate_relations", items=len(used_examples)):
+        if relations_key in warm:
+            for ex, unique_subs_set in zip(used_examples, warm[relations_key]):
+                ex["unique_subs_set"] = unique_subs_set
+        else:
+            calculate_relations(used_examples)
+            warm[relations_key] = [ex["unique_subs_set"] for ex in used_examples]
 
     # lists of samples keyed by tuples of example indices
     match_sets = dict()
 
+    # The unique subs of the examples don't overlap, so every sub of a sample
+    # matches at most one example. Sorted codes are searched for all subs at once.
+    unique_codes = []
+    unique_examples = []
+    for i, ex in enumerate(used_examples):
+        unique_codes += [encode_sub(sub) for sub in ex["unique_subs_set"]]
+        unique_examples += [i] * len(ex["unique_subs_set"])
+    unique_order = np.argsort(unique_codes, kind="stable")
+    unique_codes = np.array(unique_codes, dtype=np.int64)[unique_order]
+    unique_examples = np.array(unique_examples, dtype=np.int64)[unique_order]
+
     vprint("Scanning input for matches against lineage definitons...")
-    for sa_name, sa in my_tqdm(all_samples.items(), desc="First pass scan"):
-        matching_example_indices = []
-        if args.force_all_parents:
-            matching_example_indices = range(0, len(used_examples))
-        else:
-            for i, ex in enumerate(used_examples):
-                matches_count = len(sa["subs_set"] & ex["unique_subs_set"])
+    with profiler.phase("first_pass", items=len(all_samples)):
+        for sa_name, sa in my_tqdm(all_samples.items(), desc="First pass scan"):
+            matching_example_indices = []
+            if args.force_all_parents:
+                matching_example_indices = range(0, len(used_examples))
+            else:
+                codes = sa.sub_codes()
+                found = np.searchsorted(unique_codes, codes)
+                hit = found < len(unique_codes)
+                hit[hit] = unique_codes[found[hit]] == codes[hit]
+                matches_counts = np.bincount(
+                    unique_examples[found[hit]], minlength=len(used_examples)
+                )
                 # theoretically > 0 already gives us recombinants, but they are much
                 # more likely to be errors or coincidences
-                if matches_count >= args.unique:
-                    matching_example_indices.append(i)
-
-        matching_examples_tup = tuple(matching_example_indices)
-
-        if args.parents.matches(len(matching_example_indices)):
-            # print(f"{sa_name} is a possible recombinant of {len(matching_example_names)} lineages: {matching_example_names}")
-            if match_sets.get(matching_examples_tup):
-                match_sets[matching_examples_tup].append(sa)
-            else:
-                match_sets[matching_examples_tup] = [sa]
+                matching_example_indices = [
+                    i
+                    for i, matches_count in enumerate(matches_counts)
+                    if matches_count >= args.unique
+                ]
+
+            matching_examples_tup = tuple(matching_example_indices)
+
+            if args.parents.matches(len(matching_example_indices)):
+                # print(f"{sa_name} is a possible recombinant of {len(matching_example_names)} lineages: {matching_example_names}")
+                if match_sets.get(matching_examples_tup):
+                    match_sets[matching_examples_tup].append(sa)
+                else:
+                    match_sets[matching_examples_tup] = [sa]
 
     vprint("Done.\nPrinting detailed analysis:\n\n")
 
@@ -386,14 +492,268 @@ def main():
     if len(match_sets):
 
         for matching_example_indices, samples in match_sets.items():
-            show_matches(
-                [used_examples[i] for i in matching_example_indices],
-                samples,
-                writer=writer,
-            )
+            with profiler.phase("second_pass", items=len(samples)):
+                show_matches(
+                    [used_examples[i] for i in matching_example_indices],
+                    samples,
+                    writer=writer,
+                )
     else:
         print("First pass found no potential recombinants, see ")
 
+    profiler.write(args.profile_out)
+
+
+def read_warm(key, read, *read_args):
+    """
+    Read an input once, and reuse it for later scans with the same key.
+    :param key:  hashable, identifies the input and the options it depends on
+    :param read:  function, called with read_args to read the input
+    :return:  the result of read, which must not be modified
+    """
+    if key not in warm:
+        warm[key] = read(*read_args)
+    return warm[key]
+
+
+def file_key(path):
+    """
+    :param path:  str, path of an input file
+    :return:  tuple, path, modification time and size, so that a warm input
+              is read again after the file is updated
+    """
+    stat = os.stat(path)
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+
+def without_option(argv, option):
+    """
+    :param argv:  list of command line arguments
+    :param option:  str, option that takes one value (ex. --csvfile)
+    :return:  list of the arguments, without the option and its value
+    """
+    stripped = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == option:
+            skip = True
+        elif not arg.startswith(option + "="):
+            stripped.append(arg)
+    return stripped
+
+
+@contextlib.contextmanager
+def job_directory(job):
+    """
+    Change to the working directory of a job, and back when it is done, so
+    that a job without "cwd" runs in the directory of the service.
+    :param job:  dict, with optionally "cwd" (working directory)
+    """
+    cwd = os.getcwd()
+    try:
+        if "cwd" in job:
+            os.chdir(job["cwd"])
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def read_inputs(sc2rf_dir):
+    """
+    Read the reference genome (into the global reference) and the examples.
+    :param sc2rf_dir:  str, directory of reference.fasta and virus_properties.json
+    :return:  tuple, key of the examples in warm, and list of examples (copies)
+    """
+    global reference
+    reference_path = os.path.join(sc2rf_dir, "reference.fasta")
+    with profiler.phase("read_reference", items=1):
+        reference = read_warm(
+            ("reference",) + file_key(reference_path),
+            read_fasta,
+            reference_path,
+            None,
+        )["MN908947 (Wuhan-Hu-1/2019)"]
+
+    virus_properties_path = os.path.join(sc2rf_dir, "virus_properties.json")
+    examples_key = ("examples",) + file_key(virus_properties_path)
+    examples_key += (args.mutation_threshold, args.enable_deletions)
+    profiler.start("read_examples")
+    # copies, because calculate_relations adds keys to the examples
+    examples = [
+        dict(example)
+        for example in read_warm(examples_key, read_examples, virus_properties_path)
+    ]
+    profiler.stop("read_examples", items=len(examples))
+
+    return examples_key, examples
+
+
+def run_job(parser: argparse.ArgumentParser, job):
+    """
+    Run one scan job of the service.
+    :param job:  dict, with "args" (list of command line arguments), and
+                 optionally "cwd" (working directory) and "output" (path for
+                 the text that a scan prints, discarded by default)
+    :return:  dict, response with "status" ("ok" or "error") and "seconds"
+    """
+    global args
+    start = time.perf_counter()
+    response = {"status": "ok"}
+    try:
+        with job_directory(job):
+            args = parser.parse_args(job["args"])
+            if args.serve or args.connect:
+                raise ValueError("--serve and --connect are not allowed in jobs.")
+            with open(job.get("output", os.devnull), "w") as output:
+                with contextlib.redirect_stdout(output):
+                    run(parser)
+    except SystemExit as e:
+        # argparse exits on invalid arguments
+        if e.code:
+            response = {"status": "error", "message": "Invalid arguments, see stderr"}
+    except Exception as e:
+        response = {"status": "error", "message": f"{type(e).__name__}: {e}"}
+    finally:
+        if args and args.csvfile:
+            args.csvfile.close()
+
+    response["seconds"] = round(time.perf_counter() - start, 3)
+    return response
+
+
+def parse_job(line):
+    """
+    :param line:  str, one line of JSON sent to the service
+    :return:  tuple, the job (or None), and an error response (or None)
+    """
+    try:
+        job = json.loads(line)
+    except ValueError as e:
+        return None, {"status": "error", "message": f"Invalid job: {e}"}
+    if not isinstance(job, dict) or not isinstance(job.get("args"), list):
+        return None, {"status": "error", "message": "Invalid job: no list of args"}
+    return job, None
+
+
+def serve(parser: argparse.ArgumentParser, socket_path=None, max_jobs=1):
+    """
+    Run scan jobs in a long-lived process, so the reference, mappings,
+    examples and unique substitutions are only read and computed once.
+
+    Jobs are JSON objects (see run_job), one per line, each answered with one
+    line of JSON. Invalid jobs are answered with an error, and the service
+    keeps running. Jobs are read from stdin, and run one at a time. With a unix
+    socket, each connection sends one job that runs in a forked process, so
+    up to max_jobs jobs run in parallel and share what the service has
+    already read.
+    """
+    global args
+    if not socket_path:
+        for line in sys.stdin:
+            if line.strip():
+                job, response = parse_job(line)
+                if job is not None:
+                    response = run_job(parser, job)
+                print(json.dumps(response), flush=True)
+        return
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+    # Remove the socket when the service is stopped
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Listening for jobs on {socket_path}", file=sys.stderr, flush=True)
+
+    # Process ids of the jobs that are running
+    jobs = set()
+
+    try:
+        while True:
+            connection, _ = server.accept()
+            try:
+                with connection.makefile("r") as stream:
+                    job, response = parse_job(stream.readline())
+                if job is None:
+                    connection.sendall((json.dumps(response) + "\n").encode())
+            except OSError as e:
+                print(f"Connection failed: {e}", file=sys.stderr, flush=True)
+                job = None
+            if job is None:
+                connection.close()
+                continue
+
+            # Read the inputs of this job in the service itself, so that later
+            # jobs inherit them. Errors are reported by the job. The csv file
+            # is only opened (and truncated) by the job.
+            try:
+                with job_directory(job):
+                    args = parser.parse_args(without_option(job["args"], "--csvfile"))
+                    read_inputs(os.path.dirname(os.path.realpath(__file__)))
+            except (SystemExit, Exception):
+                pass
+
+            # Reap finished jobs, and wait for one if too many are running
+            while jobs:
+                pid, _ = os.waitpid(-1, 0 if len(jobs) >= max_jobs else os.WNOHANG)
+                if pid == 0:
+                    break
+                jobs.discard(pid)
+
+            pid = os.fork()
+            if pid == 0:
+                # The job never returns to the loop of the service, even if
+                # the client is gone, so it can't remove the socket
+                exit_code = 1
+                try:
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    server.close()
+                    response = run_job(parser, job)
+                    connection.sendall((json.dumps(response) + "\n").encode())
+                    connection.close()
+                    exit_code = 0
+                finally:
+                    os._exit(exit_code)
+            jobs.add(pid)
+            connection.close()
+    finally:
+        server.close()
+        os.remove(socket_path)
+
+
+def connect(socket_path):
+    """
+    Send the current scan to the service on a unix socket, and print its output.
+    :return:  int, exit code, or None if the service is not running
+    """
+    argv = sys.argv[1:]
+    i = argv.index("--connect")
+    del argv[i : i + 2]
+
+    with tempfile.NamedTemporaryFile(mode="r", suffix=".txt") as output:
+        job = {"args": argv, "cwd": os.getcwd(), "output": output.name}
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            client.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            print(f"No sc2rf service on {socket_path}, scanning here.", file=sys.stderr)
+            client.close()
+            return None
+        with client, client.makefile("rw") as stream:
+            stream.write(json.dumps(job) + "\n")
+            stream.flush()
+            response = stream.readline()
+        sys.stdout.write(output.read())
+
+    response = json.loads(response) if response else {"message": "No response."}
+    if response.get("status") != "ok":
+        print(response["message"], file=sys.stderr)
+        return 1
+    return 0
+
 
 def my_tqdm(*margs, **kwargs):
     return tqdm(
@@ -438,6 +798,9 @@ def vprint(text: str):
 
 
 def rebuild_examples():
+    # Only needed to rebuild the examples, so it is not imported on every run
+    import requests
+
     print("Rebuilding examples from cov-spectrum.org...")
     with open("virus_properties.json", newline="", mode="w") as jsonfile:
 
@@ -688,15 +1051,17 @@ def read_bed(path):
     return pools
 
 
-def read_fasta(path, index_range):
+def read_fasta(path, index_range, names=None):
     """
     :param path:  str, absolute or relative path to FASTA file
     :param index_range:  Interval, select specific records from FASTA
+    :param names:  set, select specific records from FASTA by header (optional)
     :return:  dict, sequences keyed by header
     """
     sequences = dict()
     index = 0
     current_name = None
+    keep = False
 
     file_pos = 0
     with my_tqdm(
@@ -708,16 +1073,20 @@ def read_fasta(path, index_range):
                 file_pos += len(line)
                 pbar.update(file_pos - pbar.n)
                 if line[0] == ">":
-                    if current_name and (not index_range or index_range.matches(index)):
+                    if keep:
                         sequences[current_name] = current_sequence
                     index += 1
                     if index_range and index_range.max and index > index_range.max:
                         return sequences
                     current_sequence = ""
                     current_name = line[1:].strip()
-                else:
+                    keep = (not index_range or index_range.matches(index)) and (
+                        names is None or current_name in names
+                    )
+                elif keep:
                     current_sequence += line.strip().upper()
-            sequences[current_name] = current_sequence
+            if keep:
+                sequences[current_name] = current_sequence
 
     return sequences
 
@@ -728,61 +1097,53 @@ def read_subs_from_fasta(path):
     :param path:  str, path to input FASTA file
     :return:  dict, substitutions (as dict, list or set) keyed by genome name
     """
-    fastas = read_fasta(path, args.select_sequences)
+    names = None
+    if args.select_names:
+        with open(args.select_names) as names_file:
+            names = set(line.strip() for line in names_file if line.strip())
+    profiler.start("read_fasta")
+    fastas = read_fasta(path, args.select_sequences, names)
+    profiler.stop("read_fasta", items=len(fastas))
     sequences = dict()
-    start_n = -1  # used for tracking runs of Ns or gaps
     removed_due_to_ambig = 0
-    for name, fasta in my_tqdm(fastas.items(), desc="Finding mutations in " + path):
-        subs_dict = dict()  # substitutions keyed by position
-        missings = list()  # start/end tuples of N's or gaps
-        coverage = list()  # inverse of missings, start/end tuples without N's or gaps
 
-        # Coverage is always bases that are not "-" or "N", regardess of --enable-deletions
-        no_cov_matches = ["N", "-"]
+    # Coverage is always bases that are not "-" or "N", regardess of --enable-deletions
+    no_cov_matches = to_bytes("N-")
 
-        # Missing can vary, depending on --enable-deletions
-        missings_matches = ["N"]
-        if not args.enable_deletions:
-            missings_matches.append("-")
+    # Missing can vary, depending on --enable-deletions
+    missings_matches = to_bytes("N" if args.enable_deletions else "N-")
 
-        if len(fasta) != len(reference):
-            print(
-                f"Sequence {name} not properly aligned, length is {len(fasta)} instead of {len(reference)}."
-            )
-        else:
-            ambiguous_count = 0
-            start_cov = 1
-            for i in range(1, len(reference) + 1):
-                r = reference[i - 1]
-                s = fasta[i - 1]
-
-                if s not in no_cov_matches:
-                    coverage.append(i)
-
-                if s in missings_matches:
-                    missings.append(i)
-
-                if r != s and s not in missings_matches:
-                    subs_dict[i] = Sub(r, i, s)  # nucleotide substitution
-
-                if not s in "AGTCN-":
-                    ambiguous_count += 1  # count mixtures
-
-            # Collapse bases into interval
-            coverage = list(to_ranges(coverage))
-            missings = list(to_ranges(missings))
-
-            if ambiguous_count <= args.max_ambiguous:
-                sequences[name] = {
-                    "name": name,  # isn't this redundant?
-                    "subs_dict": subs_dict,
-                    "subs_list": list(subs_dict.values()),
-                    "subs_set": set(subs_dict.values()),
-                    "missings": missings,
-                    "coverage": coverage,
-                }
-            else:
+    # Anything else is a mixture
+    unambiguous = to_bytes("AGTCN-")
+    reference_bytes = to_bytes(reference)
+
+    with profiler.phase("find_mutations", items=len(fastas)):
+        for name, fasta in my_tqdm(fastas.items(), desc="Finding mutations in " + path):
+            if len(fasta) != len(reference):
+                print(
+                    f"Sequence {name} not properly aligned, length is {len(fasta)} instead of {len(reference)}."
+                )
+                continue
+
+            # Compare all bases to the reference at once
+            bases = to_bytes(fasta)
+            ambiguous_count = np.count_nonzero(~np.isin(bases, unambiguous))
+            if ambiguous_count > args.max_ambiguous:
                 removed_due_to_ambig += 1
+                continue
+
+            missing = np.isin(bases, missings_matches)
+            subs = (bases != reference_bytes) & ~missing  # nucleotide substitution
+
+            sequences[name] = Sample(
+                name,
+                np.flatnonzero(subs) + 1,
+                reference_bytes[subs],
+                bases[subs],
+                mask_to_ranges(missing),
+                # inverse of missings, start/end of bases without N's or gaps
+                mask_to_ranges(~np.isin(bases, no_cov_matches)),
+            )
 
     if removed_due_to_ambig:
         print(
@@ -806,6 +1167,113 @@ def parse_sub(s):
         return Sub(s[0], int(s[1:-1]), s[-1])
 
 
+def encode_sub(sub):
+    """
+    Pack a Sub into one integer, as coordinate << 16 | ref << 8 | mut.
+    :param sub:  Sub
+    :return:  int
+    """
+    return (sub.coordinate << 16) | (ord(sub.ref) << 8) | ord(sub.mut)
+
+
+def to_bytes(s):
+    """
+    :param s:  str, sequence of single-byte characters (ex. bases)
+    :return:  numpy array of uint8 character codes
+    """
+    return np.frombuffer(s.encode("latin-1", errors="replace"), dtype=np.uint8)
+
+
+def mask_to_ranges(mask):
+    """
+    Collapse a boolean mask of bases into intervals.
+    :param mask:  numpy array of bool, one per base
+    :return:  numpy array of int32 (start, end) pairs, 1-based and inclusive
+    """
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1) + 1
+    ends = np.flatnonzero(edges == -1)
+    return np.column_stack((starts, ends)).astype(np.int32)
+
+
+class Sample(Mapping):
+    """
+    A query genome, with its substitutions and missing intervals stored in
+    compact numpy arrays rather than as Sub tuples.
+
+    The dict interface of the examples (name, subs_dict, subs_list, subs_set,
+    missings, coverage) is provided as a read-only view, which is built the
+    first time a key is accessed. Most samples are only seen by the first pass
+    scan (sub_codes), and never build it.
+    """
+
+    __slots__ = ("name", "coordinates", "refs", "muts", "missings", "coverage", "_view")
+
+    def __init__(self, name, coordinates, refs, muts, missings, coverage=None):
+        """
+        :param name:  str, genome name
+        :param coordinates:  array of int, substitution coordinates
+        :param refs:  array of uint8, reference bases of the substitutions
+        :param muts:  array of uint8, mutated bases of the substitutions
+        :param missings:  array or list of (start, end) intervals of N's or gaps
+        :param coverage:  array or list of (start, end) intervals of bases (optional)
+        """
+        self.name = name
+        self.coordinates = np.asarray(coordinates, dtype=np.uint32)
+        self.refs = np.asarray(refs, dtype=np.uint8)
+        self.muts = np.asarray(muts, dtype=np.uint8)
+        self.missings = np.asarray(missings, dtype=np.int32).reshape(-1, 2)
+        self.coverage = (
+            None
+            if coverage is None
+            else np.asarray(coverage, dtype=np.int32).reshape(-1, 2)
+        )
+        self._view = None
+
+    def sub_codes(self):
+        """
+        :return:  numpy array of int64, the substitutions packed as in encode_sub
+        """
+        return (
+            (self.coordinates.astype(np.int64) << 16)
+            | (self.refs.astype(np.int64) << 8)
+            | self.muts
+        )
+
+    def view(self):
+        """
+        :return:  dict, the sample in the same structure as the examples
+        """
+        if self._view is None:
+            subs_dict = {
+                coordinate: Sub(chr(ref), coordinate, chr(mut))
+                for coordinate, ref, mut in zip(
+                    self.coordinates.tolist(), self.refs.tolist(), self.muts.tolist()
+                )
+            }
+            self._view = {
+                "name": self.name,
+                "subs_dict": subs_dict,
+                "subs_list": list(subs_dict.values()),
+                "subs_set": set(subs_dict.values()),
+                "missings": [tuple(m) for m in self.missings.tolist()],
+            }
+            if self.coverage is not None:
+                self._view["coverage"] = [tuple(c) for c in self.coverage.tolist()]
+        return self._view
+
+    def __getitem__(self, key):
+        if key == "name":
+            return self.name
+        return self.view()[key]
+
+    def __iter__(self):
+        return iter(self.view())
+
+    def __len__(self):
+        return len(self.view())
+
+
 def prunt(s, color=None):
     if color:
         cprint(s, color, end="")
@@ -1443,13 +1911,14 @@ def read_subs(path, delimiter=",", max_lines=-1):
                     else:
                         missings.append((int(parts[0]), int(parts[1])))
 
-            sequences[row["seqName"]] = {
-                "name": row["seqName"],
-                "subs_dict": subs_dict,
-                "subs_list": list(subs_dict.values()),
-                "subs_set": set(subs_dict.values()),
-                "missings": missings,
-            }
+            subs_list = list(subs_dict.values())
+            sequences[row["seqName"]] = Sample(
+                row["seqName"],
+                [sub.coordinate for sub in subs_list],
+                to_bytes("".join(sub.ref for sub in subs_list)),
+                to_bytes("".join(sub.mut for sub in subs_list)),
+                missings,
+            )
 
             line_count += 1
             if max_lines != -1 and line_count == max_lines:
@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+import click
+import csv
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import time
+import yaml
+from datetime import date, timedelta
+from functions import create_logger
+
+NO_DATA_CHAR = "NA"
+
+SC2RF_DIR = "sc2rf"
+REFERENCE = os.path.join(SC2RF_DIR, "reference.fasta")
+VIRUS_PROPERTIES = os.path.join(SC2RF_DIR, "virus_properties.json")
+PARAMETERS = os.path.join("defaults", "parameters.yaml")
+ISSUES = os.path.join("resources", "issues.tsv")
+LINEAGE_TREE = os.path.join("resources", "tree.npz")
+
+# Synthetic recombinants are labelled with these designated lineages
+RECOMBINANT_LINEAGES = ["XBB", "XBE", "XBF", "XAY", "XBJ"]
+COUNTRIES = ["Canada", "USA", "United Kingdom", "Germany", "Denmark", "Australia"]
+# Number of weeks before today that sample dates are drawn from
+DATE_WEEKS = 16
+# Random private mutations added to each genome
+MAX_PRIVATE_MUTS = 5
+
+NEXTCLADE_COLS = [
+    "seqName",
+    "clade",
+    "Nextclade_pango",
+    "substitutions",
+    "privateNucMutations.reversionSubstitutions",
+    "privateNucMutations.labeledSubstitutions",
+    "privateNucMutations.unlabeledSubstitutions",
+]
+RBD_COLS = ["strain", "rbd_level", "rbd_substitutions", "immune_escape", "ace2_binding"]
+RESULT_COLS = [
+    "sequences",
+    "stage",
+    "status",
+    "seconds",
+    "sequences_per_second",
+    "max_rss_mb",
+]
+PHASE_COLS = [
+    "sequences",
+    "stage",
+    "phase",
+    "calls",
+    "items",
+    "wall_s",
+    "cpu_s",
+    "max_wall_s",
+]
+
+
+def read_reference(path=REFERENCE):
+    """Read the reference genome as a bytearray."""
+    with open(path) as infile:
+        return bytearray(
+            "".join(line.strip() for line in infile if not line.startswith(">")),
+            "ascii",
+        )
+
+
+def read_parents(clades, mutation_threshold, path=VIRUS_PROPERTIES):
+    """
+    Read the substitutions of the potential parents, as (coordinate, alt).
+    """
+
+    with open(path) as infile:
+        variants = json.load(infile)["variants"]
+
+    parents = []
+    for variant in variants:
+        if (
+            variant["NextstrainClade"] not in clades
+            and variant["PangoLineage"] not in clades
+        ):
+            continue
+        subs = {}
+        for m in variant["mutations"]:
+            mutation = m["mutation"].strip()
+            if m["proportion"] < mutation_threshold or mutation[-1] not in "ACGT":
+                continue
+            coord = int(mutation[1:-1] if mutation[0].isalpha() else mutation[:-1])
+            subs[coord] = mutation[-1]
+        parents.append(
+            {
+                "clade": variant["NextstrainClade"] or NO_DATA_CHAR,
+                "lineage": variant["PangoLineage"] or variant["NextstrainClade"],
+                "subs": sorted(subs.items()),
+            }
+        )
+
+    return parents
+
+
+def read_rule_params(rule, path=PARAMETERS):
+    """Read the default parameters of a rule."""
+
+    with open(path) as infile:
+        rule_params = yaml.safe_load(infile)["rule_params"]
+    return [p for p in rule_params if p["name"] == rule][0]
+
+
+def read_mode_args(mode):
+    """Read the sc2rf arguments of a mode in the default parameters."""
+
+    for mode_args in read_rule_params("sc2rf")["mode"]:
+        if mode in mode_args:
+            return mode_args[mode]
+
+    raise click.ClickException("sc2rf mode not found: {}".format(mode))
+
+
+def generate_dataset(
+    outdir, num_sequences, parents, recombinant_fraction, seed, reference
+):
+    """
+    Write synthetic aligned genomes, and the matching nextclade tables.
+
+    Recombinants take the substitutions of one parent before a random
+    breakpoint, and of a second parent after it. The known parents and
+    breakpoints are written to truth.tsv.
+    """
+
+    rng = random.Random(seed)
+    today = date.today()
+    genome_len = len(reference)
+
+    paths = {
+        name: os.path.join(outdir, name)
+        for name in ["alignment.fasta", "nextclade.tsv", "metadata.tsv", "truth.tsv"]
+    }
+    paths["rbd_levels.tsv"] = os.path.join(outdir, "rbd_levels.tsv")
+
+    with open(paths["alignment.fasta"], "w") as fasta, open(
+        paths["nextclade.tsv"], "w"
+    ) as qc, open(paths["metadata.tsv"], "w") as metadata, open(
+        paths["truth.tsv"], "w"
+    ) as truth, open(
+        paths["rbd_levels.tsv"], "w"
+    ) as rbd:
+
+        qc.write("\t".join(NEXTCLADE_COLS) + "\n")
+        metadata.write("\t".join(["strain", "date", "country"] + NEXTCLADE_COLS[1:]))
+        metadata.write("\n")
+        truth.write("strain\trecombinant\tparents\tbreakpoint\n")
+        rbd.write("\t".join(RBD_COLS) + "\n")
+
+        for i in range(num_sequences):
+            strain = "synthetic/{}".format(i + 1)
+            genome = bytearray(reference)
+            is_recombinant = rng.random() < recombinant_fraction
+
+            if is_recombinant:
+                parent_1, parent_2 = rng.sample(parents, 2)
+                breakpoint = rng.randint(genome_len // 10, genome_len * 9 // 10)
+                subs = [(c, a) for c, a in parent_1["subs"] if c < breakpoint]
+                subs += [(c, a) for c, a in parent_2["subs"] if c >= breakpoint]
+                clade = "recombinant"
+                lineage = rng.choice(RECOMBINANT_LINEAGES)
+                truth_parents = "{},{}".format(parent_1["lineage"], parent_2["lineage"])
+            else:
+                parent_1 = rng.choice(parents)
+                breakpoint = NO_DATA_CHAR
+                subs = list(parent_1["subs"])
+                clade = parent_1["clade"]
+                lineage = parent_1["lineage"]
+                truth_parents = parent_1["lineage"]
+
+            # Private mutations
+            privates = []
+            for _ in range(rng.randint(0, MAX_PRIVATE_MUTS)):
+                coord = rng.randint(100, genome_len - 100)
+                alt = rng.choice("ACGT")
+                if alt != chr(reference[coord - 1]):
+                    privates.append((coord, alt))
+
+            genome_subs = dict(subs + privates)
+            for coord, alt in genome_subs.items():
+                genome[coord - 1] = ord(alt)
+
+            def sub_strings(coord_alts):
+                return ",".join(
+                    "{}{}{}".format(chr(reference[c - 1]), c, a)
+                    for c, a in sorted(coord_alts)
+                    if chr(reference[c - 1]) != a
+                )
+
+            substitutions = sub_strings(genome_subs.items())
+            unlabeled = sub_strings(privates)
+            sample_date = today - timedelta(days=rng.randint(0, DATE_WEEKS * 7))
+
+            nextclade_row = [clade, lineage, substitutions, "", "", unlabeled]
+            fasta.write(">{}\n{}\n".format(strain, genome.decode()))
+            qc.write("\t".join([strain] + nextclade_row) + "\n")
+            metadata_row = [strain, str(sample_date), rng.choice(COUNTRIES)]
+            metadata.write("\t".join(metadata_row + nextclade_row) + "\n")
+            truth.write(
+                "{}\t{}\t{}\t{}\n".format(
+                    strain, is_recombinant, truth_parents, breakpoint
+                )
+            )
+            rbd.write("\t".join([strain, "0", "", NO_DATA_CHAR, NO_DATA_CHAR]))
+            rbd.write("\n")
+
+    return paths
+
+
+def run_stage(cmd, log, stdout=None):
+    """
+    Run a command, and return its wall time (seconds) and peak RSS (MB).
+    """
+
+    with open(log, "a") as logfile:
+        logfile.write(" ".join(shlex.quote(c) for c in cmd) + "\n")
+        logfile.flush()
+        out = open(stdout, "w") if stdout else logfile
+        start = time.perf_counter()
+        process = subprocess.Popen(cmd, stdout=out, stderr=logfile)
+        # wait4 returns the resource usage of this child only (ru_maxrss in KB)
+        _pid, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+        if stdout:
+            out.close()
+
+    return os.waitstatus_to_exitcode(status), seconds, usage.ru_maxrss / 1024
+
+
+@click.command()
+@click.option(
+    "--sizes",
+    help="Number of synthetic sequences to benchmark, separated by commas",
+    default="1000,10000,100000,1000000",
+    show_default=True,
+)
+@click.option("--outdir", help="Working directory for synthetic data", required=True)
+@click.option("--output", help="Output table of benchmarks (tsv)", required=True)
+@click.option(
+    "--mode",
+    help="sc2rf mode in the default parameters to benchmark",
+    default="omicron_omicron",
+    show_default=True,
+)
+@click.option(
+    "--recombinant-fraction",
+    help="Fraction of synthetic sequences that are recombinants",
+    default=0.05,
+    show_default=True,
+)
+@click.option("--seed", help="Random seed", default=1, show_default=True)
+@click.option(
+    "--phases",
+    help="Output table of the phases within sc2rf and postprocess (tsv)",
+    required=False,
+)
+@click.option("--log", help="Logfile", required=False)
+def main(sizes, outdir, output, mode, recombinant_fraction, seed, phases, log):
+    """
+    Benchmark the pipeline scripts on synthetic recombinant alignments.
+
+    Each stage runs as a separate process, so that its wall time and peak
+    memory (RSS) can be measured independently.
+    """
+
+    logger = create_logger(logfile=log)
+    python = sys.executable
+
+    for path in [outdir, os.path.dirname(output)]:
+        if path and not os.path.exists(path):
+            os.makedirs(path)
+
+    sc2rf_args = shlex.split(read_mode_args(mode))
+    # Parse the clades and threshold of the mode to generate parents
+    clades = sc2rf_args[sc2rf_args.index("--clades") + 1 :]
+    clades = clades[
+        : next((i for i, a in enumerate(clades) if a.startswith("-")), len(clades))
+    ]
+    mutation_threshold = float(sc2rf_args[sc2rf_args.index("--mutation-threshold") + 1])
+
+    # Same filters as the pipeline, without querying LAPIS
+    postprocess_params = read_rule_params("sc2rf_recombinants")
+
+    reference = read_reference()
+    parents = read_parents(clades, mutation_threshold)
+    logger.info("Parents of mode {}: {}".format(mode, [p["lineage"] for p in parents]))
+
+    results = []
+    phase_results = []
+
+    for num_sequences in [int(s) for s in sizes.split(",")]:
+
+        size_dir = os.path.join(outdir, str(num_sequences))
+        for subdir in ["sc2rf", "linelists", "plots", "report"]:
+            os.makedirs(os.path.join(size_dir, subdir), exist_ok=True)
+        stage_log = os.path.join(size_dir, "benchmark.log")
+
+        logger.info("Generating {} synthetic sequences.".format(num_sequences))
+        data = generate_dataset(
+            size_dir, num_sequences, parents, recombinant_fraction, seed, reference
+        )
+
+        sc2rf_dir = os.path.join(size_dir, "sc2rf")
+        linelists_dir = os.path.join(size_dir, "linelists")
+        plots_dir = os.path.join(size_dir, "plots")
+        positives = os.path.join(linelists_dir, "positives.tsv")
+        lineages = os.path.join(linelists_dir, "lineages.tsv")
+
+        # Stages: name, command, stdout
+        stages = [
+            (
+                "sc2rf",
+                [python, os.path.join(SC2RF_DIR, "sc2rf.py"), data["alignment.fasta"]]
+                + sc2rf_args
+                + ["--hide-progress"]
+                + ["--csvfile", os.path.join(sc2rf_dir, "stats.csv")]
+                + ["--profile-out", os.path.join(sc2rf_dir, "profile.sc2rf.json")],
+                os.path.join(sc2rf_dir, "ansi.txt"),
+            ),
+            (
+                "postprocess",
+                [
+                    python,
+                    os.path.join(SC2RF_DIR, "postprocess.py"),
+                    "--csv",
+                    os.path.join(sc2rf_dir, "stats.csv"),
+                    "--ansi",
+                    os.path.join(sc2rf_dir, "ansi.txt"),
+                    "--prefix",
+                    "stats",
+                    "--outdir",
+                    sc2rf_dir,
+                    "--nextclade",
+                    data["nextclade.tsv"],
+                    "--metadata",
+                    data["metadata.tsv"],
+                    "--issues",
+                    ISSUES,
+                    "--lineage-tree",
+                    LINEAGE_TREE,
+                    "--min-len",
+                    str(postprocess_params["min_len"]),
+                    "--min-consec-allele",
+                    str(postprocess_params["min_consec_allele"]),
+                    "--dup-method",
+                    postprocess_params["dup_method"],
+                    "--profile-out",
+                    os.path.join(sc2rf_dir, "profile.postprocess.json"),
+                ],
+                None,
+            ),
+            (
+                "summary",
+                [
+                    python,
+                    os.path.join("scripts", "summary.py"),
+                    "--nextclade",
+                    data["metadata.tsv"],
+                    "--sc2rf",
+                    os.path.join(sc2rf_dir, "stats.tsv"),
+                    "--rbd-levels",
+                    data["rbd_levels.tsv"],
+                    "--output",
+                    os.path.join(linelists_dir, "summary.tsv"),
+                    "--ncov-recombinant-version",
+                    "benchmark",
+                    "--nextclade-version",
+                    "benchmark",
+                    "--nextclade-dataset",
+                    "benchmark",
+                ],
+                None,
+            ),
+            (
+                "linelist",
+                [
+                    python,
+                    os.path.join("scripts", "linelist.py"),
+                    "--input",
+                    os.path.join(linelists_dir, "summary.tsv"),
+                    "--issues",
+                    ISSUES,
+                    "--lineage-tree",
+                    LINEAGE_TREE,
+                    "--outdir",
+                    linelists_dir,
+                ],
+                None,
+            ),
+            (
+                "lineages",
+                [
+                    python,
+                    os.path.join("scripts", "lineages.py"),
+                    "--input",
+                    positives,
+                    "--output",
+                    lineages,
+                ],
+                None,
+            ),
+            (
+                "parents",
+                [
+                    python,
+                    os.path.join("scripts", "parents.py"),
+                    "--input",
+                    positives,
+                    "--output",
+                    os.path.join(linelists_dir, "parents.tsv"),
+                ],
+                None,
+            ),
+            (
+                "plot",
+                [
+                    python,
+                    os.path.join("scripts", "plot.py"),
+                    "--input",
+                    positives,
+                    "--outdir",
+                    plots_dir,
+                    "--weeks",
+                    str(DATE_WEEKS),
+                ],
+                None,
+            ),
+        ]
+
+        for parent_type in ["clade", "lineage"]:
+            stages.append(
+                (
+                    "plot_breakpoints_{}".format(parent_type),
+                    [
+                        python,
+                        os.path.join("scripts", "plot_breakpoints.py"),
+                        "--lineages",
+                        lineages,
+                        "--lineage-col",
+                        "recombinant_lineage_curated",
+                        "--positives",
+                        positives,
+                        "--outdir",
+                        plots_dir,
+                        "--parent-col",
+                        "parents_{}".format(parent_type),
+                        "--parent-type",
+                        parent_type,
+                        "--autoscale",
+                    ],
+                    None,
+                )
+            )
+
+        stages.append(
+            (
+                "report",
+                [
+                    python,
+                    os.path.join("scripts", "report.py"),
+                    "--linelist",
+                    os.path.join(linelists_dir, "linelist.tsv"),
+                    "--plot-dir",
+                    plots_dir,
+                    "--output",
+                    os.path.join(size_dir, "report", "report.pptx"),
+                ],
+                None,
+            )
+        )
+
+        failed = False
+        for stage, cmd, stdout in stages:
+
+            # Later stages depend on the outputs of earlier stages
+            if failed:
+                results.append([num_sequences, stage, "skipped"] + [NO_DATA_CHAR] * 3)
+                continue
+
+            logger.info("Running {} on {} sequences.".format(stage, num_sequences))
+            returncode, seconds, max_rss_mb = run_stage(cmd, stage_log, stdout)
+            status = "success" if returncode == 0 else "failed"
+            if returncode != 0:
+                logger.info("{} failed, see log: {}".format(stage, stage_log))
+                failed = True
+
+            results.append(
+                [
+                    num_sequences,
+                    stage,
+                    status,
+                    round(seconds, 3),
+                    round(num_sequences / seconds, 1),
+                    round(max_rss_mb, 1),
+                ]
+            )
+            logger.info("{}: {:.1f}s, {:.1f} MB".format(stage, seconds, max_rss_mb))
+
+            # Phases recorded by the stage itself (--profile-out)
+            profile_path = os.path.join(sc2rf_dir, "profile.{}.json".format(stage))
+            if returncode == 0 and os.path.exists(profile_path):
+                with open(profile_path) as infile:
+                    for phase in json.load(infile)["phases"]:
+                        phase_results.append(
+                            [num_sequences, stage, phase["name"]]
+                            + [phase[col] for col in PHASE_COLS[3:]]
+                        )
+
+    # -------------------------------------------------------------------------
+    # Export
+
+    logger.info("Writing benchmarks: {}".format(output))
+    with open(output, "w", newline="") as outfile:
+        writer = csv.writer(outfile, delimiter="\t", lineterminator="\n")
+        writer.writerow(RESULT_COLS)
+        writer.writerows(results)
+
+    if phases:
+        logger.info("Writing phases: {}".format(phases))
+        with open(phases, "w", newline="") as outfile:
+            writer = csv.writer(outfile, delimiter="\t", lineterminator="\n")
+            writer.writerow(PHASE_COLS)
+            writer.writerows(phase_results)
+
+
+if __name__ == "__main__":
+    main()
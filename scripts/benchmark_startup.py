@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+import click
+import csv
+import glob
+import os
+import statistics
+import subprocess
+import sys
+import time
+from functions import create_logger
+
+NO_DATA_CHAR = "NA"
+
+# Scripts that are started by the pipeline, skipping shared modules
+SCRIPTS = sorted(glob.glob(os.path.join("scripts", "*.py"))) + [
+    os.path.join("sc2rf", "sc2rf.py"),
+    os.path.join("sc2rf", "postprocess.py"),
+]
+# date_to_decimal.py has positional arguments only, and no --help
+SKIP_SCRIPTS = ["__init__.py", "functions.py", "dates.py", "date_to_decimal.py"]
+
+RESULT_COLS = [
+    "script",
+    "status",
+    "median_seconds",
+    "min_seconds",
+    "max_seconds",
+    "top_import",
+    "top_import_seconds",
+]
+
+
+def read_import_times(stderr):
+    """
+    Parse the output of python -X importtime, as the cumulative seconds of
+    each top-level import.
+    """
+
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        # Nested imports are indented under their parent
+        if name.startswith("  ") or not cumulative_us.strip().isdigit():
+            continue
+        imports[name.strip()] = int(cumulative_us) / 1e6
+    return imports
+
+
+def time_startup(script, repeats):
+    """
+    Time how long a script takes to import its modules and print --help.
+
+    :return: returncode, list of seconds, dict of top-level import seconds
+    """
+
+    cmd = [sys.executable, script, "--help"]
+    seconds = []
+    for _i in range(repeats):
+        start = time.perf_counter()
+        proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        seconds.append(time.perf_counter() - start)
+        if proc.returncode != 0:
+            return proc.returncode, seconds, {}
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime"] + cmd[1:],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    return proc.returncode, seconds, read_import_times(proc.stderr)
+
+
+@click.command()
+@click.option("--output", help="Output table of startup times (tsv)", required=True)
+@click.option(
+    "--repeats",
+    help="Number of times to start each script",
+    default=5,
+    show_default=True,
+)
+@click.option("--log", help="Logfile", required=False)
+def main(output, repeats, log):
+    """
+    Benchmark the startup time (interpreter and imports) of pipeline scripts.
+
+    Each script is run with --help, which imports its modules without doing
+    any work. The slowest top-level import is reported from python -X importtime.
+    """
+
+    logger = create_logger(logfile=log)
+
+    outdir = os.path.dirname(output)
+    if outdir and not os.path.exists(outdir):
+        os.makedirs(outdir)
+
+    results = []
+    for script in SCRIPTS:
+        if os.path.basename(script) in SKIP_SCRIPTS:
+            continue
+
+        returncode, seconds, imports = time_startup(script, repeats)
+        status = "success" if returncode == 0 else "failed"
+        top_import, top_import_seconds = NO_DATA_CHAR, NO_DATA_CHAR
+        if imports:
+            top_import = max(imports, key=imports.get)
+            top_import_seconds = round(imports[top_import], 3)
+
+        median = statistics.median(seconds)
+        logger.info(
+            "{}: {:.3f}s (slowest import: {})".format(script, median, top_import)
+        )
+        results.append(
+            [
+                script,
+                status,
+                round(median, 3),
+                round(min(seconds), 3),
+                round(max(seconds), 3),
+                top_import,
+                top_import_seconds,
+            ]
+        )
+
+    logger.info("Writing startup times: {}".format(output))
+    with open(output, "w", newline="") as outfile:
+        writer = csv.writer(outfile, delimiter="\t", lineterminator="\n")
+        writer.writerow(RESULT_COLS)
+        writer.writerows(results)
+
+
+if __name__ == "__main__":
+    main()
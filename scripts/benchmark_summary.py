@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+import click
+import glob
+import os
+import pandas as pd
+import re
+from datetime import date
+from functions import categorical_palette, create_logger
+import logging
+
+# matplotlib is imported after the logger is created, so its debugging
+# messages on import would otherwise be logged
+logging.getLogger("matplotlib").setLevel(logging.WARNING)
+
+NO_DATA_CHAR = "NA"
+# The number of sequences analyzed by each run is saved here, as
+# {build}_{date}.tsv inside the benchmarks directory
+NUM_SEQUENCES_DIR = "num_sequences"
+
+# Columns written by snakemake benchmark directives
+BENCHMARK_SUM_COLS = ["s", "cpu_time", "io_in", "io_out"]
+BENCHMARK_MAX_COLS = ["max_rss"]
+
+# Same dimensions as the pipeline plots
+DPI = 96 * 2
+FIGSIZE = [6.75, 5.33]
+# Only the rules with the most wall time are plotted over time
+MAX_PLOT_RULES = 10
+
+
+def benchmark_date(path, build, exclude_builds=()):
+    """
+    Parse the run date of a benchmark of a build, named as
+    {build}_{date}.tsv or {build}_{wildcards}_{date}.tsv (ex. sc2rf modes).
+
+    :param exclude_builds: other builds whose names start with {build}_
+    :return: date, or None if the benchmark belongs to another build
+    """
+
+    filename = os.path.basename(path)
+    pattern = r"^{}_(.*_)?(\d{{4}}-\d{{2}}-\d{{2}})\.tsv$"
+    match = re.match(pattern.format(re.escape(build)), filename)
+    if not match:
+        return None
+    for other_build in exclude_builds:
+        if re.match(pattern.format(re.escape(other_build)), filename):
+            return None
+    try:
+        return date.fromisoformat(match.group(2))
+    except ValueError:
+        return None
+
+
+def read_benchmarks(benchmarks_dir, build, exclude_builds=()):
+    """
+    Read the snakemake benchmarks of a build, one row per rule and date.
+
+    Rules that run once per wildcard (ex. sc2rf modes) are combined: wall time
+    and IO are summed over jobs, and memory is the maximum of any job.
+    """
+
+    records = []
+    for path in glob.glob(os.path.join(benchmarks_dir, "*", build + "_*.tsv")):
+        rule = os.path.basename(os.path.dirname(path))
+        if rule == NUM_SEQUENCES_DIR:
+            continue
+        run_date = benchmark_date(path, build, exclude_builds)
+        if run_date is None:
+            continue
+
+        df = pd.read_csv(path, sep="\t")
+        if "s" not in df.columns:
+            continue
+        for col in BENCHMARK_SUM_COLS + BENCHMARK_MAX_COLS:
+            df[col] = pd.to_numeric(df.get(col), errors="coerce")
+        df["rule"] = rule
+        df["date"] = run_date
+        df["jobs"] = 1
+        records.append(df)
+
+    if not records:
+        return pd.DataFrame()
+
+    df = pd.concat(records, ignore_index=True)
+    agg = {col: "sum" for col in BENCHMARK_SUM_COLS + ["jobs"]}
+    agg.update({col: "max" for col in BENCHMARK_MAX_COLS})
+    return df.groupby(["rule", "date"], as_index=False).agg(agg)
+
+
+def read_num_sequences(benchmarks_dir, build, exclude_builds=()):
+    """Read the number of sequences analyzed by each run of a build."""
+
+    num_sequences = {}
+    pattern = os.path.join(benchmarks_dir, NUM_SEQUENCES_DIR, build + "_*.tsv")
+    for path in glob.glob(pattern):
+        run_date = benchmark_date(path, build, exclude_builds)
+        if run_date is None:
+            continue
+        df = pd.read_csv(path, sep="\t")
+        num_sequences[run_date] = int(df["num_sequences"].values[0])
+    return num_sequences
+
+
+def flag_regressions(history_df, window, threshold):
+    """
+    Compare the latest run of each rule to the median of its previous runs.
+
+    A metric is a regression if it grew by more than the threshold (fraction).
+    Per-sequence metrics are used when the number of sequences is known.
+    """
+
+    summary_data = []
+
+    for _rule, rule_df in history_df.groupby("rule"):
+        rule_df = rule_df.sort_values("date")
+        latest = rule_df.iloc[-1]
+        previous = rule_df.iloc[:-1].tail(window)
+
+        record = latest.to_dict()
+        regressions = []
+        for metric in ["s_per_sequence", "s", "max_rss", "io_per_sequence"]:
+            baseline = previous[metric].median()
+            change = NO_DATA_CHAR
+            if pd.notnull(baseline) and baseline > 0 and pd.notnull(latest[metric]):
+                change = round((latest[metric] - baseline) / baseline, 3)
+                if change > threshold:
+                    regressions.append(metric)
+            record["baseline_" + metric] = baseline
+            record["change_" + metric] = change
+
+        # Wall time per sequence supersedes total wall time, when available
+        if "s_per_sequence" in regressions and "s" in regressions:
+            regressions.remove("s")
+
+        record["previous_runs"] = len(previous)
+        record["regression"] = ",".join(regressions) if regressions else NO_DATA_CHAR
+        summary_data.append(record)
+
+    summary_df = pd.DataFrame(summary_data)
+    return summary_df.sort_values("s", ascending=False)
+
+
+def plot_history(history_df, rules, metric, ylabel, out_path):
+    """Plot a metric of each rule over time."""
+
+    # Imported here, so that --help and the tables don't wait on matplotlib
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(1, figsize=FIGSIZE, dpi=DPI)
+    palette = categorical_palette(num_cat=len(rules))
+
+    for rule, color in zip(rules, palette):
+        rule_df = history_df[history_df["rule"] == rule].sort_values("date")
+        ax.plot(rule_df["date"], rule_df[metric], marker="o", label=rule, color=color)
+
+    ax.set_ylabel(ylabel, fontweight="bold")
+    ax.set_xlabel("Date", fontweight="bold")
+    ax.tick_params(axis="x", labelrotation=90, labelsize=6)
+    legend = ax.legend(edgecolor="black", fontsize=6, title="Rule")
+    legend.get_title().set_fontweight("bold")
+
+    plt.tight_layout()
+    plt.savefig(out_path + ".png")
+    plt.savefig(out_path + ".svg")
+    plt.close()
+
+
+def plot_latest(summary_df, out_path):
+    """Plot the wall time of each rule in the latest run."""
+
+    # Imported here, as in plot_history
+    import matplotlib.pyplot as plt
+
+    plot_df = summary_df.sort_values("s")
+    fig, ax = plt.subplots(1, figsize=FIGSIZE, dpi=DPI)
+    palette = [
+        "firebrick" if regression != NO_DATA_CHAR else "dimgrey"
+        for regression in plot_df["regression"]
+    ]
+    ax.barh(plot_df["rule"], plot_df["s"] / 60, color=palette)
+    ax.set_xlabel("Wall Time (minutes)", fontweight="bold")
+    ax.set_ylabel("Rule", fontweight="bold")
+    ax.set_title("Latest Run (red: regression)", fontsize=8)
+    ax.tick_params(axis="y", labelsize=6)
+
+    plt.tight_layout()
+    plt.savefig(out_path + ".png")
+    plt.savefig(out_path + ".svg")
+    plt.close()
+
+
+@click.command()
+@click.option("--benchmarks", help="Snakemake benchmarks directory", required=True)
+@click.option("--build", help="Build name", required=True)
+@click.option(
+    "--exclude-build",
+    "exclude_builds",
+    help="Other build whose name starts with the build name (multiple)",
+    multiple=True,
+)
+@click.option("--outdir", help="Output directory", required=True)
+@click.option(
+    "--nextclade",
+    help="Nextclade qc table of the current run, to count sequences (tsv)",
+    required=False,
+)
+@click.option(
+    "--date",
+    "run_date",
+    help="Date of the current run (YYYY-MM-DD)",
+    default=str(date.today()),
+)
+@click.option(
+    "--window",
+    help="Number of previous runs to compare the latest run to",
+    default=7,
+)
+@click.option(
+    "--threshold",
+    help="Fractional increase of a metric that is flagged as a regression",
+    default=0.25,
+)
+@click.option("--log", help="Logfile", required=False)
+def main(
+    benchmarks,
+    build,
+    exclude_builds,
+    outdir,
+    nextclade,
+    run_date,
+    window,
+    threshold,
+    log,
+):
+    """Summarize the performance of pipeline rules across runs."""
+
+    logger = create_logger(logfile=log)
+
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+
+    # -------------------------------------------------------------------------
+    # Number of sequences in the current run
+
+    if nextclade:
+        num_sequences_dir = os.path.join(benchmarks, NUM_SEQUENCES_DIR)
+        if not os.path.exists(num_sequences_dir):
+            os.makedirs(num_sequences_dir)
+        with open(nextclade) as infile:
+            num_sequences = sum(1 for _line in infile) - 1
+        logger.info("Current run analyzed {} sequences.".format(num_sequences))
+        num_sequences_path = os.path.join(
+            num_sequences_dir, "{}_{}.tsv".format(build, run_date)
+        )
+        with open(num_sequences_path, "w") as outfile:
+            outfile.write("num_sequences\n{}\n".format(num_sequences))
+
+    # -------------------------------------------------------------------------
+    # History
+
+    logger.info("Parsing benchmarks: {}".format(benchmarks))
+    history_df = read_benchmarks(benchmarks, build, exclude_builds)
+    if len(history_df) == 0:
+        raise click.ClickException("No benchmarks found for build: " + build)
+
+    num_sequences = read_num_sequences(benchmarks, build, exclude_builds)
+    history_df["num_sequences"] = [num_sequences.get(d) for d in history_df["date"]]
+    history_df["num_sequences"] = pd.to_numeric(history_df["num_sequences"])
+    history_df["s_per_sequence"] = history_df["s"] / history_df["num_sequences"]
+    history_df["io_per_sequence"] = (
+        history_df["io_in"] + history_df["io_out"]
+    ) / history_df["num_sequences"]
+
+    logger.info(
+        "Found {} rules across {} runs.".format(
+            history_df["rule"].nunique(), history_df["date"].nunique()
+        )
+    )
+
+    # -------------------------------------------------------------------------
+    # Regressions
+
+    summary_df = flag_regressions(history_df, window, threshold)
+    for rec in summary_df.itertuples():
+        if rec.regression != NO_DATA_CHAR:
+            logger.info("Regression in rule {}: {}".format(rec.rule, rec.regression))
+
+    # -------------------------------------------------------------------------
+    # Export
+
+    history_path = os.path.join(outdir, "history.tsv")
+    logger.info("Writing history: {}".format(history_path))
+    history_df.sort_values(["date", "rule"]).to_csv(
+        history_path, sep="\t", index=False, na_rep=NO_DATA_CHAR
+    )
+
+    summary_path = os.path.join(outdir, "summary.tsv")
+    logger.info("Writing summary: {}".format(summary_path))
+    summary_df.to_csv(summary_path, sep="\t", index=False, na_rep=NO_DATA_CHAR)
+
+    # -------------------------------------------------------------------------
+    # Plots
+
+    plot_rules = list(summary_df["rule"][:MAX_PLOT_RULES])
+    plot_latest(summary_df, os.path.join(outdir, "latest"))
+    plot_history(
+        history_df,
+        plot_rules,
+        "s",
+        "Wall Time (seconds)",
+        os.path.join(outdir, "wall_time"),
+    )
+    plot_history(
+        history_df,
+        plot_rules,
+        "max_rss",
+        "Max RSS (MB)",
+        os.path.join(outdir, "max_rss"),
+    )
+    if history_df["s_per_sequence"].notnull().any():
+        plot_history(
+            history_df,
+            plot_rules,
+            "s_per_sequence",
+            "Wall Time per Sequence (seconds)",
+            os.path.join(outdir, "wall_time_per_sequence"),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+import click
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from functions import create_logger
+
+ISSUES_ENDPOINT = "/repos/cov-lineages/pango-designation/issues"
+RATE_LIMIT_ENDPOINT = "/rate_limit"
+# Matches the page size requested by download_issues.py
+PER_PAGE = 100
+# Enough issues for several pages, so the pages are fetched concurrently
+NUM_ISSUES = 450
+# Delay of each page, so concurrent requests overlap
+PAGE_DELAY = 0.1
+UPDATED_ISSUE = 7
+FIRST_UPDATE = datetime(2022, 1, 1)
+
+
+def updated_at(number):
+    """Update time of an issue, later for higher issue numbers."""
+    return (FIRST_UPDATE + timedelta(minutes=number)).isoformat() + "Z"
+
+
+def create_issue(number, updated_at, title=None):
+    """Create a recombinant issue, as returned by the GitHub API."""
+    return {
+        "number": number,
+        "title": title or "Recombinant lineage {}".format(number),
+        "milestone": None,
+        "labels": [{"name": "proposed", "description": "Proposed lineage"}],
+        "body": "Breakpoint: {}\nCountries circulating: Canada".format(number * 10),
+        "created_at": "2022-01-01T00:00:00Z",
+        "updated_at": updated_at,
+        "closed_at": None,
+    }
+
+
+class MockGitHub:
+    """
+    Serve pango-designation issues like the GitHub API: paginated with a Link
+    header, filtered by since, and answering conditional requests with 304.
+    """
+
+    def __init__(self):
+        self.issues = {
+            number: create_issue(number, updated_at(number))
+            for number in range(1, NUM_ISSUES + 1)
+        }
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def page(self, query):
+        """Return the issues of a page, and the number of the last page."""
+        issues = sorted(self.issues.values(), key=lambda i: i["number"], reverse=True)
+        since = query.get("since", [None])[0]
+        if since:
+            issues = [issue for issue in issues if issue["updated_at"] >= since]
+        page_num = int(query.get("page", ["1"])[0])
+        last_page = max(1, -(-len(issues) // PER_PAGE))
+        start = (page_num - 1) * PER_PAGE
+        return issues[start : start + PER_PAGE], last_page
+
+    def handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, data, headers=None):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if url.path == RATE_LIMIT_ENDPOINT:
+                    core = {"limit": 5000, "remaining": 5000, "reset": 0}
+                    self.send_json(200, {"resources": {"core": core}})
+                    return
+                if url.path != ISSUES_ENDPOINT:
+                    self.send_json(404, {"message": "Not Found"})
+                    return
+
+                with mock.lock:
+                    mock.in_flight += 1
+                    mock.max_in_flight = max(mock.max_in_flight, mock.in_flight)
+                time.sleep(PAGE_DELAY)
+
+                issues, last_page = mock.page(query)
+                etag = '"{}"'.format(
+                    hashlib.sha256(json.dumps(issues).encode()).hexdigest()
+                )
+                not_modified = self.headers.get("If-None-Match") == etag
+                with mock.lock:
+                    mock.in_flight -= 1
+                    mock.requests.append((query, 304 if not_modified else 200))
+
+                last_query = dict((k, v[0]) for k, v in query.items())
+                last_query["page"] = last_page
+                last_url = "http://{}{}?{}".format(
+                    self.headers["Host"],
+                    url.path,
+                    "&".join("{}={}".format(k, v) for k, v in last_query.items()),
+                )
+                headers = {"ETag": etag, "Link": '<{}>; rel="last"'.format(last_url)}
+                if not_modified:
+                    self.send_response(304)
+                    for key, value in headers.items():
+                        self.send_header(key, value)
+                    self.end_headers()
+                else:
+                    self.send_json(200, issues, headers)
+
+        return Handler
+
+
+def run_download(api_url, cache_dir, threads):
+    """Run download_issues.py, and return its issues table."""
+    script = os.path.join(
+        os.path.dirname(os.path.realpath(__file__)), "download_issues.py"
+    )
+    cmd = [sys.executable, script, "--api-url", api_url, "--cache-dir", cache_dir]
+    cmd += ["--threads", str(threads)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise click.ClickException("download_issues.py failed:\n" + proc.stderr)
+    return proc.stdout
+
+
+def check(condition, message, logger):
+    """Log a passed check, or stop at a failed one."""
+    if not condition:
+        raise click.ClickException("FAIL: " + message)
+    logger.info("PASS: " + message)
+
+
+@click.command()
+@click.option("--threads", help="Number of pages to download concurrently", default=4)
+@click.option("--log", help="Logfile", required=False)
+def main(threads, log):
+    """
+    Check download_issues.py against a local mock of the GitHub API.
+
+    Covers the concurrent fetch of all pages, the reuse of unchanged pages
+    (ETag and 304), and fetching only updated issues (since) from the cache.
+    """
+
+    logger = create_logger(logfile=log)
+
+    mock = MockGitHub()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), mock.handler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = "http://127.0.0.1:{}".format(server.server_address[1])
+    num_pages = -(-NUM_ISSUES // PER_PAGE)
+
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+
+            # 1. Empty cache: all pages, fetched concurrently
+            first = run_download(api_url, cache_dir, threads)
+            check(
+                len(mock.requests) == num_pages
+                and all(status == 200 for _q, status in mock.requests),
+                "first run fetched all {} pages".format(num_pages),
+                logger,
+            )
+            check(
+                all("since" not in query for query, _s in mock.requests),
+                "first run did not filter by since",
+                logger,
+            )
+            check(
+                mock.max_in_flight > 1,
+                "pages were fetched concurrently ({} at once)".format(
+                    mock.max_in_flight
+                ),
+                logger,
+            )
+            check(
+                len(first.splitlines()) == NUM_ISSUES + 1,
+                "issues table has all {} issues".format(NUM_ISSUES),
+                logger,
+            )
+
+            # 2. Cached: only issues updated since the latest update
+            mock.requests = []
+            second = run_download(api_url, cache_dir, threads)
+            check(
+                [query.get("since") for query, _s in mock.requests]
+                == [[updated_at(NUM_ISSUES)]],
+                "cached run requested one page of issues updated since {}".format(
+                    updated_at(NUM_ISSUES)
+                ),
+                logger,
+            )
+            check(second == first, "issues table is unchanged", logger)
+
+            # 3. Nothing changed: the page is reused from a 304 response
+            mock.requests = []
+            third = run_download(api_url, cache_dir, threads)
+            check(
+                [status for _q, status in mock.requests] == [304],
+                "unchanged page was reused from a 304 response (ETag)",
+                logger,
+            )
+            check(third == first, "issues table is unchanged", logger)
+
+            # 4. One issue updated: only it is fetched, and merged into the cache
+            mock.issues[UPDATED_ISSUE] = create_issue(
+                UPDATED_ISSUE,
+                updated_at(NUM_ISSUES + 1),
+                title="Recombinant updated",
+            )
+            mock.requests = []
+            fourth = run_download(api_url, cache_dir, threads)
+            check(
+                [status for _q, status in mock.requests] == [200],
+                "updated issue was fetched in a single page",
+                logger,
+            )
+            check(
+                "Recombinant updated" in fourth
+                and len(fourth.splitlines()) == NUM_ISSUES + 1,
+                "updated issue was merged with the cached issues",
+                logger,
+            )
+
+            # 5. More updated issues than fit on a page: since is paginated
+            for number in range(1, PER_PAGE + 2):
+                mock.issues[number] = create_issue(
+                    number, updated_at(NUM_ISSUES + 2), title="Recombinant again"
+                )
+            mock.requests = []
+            fifth = run_download(api_url, cache_dir, threads)
+            check(
+                sorted(query["page"][0] for query, _s in mock.requests) == ["1", "2"]
+                and all("since" in query for query, _s in mock.requests),
+                "{} updated issues were fetched in 2 pages".format(PER_PAGE + 1),
+                logger,
+            )
+            check(
+                fifth.count("Recombinant again") == PER_PAGE + 1
+                and len(fifth.splitlines()) == NUM_ISSUES + 1,
+                "updated issues were merged with the cached issues",
+                logger,
+            )
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
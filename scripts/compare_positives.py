@@ -1,88 +1,48 @@
 #!/usr/bin/env python3
 
 import click
+import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.io as pio
-from matplotlib import colors
 import os
 from functions import create_logger
 import copy
+from concurrent.futures import ThreadPoolExecutor
 
 NO_DATA_CHAR = "NA"
 SOURCE_CHAR = "*"
 TARGET_CHAR = "†"
 UNKNOWN_COLOR = "dimgrey"
-UNKNOWN_RGB = colors.to_rgb(UNKNOWN_COLOR)
 
 LINEAGE_COLS = ["recombinant_lineage_curated", "lineage", "pango_lineage"]
 
+# Columns of the churn statistics, for each pair of consecutive runs
+SERIES_STATISTICS = ["all", "no-change", "change", "new", "drop", "net", "churn"]
+
 
 def create_sankey_data(df, node_order="default", min_y=0.001, min_link_size=1):
 
     # -------------------------------------------------------------------------
     # Links
 
-    link_data = {
-        "source": [],
-        "target": [],
-        "value": [],
-        "color": None,
-    }
-
-    for rec in df.iterrows():
-        source = rec[1]["source"]
-        target = rec[1]["target"]
-
-        # Iterate through source/target to find a match
-        match_found = False
-
-        for i in range(0, len(link_data["source"])):
-            s = link_data["source"][i]
-            t = link_data["target"][i]
-
-            # Found a match
-            if s == source and t == target:
-                match_found = True
-                link_data["value"][i] += 1
-
-        # If a match wasn't found
-        if not match_found:
-            link_data["source"].append(source)
-            link_data["target"].append(target)
-            link_data["value"].append(1)
+    # Count the sequences of each source/target link, in order of first appearance
+    links_df = df.groupby(["source", "target"], sort=False).size()
+    links_df = links_df.reset_index(name="value")
 
     # -------------------------------------------------------------------------
     # Filter on minimum link size
 
-    remove_link_i = []
-    for i, v in enumerate(link_data["value"]):
-        s = link_data["source"][i]
-        t = link_data["target"][i]
+    links_df = links_df[links_df["value"] >= min_link_size]
 
-        if v < min_link_size:
-            remove_link_i.append(i)
-
-    # Delete links in reverse index order
-    for i in sorted(remove_link_i, reverse=True):
-        del link_data["source"][i]
-        del link_data["target"][i]
-        del link_data["value"][i]
+    link_data = {
+        "source": links_df["source"].tolist(),
+        "target": links_df["target"].tolist(),
+        "value": links_df["value"].tolist(),
+        "color": None,
+    }
 
     # Create source and target nodes links
-    source_node_links = {}
-    target_node_links = {}
-    for source, target, value in zip(
-        link_data["source"], link_data["target"], link_data["value"]
-    ):
-        if source not in source_node_links:
-            source_node_links[source] = 0
-        if target not in target_node_links:
-            target_node_links[target] = 0
-
-        # Incrememnt count of these nodes
-        source_node_links[source] += value
-        target_node_links[target] += value
+    source_node_links = links_df.groupby("source", sort=False)["value"].sum().to_dict()
+    target_node_links = links_df.groupby("target", sort=False)["value"].sum().to_dict()
 
     # -------------------------------------------------------------------------
     # Node Palette
@@ -113,26 +73,10 @@ def create_sankey_data(df, node_order="default", min_y=0.001, min_link_size=1):
 
     # -------------------------------------------------------------------------
     # Link Palette
-    link_palette = []
-    for s, t in zip(link_data["source"], link_data["target"]):
-
-        # No change
-        color = "rgba(212,212,212,0.8)"  # light grey
-
-        # New (green)
-        if s == NO_DATA_CHAR + SOURCE_CHAR:
-            color = "rgba(44,160,44,0.5)"
-
-        # Dropped (red)
-        elif t == NO_DATA_CHAR + TARGET_CHAR:
-            color = "rgba(214,39,40,0.5)"
-
-        # Changed (orange)
-        elif s.rstrip(SOURCE_CHAR) != t.rstrip(TARGET_CHAR):
-            color = "rgba(255,127,14,0.5)"
-
-        link_palette.append(color)
-    link_data["color"] = link_palette
+    link_data["color"] = [
+        link_color(s.rstrip(SOURCE_CHAR), t.rstrip(TARGET_CHAR))
+        for s, t in zip(link_data["source"], link_data["target"])
+    ]
 
     # -------------------------------------------------------------------------
     # Node Ordering
@@ -240,15 +184,8 @@ def create_sankey_data(df, node_order="default", min_y=0.001, min_link_size=1):
     # -------------------------------------------------------------------------
 
     # Convert source/target to numeric ID
-    for i in range(0, len(link_data["source"])):
-        s = link_data["source"][i]
-        t = link_data["target"][i]
-
-        s_i = labels_i[s]
-        s_t = labels_i[t]
-
-        link_data["source"][i] = s_i
-        link_data["target"][i] = s_t
+    link_data["source"] = [labels_i[s] for s in link_data["source"]]
+    link_data["target"] = [labels_i[t] for t in link_data["target"]]
 
     data = {
         "node": node_data,
@@ -259,6 +196,9 @@ def create_sankey_data(df, node_order="default", min_y=0.001, min_link_size=1):
 
 def create_sankey_plot(sankey_data, node_order="default"):
 
+    # plotly is slow to import, and only needed for the figure
+    import plotly.graph_objects as go
+
     # if node_order == "default":
     #    arrangement = "snap"
     # else:
@@ -276,11 +216,316 @@ def create_sankey_plot(sankey_data, node_order="default"):
     return fig
 
 
+def read_lineages(positives):
+    """
+    Read the lineage of each strain in a positives table.
+
+    :param positives: str, path to a positives table (TSV)
+    :return: series of lineages indexed by strain
+    """
+
+    df = pd.read_csv(
+        positives,
+        sep="\t",
+        usecols=lambda col: col == "strain" or col in LINEAGE_COLS,
+        dtype=str,
+    )
+    # Try to find the lineage col
+    col = [c for c in LINEAGE_COLS if c in df.columns][0]
+    df.drop_duplicates(subset="strain", inplace=True)
+    return df.set_index("strain")[col]
+
+
+def create_lineage_matrix(lineages, versions):
+    """
+    Combine the lineages of a series of runs into a strain x run matrix.
+
+    Strains missing from a run have the lineage NA. Lineages are encoded as
+    categorical codes that are shared by all runs, so runs can be compared
+    as integer arrays.
+
+    :param lineages: list of series of lineages indexed by strain, in run order
+    :param versions: list of run versions, in run order
+    :return: matrix dataframe (strains x versions), codes array, categories list
+    """
+
+    matrix_df = pd.concat(lineages, axis=1, keys=versions, sort=True)
+    matrix_df.index.name = "strain"
+    matrix_df.fillna(NO_DATA_CHAR, inplace=True)
+
+    categories = sorted(pd.unique(matrix_df.values.ravel()))
+    codes = np.column_stack(
+        [
+            pd.Categorical(matrix_df[ver], categories=categories).codes
+            for ver in versions
+        ]
+    )
+    return matrix_df, codes, categories
+
+
+def compare_series(codes, categories, versions):
+    """
+    Compare all consecutive pairs of runs in a lineage matrix at once.
+
+    :param codes: array of lineage codes (strains x runs)
+    :param categories: list of lineages, indexed by code
+    :param versions: list of run versions, in run order
+    :return: summary dataframe (one row per pair), transitions dataframe
+    """
+
+    na_code = categories.index(NO_DATA_CHAR) if NO_DATA_CHAR in categories else -1
+    source = codes[:, :-1]
+    target = codes[:, 1:]
+
+    # Strains that are missing from both runs of a pair are not compared
+    present = (source != na_code) | (target != na_code)
+    new = present & (source == na_code)
+    drop = present & (target == na_code)
+    no_change = present & (source == target)
+    change = present & ~(new | drop | no_change)
+
+    summary_df = pd.DataFrame(
+        {
+            "ver_1": versions[:-1],
+            "ver_2": versions[1:],
+            "all": present.sum(axis=0),
+            "no-change": no_change.sum(axis=0),
+            "change": change.sum(axis=0),
+            "new": new.sum(axis=0),
+            "drop": drop.sum(axis=0),
+        }
+    )
+    summary_df["net"] = summary_df["new"] - summary_df["drop"]
+    summary_df["churn"] = (
+        (summary_df["change"] + summary_df["new"] + summary_df["drop"])
+        / summary_df["all"]
+    ).round(4)
+
+    # Count the strains of each source/target link, of every pair
+    pairs = np.broadcast_to(np.arange(len(versions) - 1), source.shape)
+    transitions_df = (
+        pd.DataFrame(
+            {
+                "pair": pairs[present],
+                "source": source[present],
+                "target": target[present],
+            }
+        )
+        .groupby(["pair", "source", "target"])
+        .size()
+        .reset_index(name="sequences")
+    )
+    categories = np.array(categories, dtype=object)
+    transitions_df = pd.DataFrame(
+        {
+            "ver_1": np.array(versions)[transitions_df["pair"]],
+            "ver_2": np.array(versions)[transitions_df["pair"] + 1],
+            "source": categories[transitions_df["source"]],
+            "target": categories[transitions_df["target"]],
+            "sequences": transitions_df["sequences"],
+        }
+    )
+
+    return summary_df, transitions_df
+
+
+def create_series_sankey_data(
+    transitions_df, versions, node_order="default", min_y=0.001, min_link_size=1
+):
+    """
+    Create a multi-stage sankey, with one stage of nodes per run.
+
+    :param transitions_df: dataframe of links between consecutive runs
+    :param versions: list of run versions, in run order
+    """
+
+    links_df = transitions_df[transitions_df["sequences"] >= min_link_size]
+
+    # -------------------------------------------------------------------------
+    # Nodes
+
+    # A node is a lineage in one run, its size is the larger of its in/out links
+    node_size = {}
+    for ver_col, lineage_col in [("ver_1", "source"), ("ver_2", "target")]:
+        sizes = links_df.groupby([ver_col, lineage_col], sort=False)["sequences"]
+        for node, size in sizes.sum().items():
+            node_size[node] = max(node_size.get(node, 0), size)
+
+    nodes = []
+    for ver in versions:
+        stage_nodes = [node for node in node_size if node[0] == ver]
+        if node_order.startswith("alphabetical"):
+            stage_nodes.sort(key=lambda node: node[1])
+        elif node_order.startswith("size"):
+            stage_nodes.sort(key=lambda node: node_size[node], reverse=True)
+        if node_order.endswith("rev"):
+            stage_nodes.reverse()
+        # Put NA at the end
+        if (ver, NO_DATA_CHAR) in stage_nodes:
+            stage_nodes.remove((ver, NO_DATA_CHAR))
+            stage_nodes.append((ver, NO_DATA_CHAR))
+        nodes += stage_nodes
+
+    nodes_i = {node: i for i, node in enumerate(nodes)}
+
+    node_x = []
+    node_y = []
+    x_buff = 1 / max(len(versions) - 1, 1)
+    for i, ver in enumerate(versions):
+        stage_nodes = [node for node in nodes if node[0] == ver]
+        y_buff = 1 / max(len(stage_nodes) - 1, 1)
+        for j in range(0, len(stage_nodes)):
+            node_x.append(min(max(i * x_buff, 0.001), 0.999))
+            node_y.append(min(min_y + (j * y_buff), 0.999))
+
+    node_data = {
+        "pad": 15,
+        "thickness": 20,
+        "line": dict(color="black", width=0.5),
+        "label": [node[1] for node in nodes],
+        "color": [
+            UNKNOWN_COLOR if node[1] == NO_DATA_CHAR else "#1f77b4" for node in nodes
+        ],
+        "x": [],
+        "y": [],
+    }
+
+    if node_order != "default":
+        node_data["x"] = node_x
+        node_data["y"] = node_y
+
+    # -------------------------------------------------------------------------
+    # Links
+
+    link_data = {
+        "source": [
+            nodes_i[node] for node in zip(links_df["ver_1"], links_df["source"])
+        ],
+        "target": [
+            nodes_i[node] for node in zip(links_df["ver_2"], links_df["target"])
+        ],
+        "value": links_df["sequences"].tolist(),
+        "color": [
+            link_color(s, t) for s, t in zip(links_df["source"], links_df["target"])
+        ],
+    }
+
+    data = {
+        "node": node_data,
+        "link": link_data,
+    }
+    return data
+
+
+def link_color(source, target):
+    """Color a link between two lineages by the type of change."""
+
+    # New (green)
+    if source == NO_DATA_CHAR:
+        return "rgba(44,160,44,0.5)"
+    # Dropped (red)
+    elif target == NO_DATA_CHAR:
+        return "rgba(214,39,40,0.5)"
+    # Changed (orange)
+    elif source != target:
+        return "rgba(255,127,14,0.5)"
+    # No change (light grey)
+    return "rgba(212,212,212,0.8)"
+
+
+def run_series(
+    positives, versions, outdir, logger, node_order, min_y, min_link_size, threads
+):
+    """Compare positive recombinants across a series of runs."""
+
+    logger.info("Parsing {} tables with {} threads.".format(len(positives), threads))
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        lineages = list(executor.map(read_lineages, positives))
+
+    logger.info("Creating lineage matrix.")
+    matrix_df, codes, categories = create_lineage_matrix(lineages, versions)
+
+    logger.info("Calculating statistics.")
+    summary_df, transitions_df = compare_series(codes, categories, versions)
+    for rec in summary_df.itertuples(index=False):
+        logger.info(
+            "{} to {}: {}".format(
+                rec.ver_1,
+                rec.ver_2,
+                ", ".join(
+                    "{} {}".format(stat, val)
+                    for stat, val in zip(SERIES_STATISTICS, rec[2:])
+                ),
+            )
+        )
+
+    # -------------------------------------------------------------------------
+    # Output
+
+    prefix = os.path.join(
+        outdir, "ncov-recombinant_{}_{}_series".format(versions[0], versions[-1])
+    )
+
+    # Tables
+    logger.info("Writing output tables to: {}".format(outdir))
+    summary_df.to_csv(prefix + "_summary.tsv", sep="\t", index=False)
+    transitions_df.to_csv(prefix + "_transitions.tsv", sep="\t", index=False)
+    matrix_df.to_csv(prefix + "_lineages.tsv", sep="\t")
+
+    # Figures
+    title = "ncov-recombinant {} to {}".format(versions[0], versions[-1])
+    title += (
+        "<br><sup>"
+        + "Runs: {}".format(len(versions))
+        + ", Sequences: {}".format(len(matrix_df))
+        + ", Changed (orange): {}".format(summary_df["change"].sum())
+        + ", New (green): {}".format(summary_df["new"].sum())
+        + ", Dropped (red): {}".format(summary_df["drop"].sum())
+        + "</sup>"
+    )
+
+    logger.info("Creating sankey data.")
+    sankey_data = create_series_sankey_data(
+        transitions_df,
+        versions,
+        node_order=node_order,
+        min_y=min_y,
+        min_link_size=min_link_size,
+    )
+    logger.info("Creating sankey plot.")
+    sankey_fig = create_sankey_plot(sankey_data, node_order=node_order)
+    sankey_fig.update_layout(
+        title_text=title, font_size=12, width=max(1000, 250 * len(versions)), height=800
+    )
+
+    logger.info("Writing output figures to: {}".format(outdir))
+    import plotly.io as pio
+
+    sankey_fig.write_html(prefix + ".html")
+    pio.write_image(sankey_fig, prefix + ".png", format="png", scale=2)
+    pio.write_image(sankey_fig, prefix + ".svg", format="svg", scale=2)
+
+
 @click.command()
-@click.option("--positives-1", help="First positives table (TSV)", required=True)
-@click.option("--positives-2", help="Second positives table (TSV)", required=True)
-@click.option("--ver-1", help="First version for title", required=True)
-@click.option("--ver-2", help="Second version for title", required=True)
+@click.option("--positives-1", help="First positives table (TSV)", required=False)
+@click.option("--positives-2", help="Second positives table (TSV)", required=False)
+@click.option("--ver-1", help="First version for title", required=False)
+@click.option("--ver-2", help="Second version for title", required=False)
+@click.option(
+    "--positives",
+    help="Positives tables of a series of runs, in run order (TSV, repeatable)",
+    multiple=True,
+)
+@click.option(
+    "--ver",
+    help="Version of each run in --positives, in the same order (repeatable)",
+    multiple=True,
+)
+@click.option(
+    "--threads",
+    help="Number of --positives tables to read concurrently",
+    default=4,
+)
 @click.option("--outdir", help="Output directory", required=True)
 @click.option("--log", help="Logfile", required=False)
 @click.option(
@@ -307,13 +552,29 @@ def main(
     positives_2,
     ver_1,
     ver_2,
+    positives,
+    ver,
+    threads,
     outdir,
     log,
     node_order,
     min_y,
     min_link_size,
 ):
-    """Compare positive recombinants between two tables."""
+    """Compare positive recombinants between two tables, or a series of runs."""
+
+    if positives:
+        if len(positives) < 2 or len(positives) != len(ver):
+            raise click.UsageError(
+                "A series requires at least two --positives, and one --ver for each."
+            )
+        if len(set(ver)) != len(ver):
+            raise click.UsageError("Each --ver of a series must be unique.")
+    elif not (positives_1 and positives_2 and ver_1 and ver_2):
+        raise click.UsageError(
+            "--positives-1, --positives-2, --ver-1 and --ver-2 are required,"
+            + " unless a series is compared with --positives and --ver."
+        )
 
     # create output directory
     if not os.path.exists(outdir):
@@ -321,6 +582,19 @@ def main(
     # create logger
     logger = create_logger(logfile=log)
 
+    if positives:
+        run_series(
+            positives,
+            ver,
+            outdir,
+            logger,
+            node_order,
+            min_y,
+            min_link_size,
+            threads,
+        )
+        return
+
     logger.info("Parsing table: {}".format(positives_1))
     positives_1_df = pd.read_csv(positives_1, sep="\t")
     logger.info("Parsing table: {}".format(positives_2))
@@ -343,17 +617,7 @@ def main(
     lineages_df = pd.merge(lineages_1, lineages_2, how="outer", on="strain")
     lineages_df.rename(columns={"strain": "id"}, inplace=True)
 
-    # Convert NA
-    for rec in lineages_df.iterrows():
-        source = rec[1]["source"]
-        target = rec[1]["target"]
-
-        # Check for NA, which is float
-        if type(source) == float:
-            lineages_df.loc[rec[0], "source"] = NO_DATA_CHAR
-        if type(target) == float:
-            lineages_df.loc[rec[0], "target"] = NO_DATA_CHAR
-
+    # Strains missing from either table have no lineage
     lineages_df.fillna(NO_DATA_CHAR, inplace=True)
 
     logger.info("Calculating statistics.")
@@ -401,8 +665,8 @@ def main(
     )
 
     # Put suffix char on end to separate source and target
-    lineages_df["source"] = [s + SOURCE_CHAR for s in lineages_df["source"]]
-    lineages_df["target"] = [t + TARGET_CHAR for t in lineages_df["target"]]
+    lineages_df["source"] = lineages_df["source"].astype(str) + SOURCE_CHAR
+    lineages_df["target"] = lineages_df["target"].astype(str) + TARGET_CHAR
 
     title = "ncov-recombinant {ver_1}<sup>{ver_1_char}</sup> to ".format(
         ver_1=ver_1,
@@ -451,6 +715,8 @@ def main(
 
     # Figures
     logger.info("Writing output figures to: {}".format(outdir))
+    import plotly.io as pio
+
     sankey_fig.write_html(prefix + ".html")
     pio.write_image(sankey_fig, prefix + ".png", format="png", scale=2)
     pio.write_image(sankey_fig, prefix + ".svg", format="svg", scale=2)
@@ -0,0 +1,62 @@
+import pandas as pd
+from datetime import date, datetime, timedelta
+
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def parse_dates(dates, default=None):
+    """
+    Parse an array of dates (%Y-%m-%d) into datetime.date objects.
+
+    Parsing is done once per unique value, and then broadcast back to the
+    full array. Unparseable values (ex. NA) are set to the default, which
+    is today (Issue #168).
+    """
+    if default is None:
+        default = date.today()
+
+    codes, uniques = pd.factorize(pd.Series(dates, dtype="object"), sort=False)
+    parsed = pd.to_datetime(
+        pd.Series(uniques, dtype="object"), format=DATE_FORMAT, errors="coerce"
+    )
+    parsed_dates = [default if pd.isnull(d) else d.date() for d in parsed]
+
+    # Missing values (NaN) are flagged with code -1
+    parsed_dates.append(default)
+
+    return pd.Series(
+        pd.Series(parsed_dates, dtype="object").values[codes],
+        index=dates.index if isinstance(dates, pd.Series) else None,
+        dtype="object",
+    )
+
+
+def epiweek_startdate(d):
+    """
+    Return the start date (Sunday) of the CDC epiweek containing a date.
+
+    Equivalent to epiweeks.Week.fromdate(d, system="cdc").startdate()
+    """
+    if isinstance(d, datetime):
+        d = d.date()
+    # Monday = 0, Sunday = 6
+    return d - timedelta(days=(d.weekday() + 1) % 7)
+
+
+def epiweek_startdates(dates):
+    """
+    Return the CDC epiweek start date for an array of datetime.date objects.
+
+    The offset to the previous Sunday is computed arithmetically over the
+    unique dates, and then broadcast back to the full array.
+    """
+    codes, uniques = pd.factorize(pd.Series(dates, dtype="object"), sort=False)
+    uniques = pd.to_datetime(pd.Series(uniques, dtype="object"))
+    offset = pd.to_timedelta((uniques.dt.dayofweek + 1) % 7, unit="D")
+    startdates = list((uniques - offset).dt.date)
+
+    return pd.Series(
+        pd.Series(startdates, dtype="object").values[codes],
+        index=dates.index if isinstance(dates, pd.Series) else None,
+        dtype="object",
+    )
@@ -5,13 +5,33 @@ import click
 import pandas as pd
 import numpy as np
 import sys
+import os
+import json
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlparse, parse_qs
 
 NO_DATA_CHAR = "NA"
-rate_limit_url = "https://api.github.com/rate_limit"
-base_url = "https://api.github.com/repos/cov-lineages/pango-designation/issues"
-params = "?state=all&per_page=100&page={page_num}"
-query_url = base_url + params
+API_URL = "https://api.github.com"
+RATE_LIMIT_ENDPOINT = "/rate_limit"
+ISSUES_ENDPOINT = "/repos/cov-lineages/pango-designation/issues"
+PER_PAGE = 100
+MAX_PAGES = 99
+
+# Files of the local issues store, used with --cache-dir
+CACHE_ISSUES_FILE = "issues.json"
+CACHE_STATE_FILE = "state.json"
+# Only these fields of each issue are needed, the rest are not cached
+ISSUE_FIELDS = [
+    "number",
+    "title",
+    "milestone",
+    "labels",
+    "body",
+    "created_at",
+    "updated_at",
+    "closed_at",
+]
 
 # These issues have problems, and are manually curated in the breakpoints file
 # Typically, they describe multiple lineages in a single issue
@@ -21,6 +41,274 @@ EXCLUDE_ISSUES = [
 ]
 
 
+def check_rate_limit(api_url, headers):
+    """Return the number of API requests remaining, exit if there are none."""
+
+    r = requests.get(api_url + RATE_LIMIT_ENDPOINT, headers=headers)
+    api_stats = r.json()
+    requests_limit = api_stats["resources"]["core"]["limit"]
+    requests_remaining = api_stats["resources"]["core"]["remaining"]
+
+    reset_time = api_stats["resources"]["core"]["reset"]
+    reset_date = datetime.fromtimestamp(reset_time)
+
+    if requests_remaining == 0:
+        msg = "ERROR: Hourly API limit of {} requests exceeded,".format(requests_limit)
+        msg += " rate limit will reset after {}.".format(reset_date)
+        print(msg, file=sys.stderr)
+        sys.exit(1)
+
+    return requests_remaining
+
+
+def fetch_page(url, headers, validators):
+    """
+    Fetch a page of issues, as a conditional request if the page was seen before.
+
+    Returns the response, and the issues (empty if the page was not modified).
+    """
+
+    request_headers = dict(headers)
+    if validators.get("etag"):
+        request_headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        request_headers["If-Modified-Since"] = validators["last_modified"]
+
+    r = requests.get(url, headers=request_headers)
+    if r.status_code == 304:
+        return r, []
+    r.raise_for_status()
+    return r, r.json()
+
+
+def get_last_page(response):
+    """Parse the number of the last page of results from the Link header."""
+
+    last = response.links.get("last")
+    if not last:
+        return 1
+    query = parse_qs(urlparse(last["url"]).query)
+    return int(query["page"][0])
+
+
+def load_cache(cache_dir):
+    """Load the cached issues (by number), and the sync state."""
+
+    issues, state = {}, {}
+    if not cache_dir:
+        return issues, state
+
+    issues_path = os.path.join(cache_dir, CACHE_ISSUES_FILE)
+    state_path = os.path.join(cache_dir, CACHE_STATE_FILE)
+    if os.path.exists(issues_path) and os.path.exists(state_path):
+        with open(issues_path) as infile:
+            issues = json.load(infile)
+        with open(state_path) as infile:
+            state = json.load(infile)
+
+    return issues, state
+
+
+def save_cache(cache_dir, issues, state):
+    """Save the cached issues and the sync state."""
+
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    with open(os.path.join(cache_dir, CACHE_ISSUES_FILE), "w") as outfile:
+        json.dump(issues, outfile)
+    # Write the state last, so an interrupted save is never used
+    with open(os.path.join(cache_dir, CACHE_STATE_FILE), "w") as outfile:
+        json.dump(state, outfile, indent=2)
+
+
+def download_issues(api_url, headers, cache_dir, threads):
+    """
+    Download pango-designation issues, updating the local store in cache_dir.
+
+    Only issues updated since the last sync are requested, and pages that
+    have not changed are detected with conditional requests (ETag and
+    Last-Modified), which do not count against the rate limit.
+    """
+
+    issues, state = load_cache(cache_dir)
+    validators = state.get("validators", {})
+
+    query = {"state": "all", "per_page": PER_PAGE}
+    if issues:
+        query["since"] = max(issue["updated_at"] for issue in issues.values())
+    page_url = api_url + ISSUES_ENDPOINT + "?" + urlencode(query) + "&page={}"
+
+    requests_remaining = check_rate_limit(api_url, headers)
+
+    # The first page tells us how many pages there are
+    url = page_url.format(1)
+    response, page_issues = fetch_page(url, headers, validators.get(url, {}))
+    responses = [(url, response, page_issues)]
+    num_pages = min(get_last_page(response), MAX_PAGES)
+    urls = [page_url.format(page_num) for page_num in range(2, num_pages + 1)]
+
+    # Check that the remaining pages fit within the rate limit
+    requests_remaining = int(
+        response.headers.get("X-RateLimit-Remaining", requests_remaining - 1)
+    )
+    if len(urls) > requests_remaining:
+        msg = "ERROR: {} more pages of issues exceeds the {} API requests".format(
+            len(urls), requests_remaining
+        )
+        msg += " remaining, rerun after the rate limit resets."
+        print(msg, file=sys.stderr)
+        sys.exit(1)
+
+    # Fetch the remaining pages concurrently
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = executor.map(
+            lambda url: fetch_page(url, headers, validators.get(url, {})), urls
+        )
+        responses += [(url, r, i) for url, (r, i) in zip(urls, results)]
+
+    new_validators = {}
+    for url, response, page_issues in responses:
+        for issue in page_issues:
+            issues[str(issue["number"])] = {k: issue.get(k) for k in ISSUE_FIELDS}
+        new_validators[url] = {
+            "etag": response.headers.get("ETag", validators.get(url, {}).get("etag")),
+            "last_modified": response.headers.get(
+                "Last-Modified", validators.get(url, {}).get("last_modified")
+            ),
+        }
+
+    if cache_dir:
+        state = {
+            "last_sync": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "validators": new_validators,
+        }
+        save_cache(cache_dir, issues, state)
+
+    print(
+        "Fetched {} page(s) of issues, {} issues in total.".format(
+            len(responses), len(issues)
+        ),
+        file=sys.stderr,
+    )
+
+    # Newest issues first, as returned by the API
+    return sorted(issues.values(), key=lambda issue: issue["number"], reverse=True)
+
+
+def parse_issue(issue, header_cols):
+    """
+    Parse a pango-designation issue into a row of the issues table.
+    Returns None if the issue does not describe a recombinant.
+    """
+
+    # Assume not a recombinant
+    recombinant = False
+    number = issue["number"]
+
+    # Check for excluded issues
+    if number in EXCLUDE_ISSUES:
+        return None
+
+    # sanitize quotes out of title
+    title = issue["title"].replace('"', "")
+    # sanitize markdown formatters
+    title = title.replace("*", "")
+
+    # If title includes recombinant or recombinantion
+    if "recombinant" in title.lower() or "recombination" in title.lower():
+        recombinant = True
+
+    # Designated lineages are stored under the milestone title
+    lineage = ""
+    milestone = issue["milestone"]
+    if milestone:
+        lineage = milestone["title"]
+
+    # Detect recombinant by lineage nomenclature (X)
+    if lineage:
+        if lineage.startswith("X"):
+            recombinant = True
+        else:
+            return None
+
+    # Parse labels
+    labels = issue["labels"]
+
+    # labels are a our last chance, so if it doesn't have any skip
+    if not recombinant and len(labels) == 0:
+        return None
+
+    status = ""
+    status_description = ""
+    if len(labels) > 0:
+        status = labels[0]["name"]
+        status_description = labels[0]["description"]
+
+    # Check if the label (status) includes recombinant
+    if "recombinant" in status.lower():
+        recombinant = True
+
+    # Skip to the next record if this is not a recombinant issue
+    if not recombinant:
+        return None
+
+    # If a lineage hasn't been assigned,
+    # use the propose# nomenclature from UShER
+    if not lineage:
+        lineage = "proposed{}".format(number)
+
+    # Try to extract info from the body
+    body = issue["body"]
+    breakpoints = []
+    countries = []
+
+    # Skip issues without a body
+    if not body:
+        return None
+
+    for line in body.split("\n"):
+
+        line = line.strip().replace("*", "")
+
+        # Breakpoints
+        if "breakpoint:" in line.lower():
+            breakpoints.append(line)
+        elif "breakpoint" in line.lower():
+            breakpoints.append(line)
+
+        # Countries (nicely structures)
+        if "countries circulating" in line.lower():
+            line = line.replace("Countries circulating:", "")
+            countries.append(line)
+
+    breakpoints = ";".join(breakpoints)
+    countries = ";".join(countries)
+
+    # Dates
+    date_created = issue["created_at"]
+    date_updated = issue["updated_at"]
+    date_closed = issue["closed_at"]
+
+    if not date_closed:
+        date_closed = NO_DATA_CHAR
+
+    # Create the output data
+    data = {col: "" for col in header_cols}
+    data["issue"] = number
+    data["lineage"] = lineage
+    data["status"] = status
+    data["status_description"] = status_description
+    data["title"] = title
+    data["countries"] = countries
+    data["breakpoints"] = breakpoints
+    data["date_created"] = date_created
+    data["date_updated"] = date_updated
+    data["date_closed"] = date_closed
+
+    return data
+
+
 @click.command()
 @click.option("--token", help="Github API Token", required=False)
 @click.option(
@@ -30,7 +318,14 @@ EXCLUDE_ISSUES = [
     ),
     required=False,
 )
-def main(token, breakpoints):
+@click.option(
+    "--cache-dir",
+    help="Directory to store issues in, so only updated issues are downloaded",
+    required=False,
+)
+@click.option("--api-url", help="Github API URL", required=False, default=API_URL)
+@click.option("--threads", help="Number of pages to download concurrently", default=4)
+def main(token, breakpoints, cache_dir, api_url, threads):
     """Fetch pango-designation issues"""
 
     breakpoints_curated = breakpoints
@@ -48,155 +343,17 @@ def main(token, breakpoints):
         "date_updated",
         "date_closed",
     ]
-    df = pd.DataFrame(columns=header_cols)
-
-    # Iterate through the pages of issues
-    pages = range(1, 100)
-    for page_num in pages:
-
-        # Is the user supplied an API token, use it
-        headers = ""
-        if token:
-            headers = {"Authorization": "token {}".format(token)}
-
-        # Check the current rate limt
-        r = requests.get(rate_limit_url, headers=headers)
-        api_stats = r.json()
-        requests_limit = api_stats["resources"]["core"]["limit"]
-        requests_remaining = api_stats["resources"]["core"]["remaining"]
-
-        reset_time = api_stats["resources"]["core"]["reset"]
-        reset_date = datetime.fromtimestamp(reset_time)
-
-        if requests_remaining == 0:
-            msg = "ERROR: Hourly API limit of {} requests exceeded,".format(
-                requests_limit
-            )
-            msg += " rate limit will reset after {}.".format(reset_date)
-            print(msg, file=sys.stderr)
-            sys.exit(1)
-
-        # We're under the rate limit, and can proceed
-        r = requests.get(query_url.format(page_num=page_num), headers=headers)
-        issues_json = r.json()
-
-        # The issues json will be empty if we ran out of pages
-        if len(issues_json) == 0:
-            break
-
-        # Iterate through issues
-        for issue in issues_json:
-
-            # Assume not a recombinant
-            recombinant = False
-            number = issue["number"]
-
-            # Check for excluded issues
-            if number in EXCLUDE_ISSUES:
-                continue
-
-            # sanitize quotes out of title
-            title = issue["title"].replace('"', "")
-            # sanitize markdown formatters
-            title = title.replace("*", "")
-
-            # If title includes recombinant or recombinantion
-            if "recombinant" in title.lower() or "recombination" in title.lower():
-                recombinant = True
-
-            # Designated lineages are stored under the milestone title
-            lineage = ""
-            milestone = issue["milestone"]
-            if milestone:
-                lineage = milestone["title"]
-
-            # Detect recombinant by lineage nomenclature (X)
-            if lineage:
-                if lineage.startswith("X"):
-                    recombinant = True
-                else:
-                    continue
-
-            # Parse labels
-            labels = issue["labels"]
-
-            # labels are a our last chance, so if it doesn't have any skip
-            if not recombinant and len(labels) == 0:
-                continue
-
-            status = ""
-            status_description = ""
-            if len(labels) > 0:
-                status = labels[0]["name"]
-                status_description = labels[0]["description"]
 
-            # Check if the label (status) includes recombinant
-            if "recombinant" in status.lower():
-                recombinant = True
+    # Is the user supplied an API token, use it
+    headers = {}
+    if token:
+        headers = {"Authorization": "token {}".format(token)}
 
-            # Skip to the next record if this is not a recombinant issue
-            if not recombinant:
-                continue
-
-            # If a lineage hasn't been assigned,
-            # use the propose# nomenclature from UShER
-            if not lineage:
-                lineage = "proposed{}".format(number)
-
-            # Try to extract info from the body
-            body = issue["body"]
-            breakpoints = []
-            countries = []
-
-            # Skip issues without a body
-            if not body:
-                continue
+    issues = download_issues(api_url, headers, cache_dir, threads)
 
-            for line in body.split("\n"):
-
-                line = line.strip().replace("*", "")
-
-                # Breakpoints
-                if "breakpoint:" in line.lower():
-                    breakpoints.append(line)
-                elif "breakpoint" in line.lower():
-                    breakpoints.append(line)
-
-                # Countries (nicely structures)
-                if "countries circulating" in line.lower():
-                    line = line.replace("Countries circulating:", "")
-                    countries.append(line)
-
-            breakpoints = ";".join(breakpoints)
-            countries = ";".join(countries)
-
-            # Dates
-            date_created = issue["created_at"]
-            date_updated = issue["updated_at"]
-            date_closed = issue["closed_at"]
-
-            if not date_closed:
-                date_closed = NO_DATA_CHAR
-
-            # Create the output data
-            data = {col: "" for col in header_cols}
-            data["issue"] = number
-            data["lineage"] = lineage
-            data["status"] = status
-            data["status_description"] = status_description
-            data["title"] = title
-            data["countries"] = countries
-            data["breakpoints"] = breakpoints
-            data["date_created"] = date_created
-            data["date_updated"] = date_updated
-            data["date_closed"] = date_closed
-
-            # Change data vals to lists for pandas
-            data = {k: [v] for k, v in data.items()}
-            # Convert dict to dataframe
-            df_data = pd.DataFrame(data)
-            # Add data to the main dataframe
-            df = pd.concat([df, df_data], ignore_index=True)
+    # Iterate through issues
+    rows = [parse_issue(issue, header_cols) for issue in issues]
+    df = pd.DataFrame([row for row in rows if row], columns=header_cols)
 
     # -------------------------------------------------------------------------
     # Curate breakpoints
@@ -1,7 +1,4 @@
 import math
-import matplotlib.pyplot as plt
-import numpy as np
-from matplotlib import colors
 import logging
 import sys
 
@@ -27,6 +24,11 @@ def categorical_palette(num_cat=9, continuous=False, cmap="tab10", cmap_num_cat=
     Link: https://stackoverflow.com/a/47232942
     """
 
+    # Imported here, so that scripts which only need the logger start quickly
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from matplotlib import colors
+
     num_sub_cat = 1
 
     # if there are more data categories than cmap categories
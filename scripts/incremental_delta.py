@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+import click
+import csv
+import hashlib
+import os
+import sys
+from functions import create_logger
+
+# Files of the persisted build state, shared with incremental_merge.py
+STATE_KEY_FILE = "key.txt"
+STATE_HASHES_FILE = "hashes.tsv"
+STATE_SUMMARY_FILE = "summary.tsv"
+
+# Files of the delta, written to the output directory
+DELTA_SEQUENCES_FILE = "sequences.fasta"
+DELTA_METADATA_FILE = "metadata.tsv"
+DELTA_STRAINS_FILE = "strains.txt"
+DELTA_KEY_FILE = "key.txt"
+
+STRAIN_COL = "strain"
+# Columns of the pango-designation issues used by sc2rf postprocessing, only
+# for issues with curated breakpoints
+ISSUES_COLS = ["lineage", "parents_curated", "breakpoints_curated"]
+STATUS_COL = "sc2rf_status"
+POSITIVE_STATUS = "positive"
+
+csv.field_size_limit(sys.maxsize)
+
+
+def read_state_key(state_dir):
+    """Read the key of the persisted state, or None if there is no state."""
+    key_path = os.path.join(state_dir, STATE_KEY_FILE)
+    if not os.path.exists(key_path):
+        return None
+    with open(key_path) as infile:
+        return infile.read().strip()
+
+
+def issues_checksum(path):
+    """
+    Hash the curated breakpoints of the pango-designation issues, so that
+    updates to other columns (ex. title, countries) don't change the key.
+    """
+    checksum = hashlib.sha256()
+    with open(path, newline="") as infile:
+        for row in csv.DictReader(infile, delimiter="\t"):
+            if row["breakpoints_curated"]:
+                checksum.update("\t".join(row[col] for col in ISSUES_COLS).encode())
+                checksum.update(b"\n")
+    return checksum.hexdigest()
+
+
+def build_key(key, issues, depends, versions):
+    """
+    Combine the key of the build parameters with the contents of the files
+    and the versions of the tools that the persisted summary depends on.
+    """
+    checksum = hashlib.sha256(key.encode())
+    if issues:
+        checksum.update(issues_checksum(issues).encode())
+    for path in depends:
+        with open(path, "rb") as infile:
+            checksum.update(hashlib.sha256(infile.read()).hexdigest().encode())
+    for version in versions:
+        checksum.update(version.encode())
+    return checksum.hexdigest()
+
+
+def read_positives(state_dir):
+    """Read the strains that were sc2rf positives in the persisted summary."""
+    summary_path = os.path.join(state_dir, STATE_SUMMARY_FILE)
+    if not os.path.exists(summary_path):
+        return set()
+    with open(summary_path, newline="") as infile:
+        reader = csv.DictReader(infile, delimiter="\t")
+        if STATUS_COL not in (reader.fieldnames or []):
+            return set()
+        return set(
+            row[STRAIN_COL] for row in reader if row[STATUS_COL] == POSITIVE_STATUS
+        )
+
+
+def read_hashes(path):
+    """Read a table of strain hashes as a dict."""
+    hashes = {}
+    with open(path) as infile:
+        for line in infile:
+            strain, _, checksum = line.rstrip("\n").rpartition("\t")
+            hashes[strain] = checksum
+    return hashes
+
+
+def read_fasta_records(path):
+    """Yield the name and lines (including the header) of each FASTA record."""
+    name, lines = None, []
+    with open(path) as infile:
+        for line in infile:
+            if line.startswith(">"):
+                if name is not None:
+                    yield name, lines
+                name, lines = line[1:].strip(), []
+            lines.append(line)
+    if name is not None:
+        yield name, lines
+
+
+@click.command()
+@click.option("--sequences", help="Input sequences (fasta)", required=True)
+@click.option("--metadata", help="Input metadata (tsv)", required=True)
+@click.option("--state-dir", help="Persisted state of the build", required=True)
+@click.option("--key", help="Key of the build parameters", required=True)
+@click.option("--issues", help="Pango-designation issues (tsv)", required=False)
+@click.option(
+    "--depends",
+    help="Input file of the summary, such as the issues (multiple)",
+    multiple=True,
+)
+@click.option(
+    "--version",
+    help="Version of a tool that writes the summary (multiple)",
+    multiple=True,
+)
+@click.option(
+    "--reprocess-all",
+    help="Reprocess all strains, if the summary can't be reproduced (ex. LAPIS)",
+    is_flag=True,
+)
+@click.option("--outdir", help="Output directory of the delta", required=True)
+@click.option("--log", help="Logfile", required=False)
+def main(
+    sequences,
+    metadata,
+    state_dir,
+    key,
+    issues,
+    depends,
+    version,
+    reprocess_all,
+    outdir,
+    log,
+):
+    """
+    Find the new or changed strains of a build since the previous run.
+
+    Strains are compared by a hash of their sequence and metadata. All strains
+    are new if the build parameters, the input files the summary depends on,
+    or the tool versions (key) have changed.
+    """
+
+    logger = create_logger(logfile=log)
+
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+
+    key = build_key(key, issues, depends, version)
+    delta_key_path = os.path.join(outdir, DELTA_KEY_FILE)
+
+    # -------------------------------------------------------------------------
+    # Previous run
+
+    previous_hashes = {}
+    previous_positives = set()
+    state_key = read_state_key(state_dir)
+    if state_key is None:
+        logger.info("No previous state found: {}".format(state_dir))
+    elif reprocess_all:
+        logger.warning(
+            "LAPIS lookups can't be reused, reprocessing all strains. "
+            + "Set lapis: false for incremental builds."
+        )
+    elif state_key != key:
+        logger.info(
+            "Build parameters, inputs or versions have changed, "
+            + "reprocessing all strains."
+        )
+    else:
+        previous_hashes = read_hashes(os.path.join(state_dir, STATE_HASHES_FILE))
+        previous_positives = read_positives(state_dir)
+        logger.info("Previous run had {} strains.".format(len(previous_hashes)))
+
+    # -------------------------------------------------------------------------
+    # Metadata
+
+    logger.info("Parsing metadata: {}".format(metadata))
+    with open(metadata, newline="") as infile:
+        reader = csv.reader(infile, delimiter="\t")
+        metadata_header = next(reader)
+        strain_i = metadata_header.index(STRAIN_COL)
+        metadata_rows = {row[strain_i]: row for row in reader if row}
+
+    # -------------------------------------------------------------------------
+    # Sequences
+
+    logger.info("Hashing sequences: {}".format(sequences))
+    hashes = {}
+    delta = []
+    hashes_path = os.path.join(outdir, STATE_HASHES_FILE)
+    delta_sequences_path = os.path.join(outdir, DELTA_SEQUENCES_FILE)
+
+    with open(delta_sequences_path, "w") as outfile:
+        fallback_record = None
+        for name, lines in read_fasta_records(sequences):
+            checksum = hashlib.sha256()
+            checksum.update("".join(lines[1:]).replace("\n", "").upper().encode())
+            checksum.update("\t".join(metadata_rows.get(name, [])).encode())
+            hashes[name] = checksum.hexdigest()
+
+            # Prefer a previous positive, so that sc2rf postprocessing still
+            # has a recombinant when negatives are excluded (exclude_negatives)
+            if fallback_record is None or (
+                name in previous_positives
+                and fallback_record[0] not in previous_positives
+            ):
+                fallback_record = (name, lines)
+
+            if previous_hashes.get(name) != hashes[name]:
+                delta.append(name)
+                outfile.write("".join(lines))
+
+        # Always reprocess at least one strain, so the delta is never empty
+        if not delta and fallback_record is not None:
+            delta.append(fallback_record[0])
+            outfile.write("".join(fallback_record[1]))
+
+    logger.info(
+        "Found {} new or changed strains, out of {} strains.".format(
+            len(delta), len(hashes)
+        )
+    )
+
+    # -------------------------------------------------------------------------
+    # Export
+
+    delta_metadata_path = os.path.join(outdir, DELTA_METADATA_FILE)
+    logger.info("Writing delta metadata: {}".format(delta_metadata_path))
+    with open(delta_metadata_path, "w", newline="") as outfile:
+        writer = csv.writer(outfile, delimiter="\t", lineterminator="\n")
+        writer.writerow(metadata_header)
+        writer.writerows(
+            metadata_rows[strain] for strain in delta if strain in metadata_rows
+        )
+
+    delta_strains_path = os.path.join(outdir, DELTA_STRAINS_FILE)
+    with open(delta_strains_path, "w") as outfile:
+        outfile.write("".join(strain + "\n" for strain in delta))
+
+    logger.info("Writing hashes: {}".format(hashes_path))
+    with open(hashes_path, "w") as outfile:
+        for strain, checksum in hashes.items():
+            outfile.write("{}\t{}\n".format(strain, checksum))
+
+    with open(delta_key_path, "w") as outfile:
+        outfile.write(key + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+import click
+import os
+import shutil
+from functions import create_logger
+from incremental_delta import (
+    STATE_KEY_FILE,
+    STATE_HASHES_FILE,
+    STATE_SUMMARY_FILE,
+    read_hashes,
+    read_state_key,
+)
+from summary import JOIN_COL, SORT_COL, read_table, write_table
+
+
+@click.command()
+@click.option("--summary", help="Summary of the delta strains (tsv)", required=True)
+@click.option("--strains", help="Delta strains (txt)", required=True)
+@click.option("--hashes", help="Hashes of all current strains (tsv)", required=True)
+@click.option("--state-dir", help="Persisted state of the build", required=True)
+@click.option(
+    "--key-file",
+    help="Key of the build, from incremental_delta.py (txt)",
+    required=True,
+)
+@click.option("--output", help="Output summary of all strains (tsv)", required=True)
+@click.option("--log", help="Logfile", required=False)
+def main(summary, strains, hashes, state_dir, key_file, output, log):
+    """
+    Merge the summary of the delta strains into the persisted build summary.
+    """
+
+    logger = create_logger(logfile=log)
+
+    with open(key_file) as infile:
+        key = infile.read().strip()
+
+    outdir = os.path.dirname(output)
+    if not os.path.exists(outdir) and outdir != "":
+        os.makedirs(outdir)
+
+    # -------------------------------------------------------------------------
+    # Import
+
+    logger.info("Parsing delta summary: {}".format(summary))
+    header, delta_rows = read_table(summary)
+
+    with open(strains) as infile:
+        delta_strains = set(line.strip() for line in infile if line.strip())
+
+    # Input order of all current strains
+    strain_order = {strain: i for i, strain in enumerate(read_hashes(hashes))}
+
+    previous_rows = []
+    state_summary_path = os.path.join(state_dir, STATE_SUMMARY_FILE)
+    if read_state_key(state_dir) == key and os.path.exists(state_summary_path):
+        logger.info("Parsing previous summary: {}".format(state_summary_path))
+        previous_header, previous_rows = read_table(state_summary_path)
+        if previous_header != header:
+            raise click.ClickException(
+                "Columns of the previous summary differ, remove the state: {}".format(
+                    state_dir
+                )
+            )
+
+    # -------------------------------------------------------------------------
+    # Merge
+
+    # Keep previous strains that are still present, and have not changed
+    strain_i = header.index(JOIN_COL)
+    rows = [
+        row
+        for row in previous_rows
+        if row[strain_i] in strain_order and row[strain_i] not in delta_strains
+    ]
+    logger.info("Keeping {} previous records.".format(len(rows)))
+    logger.info("Adding {} new or changed records.".format(len(delta_rows)))
+    rows += delta_rows
+
+    # Restore the input order, then stable sort by lineage (as in summary.py)
+    sort_i = header.index(SORT_COL)
+    rows.sort(key=lambda row: strain_order.get(row[strain_i], len(strain_order)))
+    rows.sort(key=lambda row: row[sort_i])
+
+    logger.info("Writing summary: {}".format(output))
+    with open(output, "w") as outfile:
+        write_table(outfile, header, rows)
+
+    # -------------------------------------------------------------------------
+    # Persist state
+
+    # Remove the key first and write it last, so a partial state is never used
+    if not os.path.exists(state_dir):
+        os.makedirs(state_dir)
+    key_path = os.path.join(state_dir, STATE_KEY_FILE)
+    if os.path.exists(key_path):
+        os.remove(key_path)
+
+    logger.info("Saving state: {}".format(state_dir))
+    shutil.copyfile(output, state_summary_path)
+    shutil.copyfile(hashes, os.path.join(state_dir, STATE_HASHES_FILE))
+    with open(key_path, "w") as outfile:
+        outfile.write(key + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,22 +2,163 @@
 
 import click
 import os
-from Bio import Phylo
-from Bio.Phylo.BaseTree import Clade
-import requests
-from pango_aliasor.aliasor import Aliasor
+import hashlib
+import shutil
+import numpy as np
+
+# Bio, requests and pango_aliasor are imported where they are used, since
+# linelist.py imports this module only to read the binary index (npz)
 
 LINEAGES_URL = (
     "https://raw.githubusercontent.com/cov-lineages/pango-designation/master/"
     + "lineage_notes.txt"
 )
 
+# Files of the cached tree, used with --cache-dir
+CACHE_CHECKSUM_FILE = "lineage_notes.sha256"
+CACHE_TREE_FILE = "tree.nwk"
+CACHE_INDEX_FILE = "tree.npz"
+
+
+class LineageTree:
+    """
+    Lineage tree stored as a parent array, with nodes in preorder.
+
+    Because nodes are in preorder, the descendants of a node are the
+    contiguous block of nodes that follows it.
+    """
+
+    def __init__(self, names, parents):
+        self.names = list(names)
+        self.parents = np.asarray(parents, dtype=np.int32)
+
+        # Number of nodes in the subtree of each node, including itself
+        self.sizes = np.ones(len(self.names), dtype=np.int32)
+        for i in range(len(self.names) - 1, 0, -1):
+            self.sizes[self.parents[i]] += self.sizes[i]
+
+        # Names that appear more than once can't be looked up
+        self.index = {}
+        duplicates = set()
+        for i, name in enumerate(self.names):
+            if name in self.index:
+                duplicates.add(name)
+            self.index[name] = i
+        for name in duplicates:
+            del self.index[name]
+
+    @classmethod
+    def from_phylo(cls, tree):
+        """Convert a Bio.Phylo tree or clade."""
+
+        root = tree.root if hasattr(tree, "root") else tree
+        names, parents = [], []
+        stack = [(root, -1)]
+        while stack:
+            clade, parent = stack.pop()
+            parents.append(parent)
+            names.append(clade.name)
+            # Reversed, so that children are visited left to right
+            stack += [(child, len(names) - 1) for child in reversed(clade.clades)]
+
+        return cls(names, parents)
+
+    def descendants(self, name):
+        """
+        Return the names of a lineage and all of its descendants (preorder).
+        Returns an empty list if the lineage is not found exactly once.
+        """
+        i = self.index.get(name)
+        if i is None:
+            return []
+        return self.names[i : i + self.sizes[i]]
+
+    def write(self, path):
+        """Write the parent array and names in numpy's binary format."""
+        with open(path, "wb") as outfile:
+            # Unnamed nodes are stored as empty strings
+            names = np.array([name if name else "" for name in self.names])
+            np.savez_compressed(outfile, names=names, parents=self.parents)
+
+
+def read_lineage_tree(path):
+    """
+    Read a lineage tree, from the binary index (.npz) or a newick file.
+    """
+    if path.endswith(".npz"):
+        with np.load(path, allow_pickle=False) as data:
+            return LineageTree(data["names"].tolist(), data["parents"])
+
+    from Bio import Phylo
+
+    return LineageTree.from_phylo(Phylo.read(path, "newick"))
+
+
+def build_tree(lineages, aliasor):
+    """
+    Construct the nomenclature tree, attaching each lineage to its parent.
+    """
+
+    from Bio.Phylo.BaseTree import Clade
+
+    # Create a tree with a root node "MRCA"
+    tree = Clade(name="MRCA", clades=[], branch_length=1)
+    # Add an "X" parent for recombinants
+    clade = Clade(name="X", clades=[], branch_length=1)
+    tree.clades.append(clade)
+
+    # Clades by name, to look up parents without searching the tree
+    clades = {"MRCA": [tree], "X": [clade]}
+
+    for lineage in lineages:
+
+        # Identify the parent
+        lineage_uncompress = aliasor.uncompress(lineage)
+        parent_uncompress = ".".join(lineage_uncompress.split(".")[0:-1])
+        parent = aliasor.compress(parent_uncompress)
+
+        # Manual parents setting for A and B
+        if lineage == "A":
+            parent = "MRCA"
+
+        elif lineage == "B":
+            parent = "A"
+
+        # Special handling for recombinants
+        elif lineage.startswith("X") and parent == "":
+            parent = "X"
+
+        parent_clade = clades.get(parent, [])
+        # If we found a parent, as long as the input list is formatted correctly
+        # this should always be true
+        if len(parent_clade) == 1:
+            parent_clade = parent_clade[0]
+            clade = Clade(name=lineage, clades=[], branch_length=1)
+            parent_clade.clades.append(clade)
+            clades.setdefault(lineage, []).append(clade)
+
+    return tree
+
 
 @click.command()
 @click.option("--output", help="Output newick phylogeny.", required=True)
-def main(output):
+@click.option(
+    "--output-index",
+    help="Output binary index of the phylogeny (npz), for fast loading.",
+    required=False,
+)
+@click.option(
+    "--cache-dir",
+    help="Reuse the tree from this directory if the lineage notes are unchanged.",
+    required=False,
+)
+def main(output, output_index, cache_dir):
     """Create a nomenclature tree of pango lineages."""
 
+    import requests
+    from Bio import Phylo
+    from pango_aliasor.aliasor import Aliasor
+
     # Create output directory if it doesn't exist
     outdir = os.path.dirname(output)
     if not os.path.exists(outdir) and outdir != "":
@@ -29,6 +170,30 @@ def main(output):
     print("Downloading list of lineages: {}".format(LINEAGES_URL))
     r = requests.get(LINEAGES_URL)
     lineage_text = r.text
+    checksum = hashlib.sha256(lineage_text.encode()).hexdigest()
+
+    # -------------------------------------------------------------------------
+    # Reuse the cached tree if the lineage notes are unchanged
+
+    if cache_dir:
+        checksum_path = os.path.join(cache_dir, CACHE_CHECKSUM_FILE)
+        tree_path = os.path.join(cache_dir, CACHE_TREE_FILE)
+        index_path = os.path.join(cache_dir, CACHE_INDEX_FILE)
+        cached_checksum = None
+        if os.path.exists(checksum_path):
+            with open(checksum_path) as infile:
+                cached_checksum = infile.read().strip()
+
+        if (
+            cached_checksum == checksum
+            and os.path.exists(tree_path)
+            and os.path.exists(index_path)
+        ):
+            print("Reusing cached tree: {}".format(tree_path))
+            shutil.copyfile(tree_path, output)
+            if output_index:
+                shutil.copyfile(index_path, output_index)
+            return
 
     # Convert the text table to list
     lineages = []
@@ -48,38 +213,8 @@ def main(output):
     # Construct Tree
 
     print("Constructing tree.")
-
-    # Create a tree with a root node "MRCA"
-    tree = Clade(name="MRCA", clades=[], branch_length=1)
-    # Add an "X" parent for recombinants
-    clade = Clade(name="X", clades=[], branch_length=1)
-    tree.clades.append(clade)
-
-    for lineage in lineages:
-
-        # Identify the parent
-        lineage_uncompress = aliasor.uncompress(lineage)
-        parent_uncompress = ".".join(lineage_uncompress.split(".")[0:-1])
-        parent = aliasor.compress(parent_uncompress)
-
-        # Manual parents setting for A and B
-        if lineage == "A":
-            parent = "MRCA"
-
-        elif lineage == "B":
-            parent = "A"
-
-        # Special handling for recombinants
-        elif lineage.startswith("X") and parent == "":
-            parent = "X"
-
-        parent_clade = [c for c in tree.find_clades(parent)]
-        # If we found a parent, as long as the input list is formatted correctly
-        # this should always be true
-        if len(parent_clade) == 1:
-            parent_clade = parent_clade[0]
-            clade = Clade(name=lineage, clades=[], branch_length=1)
-            parent_clade.clades.append(clade)
+    tree = build_tree(lineages, aliasor)
+    lineage_tree = LineageTree.from_phylo(tree)
 
     # -------------------------------------------------------------------------
     # Export
@@ -88,6 +223,19 @@ def main(output):
     print("Exporting tree: {}".format(tree_outpath))
     Phylo.write(tree, tree_outpath, "newick")
 
+    if output_index:
+        print("Exporting tree index: {}".format(output_index))
+        lineage_tree.write(output_index)
+
+    if cache_dir:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        shutil.copyfile(tree_outpath, tree_path)
+        lineage_tree.write(index_path)
+        # Write the checksum last, so an interrupted copy is never reused
+        with open(checksum_path, "w") as outfile:
+            outfile.write(checksum + "\n")
+
 
 if __name__ == "__main__":
     main()
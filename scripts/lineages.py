@@ -2,7 +2,7 @@
 import click
 import os
 import pandas as pd
-from datetime import datetime, date
+from dates import parse_dates
 import statistics
 
 # Hard-coded constants
@@ -32,6 +32,20 @@ LINEAGE_COLS = [
     "cov-spectrum_query",
 ]
 
+# Columns that are the same for all sequences in a cluster
+FIRST_COLS = [
+    "status",
+    "lineage",
+    "recombinant_lineage_curated",
+    "parents_clade",
+    "parents_lineage",
+    "parents_lineage_confidence",
+    "breakpoints",
+    "issue",
+    "cluster_privates",
+    "cov-spectrum_query",
+]
+
 
 @click.command()
 @click.option(
@@ -76,99 +90,57 @@ def main(
     # Issue #168 NULL dates are allowed
     # Set to today instead
     # https://github.com/ktmeaton/ncov-recombinant/issues/168
-    seq_date = []
-    for d in list(df["date"]):
-        try:
-            d = datetime.strptime(d, "%Y-%m-%d").date()
-        except ValueError:
-            # Set NA dates to today
-            d = date.today()
-
-        seq_date.append(d)
-    df["datetime"] = seq_date
+    df["datetime"] = parse_dates(df["date"])
 
     # -------------------------------------------------------------------------
     # Create the recombinants table (recombinants.tsv)
     # -------------------------------------------------------------------------
 
-    recombinants_data = {col: [] for col in LINEAGE_COLS}
-    recombinants_data[geo] = []
-
-    for cluster_id in set(df["cluster_id"]):
-
-        match_df = df[df["cluster_id"] == cluster_id]
-
-        earliest_date = min(match_df["datetime"])
-        latest_date = max(match_df["datetime"])
-        sequences = len(match_df)
+    # Summarize immune stats by mean, immune stats can be NA
+    for col in ["immune_escape", "ace2_binding"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
 
+    recombinants_df = df.groupby("cluster_id", sort=False).agg(
+        **{col: (col, "first") for col in FIRST_COLS},
+        sequences=("cluster_id", "size"),
+        earliest_date=("datetime", "min"),
+        latest_date=("datetime", "max"),
         # Summaize rbd_level by the mode
-        rbd_level = statistics.mode(match_df["rbd_level"])
-        # Summarize immune escape by mean, Immune escape can be NA
-        immune_escape = [
-            val for val in match_df["immune_escape"].values if val != NO_DATA_CHAR
-        ]
-        if len(immune_escape) > 0:
-            immune_escape = statistics.mean(match_df["immune_escape"].values)
-        else:
-            immune_escape = NO_DATA_CHAR
-
-        # Summarize ace2_binding by mean, ace2_binding can be NA
-        ace2_binding = [
-            val for val in match_df["ace2_binding"].values if val != NO_DATA_CHAR
-        ]
-        if len(ace2_binding) > 0:
-            ace2_binding = statistics.mean(match_df["ace2_binding"].values)
-        else:
-            ace2_binding = NO_DATA_CHAR
-
-        recombinants_data["cluster_id"].append(cluster_id)
-        recombinants_data["status"].append(match_df["status"].values[0])
-        recombinants_data["lineage"].append(match_df["lineage"].values[0])
-        recombinants_data["recombinant_lineage_curated"].append(
-            match_df["recombinant_lineage_curated"].values[0]
+        rbd_level=("rbd_level", statistics.mode),
+        immune_escape=("immune_escape", "mean"),
+        ace2_binding=("ace2_binding", "mean"),
+    )
+    recombinants_df[["immune_escape", "ace2_binding"]] = recombinants_df[
+        ["immune_escape", "ace2_binding"]
+    ].astype(object)
+    recombinants_df.fillna(NO_DATA_CHAR, inplace=True)
+
+    # Count sequences by geography, listed alphabetically
+    geo_df = df.groupby(["cluster_id", geo], sort=False).size().reset_index()
+    geo_df.sort_values(by=geo, kind="mergesort", inplace=True)
+    geo_df["geo_counts"] = [
+        "{} ({})".format(loc, num_sequences)
+        for loc, num_sequences in zip(geo_df[geo], geo_df[0])
+    ]
+    recombinants_df[geo] = geo_df.groupby("cluster_id", sort=False)["geo_counts"].agg(
+        ", ".join
+    )
+
+    # Growth Calculation
+    recombinants_df["growth_score"] = [
+        round(sequences / ((latest_date - earliest_date).days + 1), 2)
+        for sequences, earliest_date, latest_date in zip(
+            recombinants_df["sequences"],
+            recombinants_df["earliest_date"],
+            recombinants_df["latest_date"],
         )
-        recombinants_data["parents_clade"].append(match_df["parents_clade"].values[0])
-        recombinants_data["parents_lineage"].append(
-            match_df["parents_lineage"].values[0]
-        )
-        recombinants_data["parents_lineage_confidence"].append(
-            match_df["parents_lineage_confidence"].values[0]
-        )
-        recombinants_data["breakpoints"].append(match_df["breakpoints"].values[0])
-        recombinants_data["issue"].append(match_df["issue"].values[0])
-        recombinants_data["sequences"].append(sequences)
-        recombinants_data["earliest_date"].append(earliest_date)
-        recombinants_data["latest_date"].append(latest_date)
-        recombinants_data["cluster_privates"].append(
-            match_df["cluster_privates"].values[0]
-        )
-        recombinants_data["cov-spectrum_query"].append(
-            match_df["cov-spectrum_query"].values[0]
-        )
-        # Immune stats
-        recombinants_data["rbd_level"].append(rbd_level)
-        recombinants_data["immune_escape"].append(immune_escape)
-        recombinants_data["ace2_binding"].append(ace2_binding)
-
-        geo_list = list(set(match_df[geo]))
-        geo_list.sort()
-        geo_counts = []
-        for loc in geo_list:
-            loc_df = match_df[match_df[geo] == loc]
-            num_sequences = len(loc_df)
-            geo_counts.append("{} ({})".format(loc, num_sequences))
-
-        recombinants_data[geo].append(", ".join(geo_counts))
-
-        # Growth Calculation
-        growth_score = 0
-        duration = (latest_date - earliest_date).days + 1
-        growth_score = round(sequences / duration, 2)
-        recombinants_data["growth_score"].append(growth_score)
-
-    recombinants_df = pd.DataFrame(recombinants_data)
-    recombinants_df.sort_values(by="sequences", ascending=False, inplace=True)
+    ]
+
+    recombinants_df.reset_index(inplace=True)
+    recombinants_df = recombinants_df[LINEAGE_COLS + [geo]]
+    recombinants_df.sort_values(
+        by="sequences", ascending=False, kind="mergesort", inplace=True
+    )
     recombinants_df.to_csv(output, index=False, sep="\t")
 
 
@@ -6,7 +6,14 @@ import copy
 from datetime import datetime
 import numpy as np
 from functions import create_logger
-from Bio import Phylo
+from lineage_tree import read_lineage_tree
+from substitutions import (
+    NO_DATA_CODE,
+    decode_subs,
+    encode_subs,
+    group_subs,
+    sub_positions,
+)
 
 # Hard-coded constants
 
@@ -50,6 +57,201 @@ LINELIST_COLS = {
 }
 
 
+def read_lineage_issues(issues_df):
+    """
+    Create a lookup of the pango-designation issue of each lineage.
+
+    :param issues_df: pango-designation issues dataframe
+    :return: dict of issues by lineage, the first issue if there are several
+    """
+
+    lineage_issues = {}
+    for issue, lineage in zip(issues_df["issue"], issues_df["lineage"]):
+        lineage_issues.setdefault(lineage, issue)
+    return lineage_issues
+
+
+def find_issues(lineages, lineage_issues):
+    """
+    Find the pango-designation issues of a list of lineages.
+
+    :param lineages: list of lineages
+    :param lineage_issues: dict of issues by lineage
+    :return: str, csv of issues
+    """
+
+    issues = []
+
+    for lin in set(lineages):
+        # There are two weird examples in sc2rf lineages
+        # which are proposed808-1 and proposed808-2
+        # because two lineages got the same issue post
+        # Transform proposed808-1 to proposed808
+        if lin.startswith("proposed") and "-" in lin:
+            lin = lin.split("-")[0]
+
+        if lin in lineage_issues:
+            issues.append(lineage_issues[lin])
+
+    if len(issues) >= 1:
+        issue = ",".join([str(iss) for iss in issues])
+    else:
+        issue = NO_DATA_CHAR
+
+    return issue
+
+
+def reconcile_lineage(
+    lineage_sc2rf,
+    lineage_nextclade,
+    status,
+    has_parents,
+    has_breakpoints,
+    lineage_issues,
+    tree=None,
+):
+    """
+    Reconcile the lineage calls of sc2rf and nextclade into a consensus.
+
+    :param lineage_sc2rf: str, csv of sc2rf lineages
+    :param lineage_nextclade: str, nextclade lineage
+    :param status: str, sc2rf status (ex. positive)
+    :param has_parents: bool, sc2rf found parents (clade)
+    :param has_breakpoints: bool, sc2rf found breakpoints
+    :param lineage_issues: dict of pango-designation issues by lineage
+    :param tree: LineageTree, used to find sublineages (optional)
+    :return: lineage, status, issue, classifier
+    """
+
+    is_recombinant = False
+
+    # ---------------------------------------------------------------------
+    # Lineage Assignments (Designated)
+
+    # sc2rf can be multiple lineages, same breakpoint, multiple possible lineages
+    lineages_sc2rf = lineage_sc2rf.split(",")
+
+    # Rename sc2rf lineages for alts (ex. ARTIC XBB)
+    for i, l_sc2rf in enumerate(lineages_sc2rf):
+        if l_sc2rf in SC2RF_LINEAGE_ALT:
+            lineages_sc2rf[i] = SC2RF_LINEAGE_ALT[l_sc2rf]
+
+    # Save a flag to indicate whether nextclade is sublineage of sc2rf
+    nextclade_is_sublineage = False
+
+    # Check if sc2rf confirmed its a recombinant
+    if status == "positive":
+        is_recombinant = True
+
+    # Case #1: By default use nextclade
+    lineage = lineage_nextclade
+    classifier = "nextclade"
+
+    # Case #2: unless sc2rf found a definitive match, that is not a "proposed"
+    if (
+        lineages_sc2rf[0] != NO_DATA_CHAR
+        and len(lineages_sc2rf) == 1
+        and not lineages_sc2rf[0].startswith("proposed")
+    ):
+
+        # Case #2a. nextclade is a sublineage of sc2rf
+        if tree is not None:
+            sc2rf_lineage_children = tree.descendants(lineages_sc2rf[0])
+            # Make sure we found this lineage in the tree
+            if len(sc2rf_lineage_children) > 0:
+                # check if nextclade is sublineage of sc2rf
+                if lineage_nextclade in sc2rf_lineage_children:
+                    nextclade_is_sublineage = True
+                    # We don't need to update the lineage, since we
+                    # use nextclade by default
+
+        # Case #2b. nextclade is not a sublineage of sc2rf
+        if not nextclade_is_sublineage:
+            lineage = lineages_sc2rf[0]
+            classifier = "sc2rf"
+
+    # Case #1: designated recombinants called as false_positive
+    # As of v0.4.0, sometimes XN and XP will be detected by sc2rf, but then labeled
+    # as a false positive, since all parental regions are collapsed
+    if (lineage == "XN" or lineage == "XP") and has_parents:
+        status = "positive"
+        is_recombinant = True
+
+        # If we actually found breakpoints but not sc2rf lineage, this is a "-like"
+        if has_breakpoints and lineages_sc2rf[0] == NO_DATA_CHAR:
+            lineage = lineage + "-like"
+
+    # Case #2: designated recombinants that sc2rf cannot detect
+    # As of v0.4.2, XAS cannot be detected by sc2rf
+    elif not has_parents and (lineage == "XAS"):
+        status = "positive"
+        is_recombinant = True
+
+    # Case #3: nextclade thinks it's a recombinant but sc2rf doesn't
+    elif lineage.startswith("X") and not has_breakpoints:
+        status = "false_positive"
+
+    # Case #4: nextclade and sc2rf disagree, flag it as X*-like
+    elif (
+        len(lineages_sc2rf) >= 1
+        and lineage.startswith("X")
+        and lineage not in lineages_sc2rf
+        and not nextclade_is_sublineage
+    ):
+        lineage = lineage + "-like"
+
+    # ---------------------------------------------------------------------
+    # Issue
+
+    # Identify the possible pango-designation issue this is related to
+    issue = find_issues(lineages_sc2rf + [lineage_nextclade], lineage_issues)
+
+    # ---------------------------------------------------------------------
+    # Status
+
+    # Fine-tune the status of a positive recombinant
+    if is_recombinant:
+        if lineage.startswith("X") and not lineage.endswith("like"):
+            status = "designated"
+        elif issue != NO_DATA_CHAR:
+            status = "proposed"
+        else:
+            status = "unpublished"
+
+    return lineage, str(status), str(issue), classifier
+
+
+def merge_privates(reversions, labeled, unlabeled):
+    """
+    Merge the private substitutions of nextclade into one array per sequence,
+    sorted by coordinate.
+
+    :param reversions: array of csv reversion substitutions
+    :param labeled: array of csv labeled substitutions (ex. C123T|BA.2)
+    :param unlabeled: array of csv unlabeled substitutions
+    :return: list of arrays of substitution codes
+    """
+
+    codes = pd.concat([encode_subs(subs) for subs in [reversions, labeled, unlabeled]])
+    codes = codes[codes != NO_DATA_CODE]
+
+    privates_df = pd.DataFrame(
+        {
+            "row": codes.index,
+            "coord": sub_positions(codes.values),
+            "code": codes.values,
+        }
+    )
+    # Later substitutions at the same coordinate take precedence
+    privates_df.drop_duplicates(subset=["row", "coord"], keep="last", inplace=True)
+    privates_df.sort_values(by=["row", "coord"], inplace=True)
+
+    return group_subs(
+        pd.Series(privates_df["code"].values, index=privates_df["row"].values),
+        len(reversions),
+    )
+
+
 @click.command()
 @click.option("--input", help="Summary (tsv).", required=True)
 @click.option(
@@ -82,7 +284,7 @@ LINELIST_COLS = {
 )
 @click.option(
     "--lineage-tree",
-    help="Newick tree of pangolin lineage hierarchies",
+    help="Tree of pangolin lineage hierarchies (newick or npz index)",
     required=False,
 )
 @click.option("--log", help="Logfile", required=False)
@@ -118,6 +320,7 @@ def main(
     logger.info("Parsing issues: {}".format(issues))
     issues_df = pd.read_csv(issues, sep="\t")
     issues_df.fillna(NO_DATA_CHAR, inplace=True)
+    lineage_issues = read_lineage_issues(issues_df)
 
     # (Optional) Extract columns from summary
     if extra_cols:
@@ -125,9 +328,10 @@ def main(
             LINELIST_COLS[col] = col
 
     # (Optional) phylogenetic tree of pangolineage lineages
+    tree = None
     if lineage_tree:
         logger.info("Parsing lineage tree: {}".format(lineage_tree))
-        tree = Phylo.read(lineage_tree, "newick")
+        tree = read_lineage_tree(lineage_tree)
 
     cols_list = list(LINELIST_COLS.keys())
 
@@ -154,169 +358,46 @@ def main(
 
     logger.info("Comparing lineage assignments across tools")
 
-    for rec in linelist_df.iterrows():
-        strain = rec[1]["strain"]
-        status = rec[1]["status_sc2rf"]
-        breakpoints = rec[1]["breakpoints"]
-
-        issue = NO_DATA_CHAR
-        is_recombinant = False
-        lineage = NO_DATA_CHAR
-
-        # ---------------------------------------------------------------------
-        # Lineage Assignments (Designated)
-
-        # Nextclade can only have one lineage assignment
-        lineage_nextclade = rec[1]["lineage_nextclade"]
-
-        # sc2rf can be multiple lineages, same breakpoint, multiple possible lineages
-        lineages_sc2rf = rec[1]["lineage_sc2rf"].split(",")
-        status = rec[1]["status_sc2rf"]
-
-        # Rename sc2rf lineages for alts (ex. ARTIC XBB)
-        for i, l_sc2rf in enumerate(lineages_sc2rf):
-            if l_sc2rf in SC2RF_LINEAGE_ALT:
-                lineages_sc2rf[i] = SC2RF_LINEAGE_ALT[l_sc2rf]
-
-        # Save a flag to indicate whether nextclade is sublineage of sc2rf
-        nextclade_is_sublineage = False
-
-        # Check if sc2rf confirmed its a recombinant
-        if status == "positive":
-            is_recombinant = True
-
-        # Case #1: By default use nextclade
-        lineage = lineage_nextclade
-        classifier = "nextclade"
-
-        # Case #2: unless sc2rf found a definitive match, that is not a "proposed"
-        if (
-            lineages_sc2rf[0] != NO_DATA_CHAR
-            and len(lineages_sc2rf) == 1
-            and not lineages_sc2rf[0].startswith("proposed")
-        ):
-
-            # Case #2a. nextclade is a sublineage of sc2rf
-            if lineage_tree:
-                sc2rf_lineage_tree = [c for c in tree.find_clades(lineages_sc2rf[0])]
-                # Make sure we found this lineage in the tree
-                if len(sc2rf_lineage_tree) == 1:
-                    sc2rf_lineage_tree = sc2rf_lineage_tree[0]
-                    sc2rf_lineage_children = [
-                        c.name for c in sc2rf_lineage_tree.find_clades()
-                    ]
-                    # check if nextclade is sublineage of sc2rf
-                    if lineage_nextclade in sc2rf_lineage_children:
-                        nextclade_is_sublineage = True
-                        # We don't need to update the lineage, since we
-                        # use nextclade by default
-
-            # Case #2b. nextclade is not a sublineage of sc2rf
-            if not nextclade_is_sublineage:
-                lineage = lineages_sc2rf[0]
-                classifier = "sc2rf"
-
-        # Case #1: designated recombinants called as false_positive
-        # As of v0.4.0, sometimes XN and XP will be detected by sc2rf, but then labeled
-        # as a false positive, since all parental regions are collapsed
-        parents_clade = rec[1]["parents_clade"]
-        if (lineage == "XN" or lineage == "XP") and parents_clade != NO_DATA_CHAR:
-            status = "positive"
-            is_recombinant = True
-
-            # If we actually found breakpoints but not sc2rf lineage, this is a "-like"
-            if breakpoints != NO_DATA_CHAR and lineages_sc2rf[0] == NO_DATA_CHAR:
-                lineage = lineage + "-like"
-
-        # Case #2: designated recombinants that sc2rf cannot detect
-        # As of v0.4.2, XAS cannot be detected by sc2rf
-        elif parents_clade == NO_DATA_CHAR and (lineage == "XAS"):
-            status = "positive"
-            is_recombinant = True
-
-        # Case #3: nextclade thinks it's a recombinant but sc2rf doesn't
-        elif lineage.startswith("X") and breakpoints == NO_DATA_CHAR:
-            status = "false_positive"
-
-        # Case #4: nextclade and sc2rf disagree, flag it as X*-like
-        elif (
-            len(lineages_sc2rf) >= 1
-            and lineage.startswith("X")
-            and lineage not in lineages_sc2rf
-            and not nextclade_is_sublineage
-        ):
-            lineage = lineage + "-like"
-
-        # ---------------------------------------------------------------------
-        # Issue
-
-        # Identify the possible pango-designation issue this is related to
-        issues = []
-
-        for lin in set(lineages_sc2rf + [lineage_nextclade]):
-            # There are two weird examples in sc2rf lineages
-            # which are proposed808-1 and proposed808-2
-            # because two lineages got the same issue post
-            # Transform proposed808-1 to proposed808
-            if lin.startswith("proposed") and "-" in lin:
-                lin = lin.split("-")[0]
-
-            if lin in list(issues_df["lineage"]):
-                match = issues_df[issues_df["lineage"] == lin]
-                issue = match["issue"].values[0]
-                issues.append(issue)
-
-        if len(issues) >= 1:
-            issue = ",".join([str(iss) for iss in issues])
-        else:
-            issue = NO_DATA_CHAR
-
-        # ---------------------------------------------------------------------
-        # Private Substitutions
-
-        privates = []
-
-        # The private subs are only informative if we're using the nextclade lineage
-        if classifier == "nextclade":
-            reversions = rec[1]["subs_reversion"].split(",")
-            labeled = rec[1]["subs_labeled"].split(",")
-            unlabeled = rec[1]["subs_unlabeled"].split(",")
-
-            privates_dict = {}
-
-            for sub in reversions + labeled + unlabeled:
-                if sub == NO_DATA_CHAR:
-                    continue
-                # Labeled subs have special formatting
-                if "|" in sub:
-                    sub = sub.split("|")[0]
-                coord = int(sub[1:-1])
-                privates_dict[coord] = sub
-
-            # Convert back to sorted list
-            for coord in sorted(privates_dict):
-                sub = privates_dict[coord]
-                privates.append(sub)
-
-        # ---------------------------------------------------------------------
-        # Status
-
-        # Fine-tune the status of a positive recombinant
-        if is_recombinant:
-            if lineage.startswith("X") and not lineage.endswith("like"):
-                status = "designated"
-            elif issue != NO_DATA_CHAR:
-                status = "proposed"
-            else:
-                status = "unpublished"
-
-        # ---------------------------------------------------------------------
-        # Update Dataframe
-
-        linelist_df.at[rec[0], "lineage"] = lineage
-        linelist_df.at[rec[0], "status"] = str(status)
-        linelist_df.at[rec[0], "issue"] = str(issue)
-        linelist_df.at[rec[0], "privates"] = privates
+    # Most sequences share the same few combinations of lineage calls, so the
+    # consensus is computed once per unique combination and broadcast back
+    consensus_keys = pd.Series(
+        list(
+            zip(
+                linelist_df["lineage_sc2rf"],
+                linelist_df["lineage_nextclade"],
+                linelist_df["status_sc2rf"],
+                linelist_df["parents_clade"] != NO_DATA_CHAR,
+                linelist_df["breakpoints"] != NO_DATA_CHAR,
+            )
+        ),
+        dtype="object",
+    )
+    codes, uniques = pd.factorize(consensus_keys, sort=False)
+    consensus_df = pd.DataFrame(
+        [reconcile_lineage(*key, lineage_issues, tree=tree) for key in uniques],
+        columns=["lineage", "status", "issue", "classifier"],
+    )
+    consensus_df = consensus_df.iloc[codes]
+
+    linelist_df["lineage"] = consensus_df["lineage"].values
+    linelist_df["status"] = consensus_df["status"].values
+    linelist_df["issue"] = consensus_df["issue"].values
+
+    # The private subs are only informative if we're using the nextclade lineage,
+    # so they are only parsed for the sequences classified by nextclade
+    # Substitutions are stored as integer codes until they are written out
+    is_nextclade = consensus_df["classifier"].values == "nextclade"
+    privates = iter(
+        merge_privates(
+            linelist_df["subs_reversion"].values[is_nextclade],
+            linelist_df["subs_labeled"].values[is_nextclade],
+            linelist_df["subs_unlabeled"].values[is_nextclade],
+        )
+    )
+    no_privates = np.array([], dtype=np.uint32)
+    linelist_df["privates"] = [
+        next(privates) if nextclade else no_privates for nextclade in is_nextclade
+    ]
 
     # -------------------------------------------------------------------------
     # Lineage Assignment (Undesignated)
@@ -333,12 +414,32 @@ def main(
 
     # Create a dictionary of recombinant lineages seen
     rec_seen = {}
-    seen_i = 0
-
-    for rec in linelist_df.iterrows():
-
-        strain = rec[1]["strain"]
-        status = rec[1]["status"]
+    # The index in rec_seen of each lineage, parents, and breakpoints combination
+    rec_seen_i = {}
+
+    # in v0.5.2, we use all subs
+    # "C241T,A385G,G407A,..."
+    subs_codes = group_subs(encode_subs(linelist_df["subs"]), len(linelist_df))
+
+    for (
+        strain,
+        status,
+        lineage,
+        parents_clade,
+        parents_lineage,
+        breakpoints,
+        privates,
+        subs,
+    ) in zip(
+        linelist_df["strain"],
+        linelist_df["status"],
+        linelist_df["lineage"],
+        linelist_df["parents_clade"],
+        linelist_df["parents_lineage"],
+        linelist_df["breakpoints"],
+        linelist_df["privates"],
+        subs_codes,
+    ):
 
         if status == "negative" or status == "false_positive":
             continue
@@ -347,11 +448,6 @@ def main(
         # 2. Parents by clade (ex. 21K,21L)
         # 3. Parents by lineage (ex. BA.1.1,BA.2.3)
         # 4. Breakpoints
-        lineage = rec[1]["lineage"]
-        parents_clade = rec[1]["parents_clade"]
-        parents_lineage = rec[1]["parents_lineage"]
-        breakpoints = rec[1]["breakpoints"]
-        privates = rec[1]["privates"]
 
         # in v0.5.1, we used the parents subs
         # Format substitutions into a tidy list
@@ -365,24 +461,9 @@ def main(
         # parents_subs_list = parents_subs_str.split(",")
         # # ["C234T","A54354G","A423T"]
 
-        # in v0.5.2, we use all subs
-        # "C241T,A385G,G407A,..."
-        subs_list = rec[1]["subs"].split(",")
-        # ["C241T","A385G","G407A", ...]
-
-        match = None
-
-        for i in rec_seen:
-            rec_lin = rec_seen[i]
-            # lineage, parents, breakpoints, and subs have to match
-            if (
-                rec_lin["lineage"] == lineage
-                and rec_lin["parents_clade"] == parents_clade
-                and rec_lin["parents_lineage"] == parents_lineage
-                and rec_lin["breakpoints"] == breakpoints
-            ):
-                match = i
-                break
+        # lineage, parents, breakpoints, and subs have to match
+        key = (lineage, parents_clade, parents_lineage, breakpoints)
+        match = rec_seen_i.get(key)
 
         # If we found a match, increment our dict
         if match is not None:
@@ -399,29 +480,24 @@ def main(
             #        rec_seen[match]["cov-spectrum_query"].remove(sub)
 
             # in v0.5.2, cov-spectrum_query is based on all subs
-            subs = rec_seen[match]["cov-spectrum_query"]
-            for sub in subs:
-                if sub not in subs_list:
-                    rec_seen[match]["cov-spectrum_query"].remove(sub)
+            rec_seen[match]["cov-spectrum_query"].intersection_update(subs.tolist())
 
             # Adjust the private subs to include the new strain
-            lineage_private_subs = rec_seen[match]["privates"]
-            for sub in lineage_private_subs:
-                if sub not in privates:
-                    rec_seen[match]["privates"].remove(sub)
+            rec_seen[match]["privates"].intersection_update(privates.tolist())
 
         # This is the first appearance, initialize values
         else:
-            rec_seen[seen_i] = {
+            match = len(rec_seen)
+            rec_seen_i[key] = match
+            rec_seen[match] = {
                 "lineage": lineage,
                 "breakpoints": breakpoints,
                 "parents_clade": parents_clade,
                 "parents_lineage": parents_lineage,
                 "strains": [strain],
-                "cov-spectrum_query": subs_list,
-                "privates": privates,
+                "cov-spectrum_query": set(subs.tolist()),
+                "privates": set(privates.tolist()),
             }
-            seen_i += 1
 
     # -------------------------------------------------------------------------
     # Cluster ID
@@ -437,16 +513,14 @@ def main(
         earliest_strain = None
 
         rec_strains = rec_seen[i]["strains"]
-        rec_privates = ",".join(rec_seen[i]["privates"])
+        rec_privates = ",".join(decode_subs(sorted(rec_seen[i]["privates"])))
         rec_df = linelist_df[linelist_df["strain"].isin(rec_strains)]
 
         earliest_datetime = min(rec_df["date"])
         earliest_strain = rec_df[rec_df["date"] == earliest_datetime]["strain"].values[
             0
         ]
-        subs_query = rec_seen[i]["cov-spectrum_query"]
-        if subs_query != NO_DATA_CHAR:
-            subs_query = ",".join(subs_query)
+        subs_query = ",".join(decode_subs(sorted(rec_seen[i]["cov-spectrum_query"])))
 
         # indices are preserved from the original linelist_df
         for strain in rec_strains:
@@ -538,8 +612,10 @@ def main(
         inplace=True,
     )
 
-    # Convert privates from list to csv
-    linelist_df["privates"] = [",".join(p) for p in linelist_df["privates"]]
+    # Convert privates from codes to csv
+    linelist_df["privates"] = [
+        ",".join(decode_subs(codes)) for codes in linelist_df["privates"]
+    ]
 
     # Recode NA
     linelist_df.fillna(NO_DATA_CHAR, inplace=True)
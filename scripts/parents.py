@@ -2,7 +2,7 @@
 import click
 import os
 import pandas as pd
-from datetime import datetime, date
+from dates import parse_dates
 
 # Hard-coded constants
 
@@ -46,41 +46,25 @@ def main(
     # Issue #168 NULL dates are allowed
     # Set to today instead
     # https://github.com/ktmeaton/ncov-recombinant/issues/168
-    seq_date = []
-    for d in list(df["date"]):
-        try:
-            d = datetime.strptime(d, "%Y-%m-%d").date()
-        except ValueError:
-            # Set NA dates to today
-            d = date.today()
-
-        seq_date.append(d)
-    df["datetime"] = seq_date
+    df["datetime"] = parse_dates(df["date"])
 
     # -------------------------------------------------------------------------
     # Create the parents table (parents.tsv)
     # -------------------------------------------------------------------------
 
-    data = {col: [] for col in PARENTS_COLS}
-
-    for parents_clade in set(df["parents_clade"]):
-
-        match_df = df[df["parents_clade"] == parents_clade]
-
-        if parents_clade == NO_DATA_CHAR:
-            parents_clade = "Unknown"
-
-        earliest_date = min(match_df["datetime"])
-        latest_date = max(match_df["datetime"])
-        sequences = len(match_df)
-
-        data["parents_clade"].append(parents_clade)
-        data["sequences"].append(sequences)
-        data["earliest_date"].append(earliest_date)
-        data["latest_date"].append(latest_date)
-
-    parents_df = pd.DataFrame(data)
-    parents_df.sort_values(by="sequences", ascending=False, inplace=True)
+    parents_df = df.groupby("parents_clade", sort=False).agg(
+        sequences=("parents_clade", "size"),
+        earliest_date=("datetime", "min"),
+        latest_date=("datetime", "max"),
+    )
+    parents_df.reset_index(inplace=True)
+    parents_df["parents_clade"] = parents_df["parents_clade"].replace(
+        NO_DATA_CHAR, "Unknown"
+    )
+    parents_df = parents_df[PARENTS_COLS]
+    parents_df.sort_values(
+        by="sequences", ascending=False, kind="mergesort", inplace=True
+    )
 
     outpath = os.path.join(outdir, "parents.tsv")
     parents_df.to_csv(outpath, index=False, sep="\t")
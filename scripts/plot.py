@@ -3,16 +3,19 @@ import click
 import os
 import pandas as pd
 import numpy as np
-import epiweeks
 import matplotlib.pyplot as plt
 from matplotlib import patches, colors
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta
 import sys
 import copy
 from functions import categorical_palette
 import math
 import warnings
+import hashlib
+import json
+import shutil
 from functions import create_logger
+from dates import parse_dates, epiweek_startdate, epiweek_startdates
 import logging
 
 logging.getLogger("matplotlib.font_manager").disabled = True
@@ -64,9 +67,61 @@ LINEAGES_COLS = [
     "latest_date",
 ]
 
+# Compact file of per-plot sequence counts, consumed by report.py
+PLOT_SUMMARY_FILE = "plot_summary.json"
+
+# File extensions of the rendered plots, reused from --cache-dir when unchanged
+PLOT_EXTS = [".png", ".svg"]
+
 plt.rcParams["svg.fonttype"] = "none"
 
 
+def hash_plot_data(tsv_path, render_params):
+    """
+    Checksum a plot table, along with the parameters and code used to render it.
+    """
+    checksum = hashlib.sha256()
+    for path in [tsv_path, os.path.abspath(__file__)]:
+        with open(path, "rb") as infile:
+            checksum.update(infile.read())
+    checksum.update(json.dumps(render_params, sort_keys=True, default=str).encode())
+    return checksum.hexdigest()
+
+
+def restore_cached_plot(cache_dir, label, checksum, out_path):
+    """
+    Copy previously rendered plots to out_path if their checksum matches.
+    Returns True if the plots were restored.
+    """
+    cache_path = os.path.join(cache_dir, label)
+    checksum_path = cache_path + ".sha256"
+
+    if not os.path.exists(checksum_path):
+        return False
+    with open(checksum_path) as infile:
+        if infile.read().strip() != checksum:
+            return False
+    for ext in PLOT_EXTS:
+        if not os.path.exists(cache_path + ext):
+            return False
+
+    for ext in PLOT_EXTS:
+        shutil.copyfile(cache_path + ext, out_path + ext)
+    return True
+
+
+def store_cached_plot(cache_dir, label, checksum, out_path):
+    """
+    Save rendered plots and their checksum for reuse in a later run.
+    """
+    cache_path = os.path.join(cache_dir, label)
+    for ext in PLOT_EXTS:
+        shutil.copyfile(out_path + ext, cache_path + ext)
+    # Write the checksum last, so an interrupted copy is never reused
+    with open(cache_path + ".sha256", "w") as outfile:
+        outfile.write(checksum + "\n")
+
+
 @click.command()
 @click.option("--input", help="Recombinant sequences (TSV)", required=True)
 @click.option("--outdir", help="Output directory", required=False, default=".")
@@ -95,6 +150,11 @@ plt.rcParams["svg.fonttype"] = "none"
     help="Only plot clusters/lineages with at least this many sequences.",
     default=1,
 )
+@click.option(
+    "--cache-dir",
+    help="Reuse plots from this directory when their plot data is unchanged.",
+    required=False,
+)
 @click.option("--log", help="Output log file.", required=False)
 def main(
     input,
@@ -105,6 +165,7 @@ def main(
     min_date,
     max_date,
     min_cluster_size,
+    cache_dir,
     log,
 ):
     """Plot recombinant lineages"""
@@ -115,6 +176,8 @@ def main(
     # Creat output directory if it doesn't exist
     if not os.path.exists(outdir):
         os.mkdir(outdir)
+    if cache_dir and not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
 
     # -------------------------------------------------------------------------
     # Import dataframes
@@ -125,33 +188,22 @@ def main(
     # Issue #168 NULL dates are allowed
     # Set to today instead
     # https://github.com/ktmeaton/ncov-recombinant/issues/168
-    seq_date = []
-    for d in list(df["date"]):
-        try:
-            d = datetime.strptime(d, "%Y-%m-%d").date()
-        except ValueError:
-            # Set NA dates to today
-            d = date.today()
-
-        seq_date.append(d)
-    df["datetime"] = seq_date
+    df["datetime"] = parse_dates(df["date"])
 
     df["year"] = [d.year for d in df["datetime"]]
-    df["epiweek"] = [
-        epiweeks.Week.fromdate(d, system="cdc").startdate() for d in df["datetime"]
-    ]
+    df["epiweek"] = epiweek_startdates(df["datetime"])
 
     # Filter on weeks reporting
     logger.info("Filtering on data")
     if max_date:
         max_datetime = datetime.strptime(max_date, "%Y-%m-%d")
-        max_epiweek = epiweeks.Week.fromdate(max_datetime, system="cdc").startdate()
+        max_epiweek = epiweek_startdate(max_datetime)
     else:
-        max_epiweek = epiweeks.Week.fromdate(datetime.today(), system="cdc").startdate()
+        max_epiweek = epiweek_startdate(datetime.today())
 
     if min_date:
         min_datetime = datetime.strptime(min_date, "%Y-%m-%d")
-        min_epiweek = epiweeks.Week.fromdate(min_datetime, system="cdc").startdate()
+        min_epiweek = epiweek_startdate(min_datetime)
     elif weeks:
         weeks = int(weeks)
         min_epiweek = max_epiweek - timedelta(weeks=(weeks - 1))
@@ -159,9 +211,7 @@ def main(
         # Just need something for empty plots
         min_epiweek = max_epiweek - timedelta(weeks=16)
     else:
-        min_epiweek = epiweeks.Week.fromdate(
-            min(df["epiweek"]), system="cdc"
-        ).startdate()
+        min_epiweek = epiweek_startdate(min(df["epiweek"]))
 
     weeks = int((max_epiweek - min_epiweek).days / 7)
 
@@ -175,25 +225,17 @@ def main(
     # Change status to title case
     df["status"] = [s.title() for s in df["status"]]
 
-    # Get largest lineage
-    largest_lineage = NO_DATA_CHAR
-    largest_lineage_size = 0
-
-    # All record cluster sizes to decided which should be dropped
-    drop_small_clusters_ids = []
+    # Number of sequences of each lineage, in order of first appearance
+    lineage_sizes = df["recombinant_lineage_curated"].value_counts(sort=False)
 
-    for lineage in set(df["recombinant_lineage_curated"]):
-        match_df = df[df["recombinant_lineage_curated"] == lineage]
-        lineage_size = len(match_df)
-        if lineage_size >= largest_lineage_size:
-            largest_lineage = match_df["recombinant_lineage_curated"].values[0]
-            largest_lineage_size = lineage_size
-
-        if lineage_size < min_cluster_size:
-            for i in match_df.index:
-                drop_small_clusters_ids.append(i)
+    # Get largest lineage, ties go to the lineage that appears first
+    largest_lineage = NO_DATA_CHAR
+    if len(lineage_sizes) > 0:
+        largest_lineage = lineage_sizes.idxmax()
 
-    df.drop(labels=drop_small_clusters_ids, axis="rows", inplace=True)
+    # Drop the sequences of lineages (clusters) that are too small
+    cluster_sizes = df["recombinant_lineage_curated"].map(lineage_sizes)
+    df.drop(index=df.index[cluster_sizes < min_cluster_size], inplace=True)
 
     df["parents_clade"] = df["parents_clade"].fillna("Unknown")
     df["parents_lineage"] = df["parents_lineage"].fillna("Unknown")
@@ -203,24 +245,6 @@ def main(
     # -------------------------------------------------------------------------
 
     logger.info("Creating pivot tables")
-    # -------------------------------------------------------------------------
-    # All
-    all_df = pd.pivot_table(
-        data=df.sort_values(by="epiweek"),
-        values="strain",
-        index=["epiweek"],
-        aggfunc="count",
-    )
-    all_df.index.name = None
-    all_df.fillna(0, inplace=True)
-    all_df.insert(0, "epiweek", all_df.index)
-    # Check if it was empty
-    if len(all_df) == 0:
-        all_df.insert(1, "sequences", [])
-        max_epiweek_sequences = 0
-    else:
-        all_df.rename(columns={"strain": "sequences"}, inplace=True)
-        max_epiweek_sequences = max(all_df["sequences"])
 
     # Attempt to dynamically create pivot tables
     plot_dict = {
@@ -267,42 +291,50 @@ def main(
         },
     }
 
+    # Count sequences once for every epiweek and combination of the plotted
+    # (and filtered) columns, each plot table is a slice of this cube
+    cube_cols = []
+    for plot in plot_dict:
+        for col in plot_dict[plot]["cols"] + [plot_dict[plot].get("filter")]:
+            if col and col not in cube_cols:
+                cube_cols.append(col)
+    cube = df.groupby(["epiweek"] + cube_cols, dropna=False).size()
+
+    # All epiweeks of the reporting period, including those without sequences
+    epiweeks = [min_epiweek + timedelta(weeks=i) for i in range(weeks + 1)]
+    epiweek_map = {epiweek: i for i, epiweek in enumerate(epiweeks)}
+
+    epiweek_sequences = cube.groupby(level="epiweek").sum()
+    max_epiweek_sequences = max(epiweek_sequences) if len(epiweek_sequences) else 0
+
     for plot in plot_dict:
 
         logger.info("Creating plot data: {}".format(plot))
         columns = plot_dict[plot]["cols"]
 
         # Several plots need special filtering
+        plot_cube = cube
         if "filter" in plot_dict[plot]:
             filter = plot_dict[plot]["filter"]
             value = plot_dict[plot]["value"]
+            plot_cube = cube[cube.index.get_level_values(filter) == value]
 
-            plot_df = pd.pivot_table(
-                data=df[df[filter] == value].sort_values(by="epiweek"),
-                values="strain",
-                index=["epiweek"],
-                columns=columns,
-                aggfunc="count",
+        if len(plot_cube) > 0:
+            plot_df = (
+                plot_cube.groupby(level=["epiweek"] + columns)
+                .sum()
+                .unstack(columns, fill_value=0)
             )
-
-        # Otherwise no filtering required
         else:
-            plot_df = pd.pivot_table(
-                data=df.sort_values(by="epiweek"),
-                index=["epiweek"],
-                values="strain",
-                aggfunc="count",
-                columns=columns,
-            )
+            plot_df = pd.DataFrame(index=pd.Index([], dtype="object"))
 
+        # Fill in epiweeks with no sequences
+        plot_df = plot_df.reindex(epiweeks, fill_value=0)
         plot_df.index.name = None
-        plot_df.fillna(0, inplace=True)
-
-        # Convert counts from floats to integers
-        plot_df[plot_df.columns] = plot_df[plot_df.columns].astype(int)
+        plot_df.columns.name = None
 
         # Fill in missing levels for RBD
-        if plot == "rbd_level" and len(plot_df) > 0:
+        if plot == "rbd_level" and len(plot_df.columns) > 0:
             # min_level = min(plot_df.columns)
             # max_level = max(plot_df.columns)
             min_level = 0
@@ -320,32 +352,21 @@ def main(
 
         plot_dict[plot]["df"] = plot_df
 
-    # ----------------------------------------------------------
-    # Filter for Reporting Period
-    # -------------------------------------------------------------------------
-
-    # Add empty data for weeks if needed
-    epiweek_map = {}
-    iter_week = min_epiweek
-    iter_i = 0
-    df_list = [plot_dict[plot]["df"] for plot in plot_dict]
-    while iter_week <= max_epiweek:
-
-        for plot_df in df_list:
-
-            if iter_week not in plot_df["epiweek"]:
-                plot_df.at[iter_week, "epiweek"] = iter_week
+    lag_epiweek = max_epiweek - timedelta(weeks=lag)
 
-        # Check if its the largest
-        epiweek_map[iter_week] = iter_i
-        iter_week += timedelta(weeks=1)
-        iter_i += 1
+    # -------------------------------------------------------------------------
+    # Summary
+    # -------------------------------------------------------------------------
 
-    for plot_df in df_list:
-        plot_df.fillna(0, inplace=True)
-        plot_df.sort_values(by="epiweek", axis="index", inplace=True)
+    # Total sequences per category of each plot, for the report
+    logger.info("Creating plot summary")
+    plot_summary = {"largest_lineage": largest_lineage, "plots": {}}
+    for plot in plot_dict:
+        counts = plot_dict[plot]["df"].drop(columns="epiweek").sum()
+        plot_summary["plots"][plot] = {str(c): int(n) for c, n in counts.items()}
 
-    lag_epiweek = max_epiweek - timedelta(weeks=lag)
+    with open(os.path.join(outdir, PLOT_SUMMARY_FILE), "w") as outfile:
+        json.dump(plot_summary, outfile)
 
     # -------------------------------------------------------------------------
     # Plot
@@ -370,6 +391,21 @@ def main(
 
         plot_df.to_csv(out_path + ".tsv", sep="\t", index=False)
 
+        # Reuse the previous plots if the data has not changed
+        if cache_dir:
+            render_params = {
+                "legend_title": legend_title,
+                "weeks": weeks,
+                "lag": lag,
+                "min_epiweek": min_epiweek,
+                "max_epiweek": max_epiweek,
+                "max_epiweek_sequences": max_epiweek_sequences,
+            }
+            checksum = hash_plot_data(out_path + ".tsv", render_params)
+            if restore_cached_plot(cache_dir, label, checksum, out_path):
+                logger.info("Reusing unchanged plot figure: {}".format(plot))
+                continue
+
         # ---------------------------------------------------------------------
         # Sort categories by count
 
@@ -599,6 +635,8 @@ def main(
             plt.tight_layout()
             plt.savefig(out_path + ".png")
             plt.savefig(out_path + ".svg")
+            if cache_dir:
+                store_cached_plot(cache_dir, label, checksum, out_path)
         except UserWarning:
             logger.info("Unable to apply tight_layout, plot will not be saved.")
 
@@ -296,14 +296,26 @@ def main(
     y_tick_labs_lineage = []
 
     num_lineages = len(set(breakpoints_df["lineage"]))
-    lineages_seen = []
 
-    # Iterate through lineages to plot
-    for rec in breakpoints_df.iterrows():
-        lineage = rec[1]["lineage"]
-        if lineage in lineages_seen:
-            continue
-        lineages_seen.append(lineage)
+    # Regions and substitutions of all lineages are drawn as one collection
+    # each, rather than one artist per region and substitution
+    region_rects = []
+    region_colors = []
+    subs_lines = []
+
+    # Extract the substitutions, just taking the first as representative
+    if positives:
+        subs_cols = [lineage_col, cluster_col] if cluster_col else [lineage_col]
+        subs_df = positives_df.drop_duplicates(subset=subs_cols)
+        lineage_subs = dict(
+            zip(
+                subs_df[subs_cols].itertuples(index=False, name=None),
+                subs_df["cov-spectrum_query"],
+            )
+        )
+
+    # Iterate through lineages to plot, in order of first appearance
+    for lineage, lineage_df in breakpoints_df.groupby("lineage", sort=False):
 
         y_tick_locs.append(y + (rect_height / 2))
         lineage_label = lineage.split(" ")[0]
@@ -319,56 +331,53 @@ def main(
 
         y_tick_labs_lineage.append(ylabel)
 
-        lineage_df = breakpoints_df[breakpoints_df["lineage"] == lineage]
-
         # Iterate through regions to plot
-        for rec in lineage_df.iterrows():
-            parent = rec[1]["parent"]
-            start = rec[1]["start"]
-            end = rec[1]["end"]
-
-            color = parents_colors[parent]
-
+        for parent, start, end in zip(
+            lineage_df["parent"], lineage_df["start"], lineage_df["end"]
+        ):
             region_rect = patches.Rectangle(
                 xy=[start, y],
                 width=end - start,
                 height=rect_height,
-                linewidth=1,
-                edgecolor="none",
-                facecolor=color,
             )
-            ax.add_patch(region_rect)
+            region_rects.append(region_rect)
+            region_colors.append(parents_colors[parent])
 
         # Iterate through substitutions to plot
         if positives:
-            positive_rec = positives_df[(positives_df[lineage_col] == lineage_label)]
             # If we're using a cluster id col, further filter on that
             if cluster_col:
-                positive_rec = positive_rec[
-                    (positive_rec[cluster_col] == cluster_id_label)
-                ]
-
-            # Extract the substitutions, just taking the first as representative
-            cov_spectrum_subs = list(positive_rec["cov-spectrum_query"])[0]
+                subs_key = (lineage_label, cluster_id_label)
+            else:
+                subs_key = (lineage_label,)
+            cov_spectrum_subs = lineage_subs.get(subs_key, NO_DATA_CHAR)
 
             if cov_spectrum_subs != NO_DATA_CHAR:
                 # Split into a list, and extract coordinates
                 coord_list = [int(s[1:-1]) for s in cov_spectrum_subs.split(",")]
-                subs_lines = []
                 # Create vertical bars for each sub
                 for coord in coord_list:
                     sub_line = [(coord, y), (coord, y + rect_height)]
                     subs_lines.append(sub_line)
-                # Combine all bars into a collection
-                collection_subs = collections.LineCollection(
-                    subs_lines, color="black", linewidth=0.25
-                )
-                # Add the subs bars to the plot
-                ax.add_collection(collection_subs)
 
         # Jump to the next y coordinate
         y -= y_increment
 
+    # Combine all regions into a collection
+    collection_regions = collections.PatchCollection(
+        region_rects,
+        facecolors=region_colors,
+        edgecolors="none",
+        linewidths=1,
+    )
+    ax.add_collection(collection_regions)
+
+    # Combine all bars into a collection, drawn above the regions
+    collection_subs = collections.LineCollection(
+        subs_lines, color="black", linewidth=0.25
+    )
+    ax.add_collection(collection_subs)
+
     # Axis Limits
     ax.set_xlim(0 - X_BUFF, GENOME_LENGTH + X_BUFF)
     ax.set_ylim(
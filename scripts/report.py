@@ -4,11 +4,13 @@ import pptx
 from pptx.enum.shapes import MSO_SHAPE
 from datetime import date
 import os
+import json
 import pandas as pd
 
 NO_DATA_CHAR = "NA"
 TITLE = "SARS-CoV-2 Recombinants"
 FONT_SIZE_PARAGRAPH = 20
+FONT_SIZE_SUMMARY = 14
 
 RECOMBINANT_STATUS = [
     "designated",
@@ -27,6 +29,74 @@ RECOMBINANT_STATUS = [
 7 ->  Content with caption
 8 ->  Pic with caption
 """
+GRAPH_SLIDE_LAYOUT = 8
+
+# Compact file of per-plot sequence counts, written by plot.py
+PLOT_SUMMARY_FILE = "plot_summary.json"
+
+
+def load_plot_summary(plot_dir, labels):
+    """
+    Load the sequence counts per category of each plot, and the largest lineage.
+
+    Plot directories created without a summary file fall back to summing
+    the plot tables.
+    """
+
+    summary_path = os.path.join(plot_dir, PLOT_SUMMARY_FILE)
+    if os.path.exists(summary_path):
+        with open(summary_path) as infile:
+            plot_summary = json.load(infile)
+        return plot_summary["plots"], plot_summary["largest_lineage"]
+
+    plot_counts = {}
+    largest_lineage = NO_DATA_CHAR
+    for label in labels:
+        df = pd.read_csv(os.path.join(plot_dir, label + ".tsv"), sep="\t")
+
+        # Breakpoints df isn't over time, but by lineage
+        if "epiweek" not in df.columns:
+            continue
+
+        # Largest is special, as it takes the form largest_<lineage>.*
+        if label.startswith("largest_"):
+            largest_lineage = "_".join(label.split("_")[1:])
+            # Replace the _DELIM_ character we added for saving files
+            largest_lineage = largest_lineage.replace("_DELIM_", "/")
+            label = "largest"
+
+        counts = df.drop(columns="epiweek").sum()
+        plot_counts[label] = {str(c): int(n) for c, n in counts.items()}
+
+    return plot_counts, largest_lineage
+
+
+def sort_by_count(counts):
+    """Sort categories by their number of sequences, largest first."""
+    return dict(sorted(counts.items(), key=lambda item: item[1], reverse=True))
+
+
+def add_graph_slide(presentation, layout, title, plot_path):
+    """Add a slide with a title and plot, and return the body placeholder."""
+
+    slide = presentation.slides.add_slide(layout)
+    slide.shapes.title.text_frame.text = title
+    slide.shapes.title.text_frame.paragraphs[0].font.bold = True
+
+    # Plotting may have failed to create an individual figure
+    if os.path.exists(plot_path):
+        slide.placeholders[1].insert_picture(plot_path)
+
+    return slide.placeholders[2]
+
+
+def set_summary_text(body, summary, font_size=FONT_SIZE_SUMMARY):
+    """Write the summary text to a placeholder, with one font size for all runs."""
+
+    body.text_frame.text = summary
+    size = pptx.util.Pt(font_size)
+    for run in [r for p in body.text_frame.paragraphs for r in p.runs]:
+        run.font.size = size
 
 
 @click.command()
@@ -64,42 +134,26 @@ def main(
         os.mkdir(outdir)
     subtitle = "{}\n{}".format(build.title(), date.today())
 
-    # Import dataframes
-    linelist_df = pd.read_csv(linelist, sep="\t")
-
+    # Import the plot summary
     plot_suffix = ".png"
     df_suffix = ".tsv"
     labels = [
         f.replace(df_suffix, "") for f in os.listdir(plot_dir) if f.endswith(df_suffix)
     ]
+    plot_counts, largest_lineage = load_plot_summary(plot_dir, labels)
 
-    plot_dict = {}
+    plot_paths = {}
     for label in labels:
-        plot_dict[label] = {}
-        plot_dict[label]["plot_path"] = os.path.join(plot_dir, label + plot_suffix)
-        plot_dict[label]["df_path"] = os.path.join(plot_dir, label + df_suffix)
-        plot_dict[label]["df"] = pd.read_csv(plot_dict[label]["df_path"], sep="\t")
-
-        # Breakpoints df isn't over time, but by lineage
-        if "epiweek" in plot_dict[label]["df"].columns:
-            plot_dict[label]["df"].index = plot_dict[label]["df"]["epiweek"]
-
         # Largest is special, as it takes the form largest_<lineage>.*
-        if label.startswith("largest_"):
-
-            largest_lineage = "_".join(label.split("_")[1:])
-            # Replace the _DELIM_ character we added for saving files
-            largest_lineage = largest_lineage.replace("_DELIM_", "/")
-
-            plot_dict["largest"] = plot_dict[label]
-            plot_dict["largest"]["lineage"] = largest_lineage
-
-            del plot_dict[label]
+        key = "largest" if label.startswith("largest_") else label
+        plot_paths[key] = os.path.join(plot_dir, label + plot_suffix)
 
     # ---------------------------------------------------------------------
     # Presentation
     # ---------------------------------------------------------------------
     presentation = pptx.Presentation(template)
+    graph_slide_layout = presentation.slide_layouts[GRAPH_SLIDE_LAYOUT]
+    footnote = "*Excluding small lineages (N<{})".format(min_cluster_size)
 
     # ---------------------------------------------------------------------
     # Title Slide
@@ -111,50 +165,29 @@ def main(
     # ---------------------------------------------------------------------
     # General Summary
 
-    # Slide setup
-    graph_slide_layout = presentation.slide_layouts[8]
-    slide = presentation.slides.add_slide(graph_slide_layout)
-    title = slide.shapes.title
-    title.text_frame.text = "Status"
-    title.text_frame.paragraphs[0].font.bold = True
-
-    chart_placeholder = slide.placeholders[1]
-    # Plotting may have failed to create an individual figure
-    plot_path = plot_dict["lineage"]["plot_path"]
-    if os.path.exists(plot_path):
-        chart_placeholder.insert_picture(plot_path)
-    body = slide.placeholders[2]
+    body = add_graph_slide(
+        presentation, graph_slide_layout, "Status", plot_paths["lineage"]
+    )
 
     # Stats
-
-    lineages_df = plot_dict["lineage"]["df"]
-    lineages = list(lineages_df.columns)
-    lineages.remove("epiweek")
+    lineage_counts = plot_counts["lineage"]
 
     status_counts = {
         status: {"sequences": 0, "lineages": 0} for status in RECOMBINANT_STATUS
     }
 
-    status_seq_df = plot_dict["status"]["df"]
-    statuses = list(status_seq_df.columns)
-    statuses.remove("epiweek")
-
-    for status in statuses:
+    for status in plot_counts["status"]:
         status = status.lower()
-        status_lin_df = plot_dict[status]["df"]
-        status_lin = list(status_lin_df.columns)
-        status_lin.remove("epiweek")
+        status_lin = plot_counts[status]
 
-        num_status_lin = len(status_lin)
-        status_counts[status]["lineages"] += num_status_lin
-
-        for lin in status_lin:
-            num_status_seq = int(sum(lineages_df[lin]))
-            status_counts[status]["sequences"] += num_status_seq
+        status_counts[status]["lineages"] += len(status_lin)
+        status_counts[status]["sequences"] += sum(
+            lineage_counts[lin] for lin in status_lin
+        )
 
     # Number of lineages and sequences
-    total_sequences = int(sum([status_counts[s]["sequences"] for s in status_counts]))
-    total_lineages = int(sum([status_counts[s]["lineages"] for s in status_counts]))
+    total_sequences = sum([status_counts[s]["sequences"] for s in status_counts])
+    total_lineages = sum([status_counts[s]["lineages"] for s in status_counts])
 
     # Construct the summary text
     summary = "\n"
@@ -164,12 +197,8 @@ def main(
     )
 
     for status in RECOMBINANT_STATUS:
-        if status in status_counts:
-            count = status_counts[status]["lineages"]
-        else:
-            count = 0
         summary += "  - {lineages} lineages are {status}.\n".format(
-            lineages=count, status=status
+            lineages=status_counts[status]["lineages"], status=status
         )
 
     summary += "\n"
@@ -178,166 +207,76 @@ def main(
     )
 
     for status in RECOMBINANT_STATUS:
-        if status in status_counts:
-            count = status_counts[status]["sequences"]
-        else:
-            count = 0
         summary += "  - {sequences} sequences are {status}.\n".format(
-            sequences=count, status=status
+            sequences=status_counts[status]["sequences"], status=status
         )
 
     # Add a footnote to indicate cluster size
-    summary += "*Excluding small lineages (N<{})".format(min_cluster_size)
-
-    body.text_frame.text = summary
+    summary += footnote
 
-    # Adjust font size of body
-    for paragraph in body.text_frame.paragraphs:
-        for run in paragraph.runs:
-            run.font.size = pptx.util.Pt(14)
+    set_summary_text(body, summary)
 
     # ---------------------------------------------------------------------
     # Status Summary
 
     for status in RECOMBINANT_STATUS:
 
-        status = status.lower()
-        if status not in plot_dict:
+        if status not in plot_counts:
             continue
 
-        # Slide setup
-        graph_slide_layout = presentation.slide_layouts[8]
-        slide = presentation.slides.add_slide(graph_slide_layout)
-        title = slide.shapes.title
-
-        title.text_frame.text = status.title()
-        title.text_frame.paragraphs[0].font.bold = True
-
-        chart_placeholder = slide.placeholders[1]
-        # Plotting may have failed to create an individual figure
-        plot_path = plot_dict[status]["plot_path"]
-        if os.path.exists(plot_path):
-            chart_placeholder.insert_picture(plot_path)
-
-        body = slide.placeholders[2]
-
-        # Stats
-        status_df = plot_dict[status]["df"]
-        status_lineages = list(status_df.columns)
-        status_lineages.remove("epiweek")
+        body = add_graph_slide(
+            presentation, graph_slide_layout, status.title(), plot_paths[status]
+        )
 
         # Order columns
-        status_counts = {
-            lineage: int(sum(status_df[lineage])) for lineage in status_lineages
-        }
-        status_lineages = sorted(status_counts, key=status_counts.get, reverse=True)
-        num_status_lineages = len(status_lineages)
+        status_lineages = sort_by_count(plot_counts[status])
 
         summary = "\n"
         summary += "There are {num_status_lineages} {status} lineages*.\n".format(
-            status=status, num_status_lineages=num_status_lineages
+            status=status, num_status_lineages=len(status_lineages)
         )
 
-        for lineage in status_lineages:
-            seq_count = int(sum(status_df[lineage].dropna()))
+        for lineage, seq_count in status_lineages.items():
             summary += "  - {lineage} ({seq_count})\n".format(
                 lineage=lineage, seq_count=seq_count
             )
 
-        summary += "\n*Excluding small lineages (N<{})".format(min_cluster_size)
-        body.text_frame.text = summary
-
-        # Adjust font size of body
-        for paragraph in body.text_frame.paragraphs:
-            for run in paragraph.runs:
-                run.font.size = pptx.util.Pt(14)
+        summary += "\n" + footnote
+        set_summary_text(body, summary)
 
     # ---------------------------------------------------------------------
     # Geographic Summary
 
-    geo_df = plot_dict["geography"]["df"]
-    geos = list(geo_df.columns)
-    geos.remove("epiweek")
     # Order columns
-    geos_counts = {region: int(sum(geo_df[region])) for region in geos}
-    geos = sorted(geos_counts, key=geos_counts.get, reverse=True)
-
-    num_geos = len(geos)
-
-    graph_slide_layout = presentation.slide_layouts[8]
-    slide = presentation.slides.add_slide(graph_slide_layout)
-    title = slide.shapes.title
+    geos = sort_by_count(plot_counts["geography"])
 
-    title.text_frame.text = "Geography"
-    title.text_frame.paragraphs[0].font.bold = True
-
-    chart_placeholder = slide.placeholders[1]
-    # Plotting may have failed to create an individual figure
-    plot_path = plot_dict["geography"]["plot_path"]
-    if os.path.exists(plot_path):
-        chart_placeholder.insert_picture(plot_path)
-
-    body = slide.placeholders[2]
+    body = add_graph_slide(
+        presentation, graph_slide_layout, "Geography", plot_paths["geography"]
+    )
 
     summary = "\n"
     summary += "Recombinants are observed in {num_geos} {geo}*.\n".format(
-        num_geos=num_geos, geo=geo
+        num_geos=len(geos), geo=geo
     )
 
-    for region in geos:
-        seq_count = int(sum(geo_df[region].dropna()))
+    for region, seq_count in geos.items():
         summary += "  - {region} ({seq_count})\n".format(
             region=region, seq_count=seq_count
         )
 
-    summary += "\n*Excluding small lineages (N<{})".format(min_cluster_size)
-
-    body.text_frame.text = summary
-
-    # Adjust font size of body
-    for paragraph in body.text_frame.paragraphs:
-        for run in paragraph.runs:
-            run.font.size = pptx.util.Pt(14)
+    summary += "\n" + footnote
+    set_summary_text(body, summary)
 
     # ---------------------------------------------------------------------
     # Largest Summary
 
-    largest_df = plot_dict["largest"]["df"]
-
-    largest_geos = list(largest_df.columns)
-    largest_geos.remove("epiweek")
-
     # Order columns
-    largest_geos_counts = {
-        region: int(sum(largest_df[region])) for region in largest_geos
-    }
-    largest_geos = sorted(
-        largest_geos_counts, key=largest_geos_counts.get, reverse=True
-    )
-
-    num_geos = len(largest_geos)
-
-    largest_lineage = plot_dict["largest"]["lineage"]
-    largest_lineage_size = 0
-
-    for lineage in lineages:
-        seq_count = int(sum(lineages_df[lineage].dropna()))
-        if seq_count > largest_lineage_size:
-            largest_lineage_size = seq_count
-
-    graph_slide_layout = presentation.slide_layouts[8]
-    slide = presentation.slides.add_slide(graph_slide_layout)
-    title = slide.shapes.title
-
-    title.text_frame.text = "Largest"
-    title.text_frame.paragraphs[0].font.bold = True
+    largest_geos = sort_by_count(plot_counts["largest"])
+    largest_lineage_size = max([0] + list(lineage_counts.values()))
 
-    chart_placeholder = slide.placeholders[1]
-    # Plotting may have failed to create an individual figure
-    plot_path = plot_dict["largest"]["plot_path"]
-    if os.path.exists(plot_path):
-        chart_placeholder.insert_picture(plot_path)
-    body = slide.placeholders[2]
+    body = add_graph_slide(
+        presentation, graph_slide_layout, "Largest", plot_paths["largest"]
+    )
 
     summary = "\n"
     summary += "The largest lineage is {lineage} (N={size})*.\n".format(
@@ -346,203 +285,100 @@ def main(
     )
 
     summary += "{lineage} is observed in {num_geo} {geo}.\n".format(
-        lineage=largest_lineage, num_geo=num_geos, geo=geo
+        lineage=largest_lineage, num_geo=len(largest_geos), geo=geo
     )
 
-    for region in largest_geos:
-        seq_count = int(sum(largest_df[region].dropna()))
+    for region, seq_count in largest_geos.items():
         summary += "  - {region} ({seq_count})\n".format(
             region=region, seq_count=seq_count
         )
 
-    summary += "\n*Excluding small lineages (N<{})".format(min_cluster_size)
-
-    body.text_frame.text = summary
-
-    # Adjust font size of body
-    for paragraph in body.text_frame.paragraphs:
-        for run in paragraph.runs:
-            run.font.size = pptx.util.Pt(14)
+    summary += "\n" + footnote
+    set_summary_text(body, summary)
 
     # ---------------------------------------------------------------------
     # RBD Levels
 
-    rbd_df = plot_dict["rbd_level"]["df"]
-    rbd_levels = list(rbd_df.columns)
-    rbd_levels.remove("epiweek")
     # Order columns
-    rbd_counts = {
-        level: int(sum(rbd_df[level]))
-        for level in rbd_levels
-        if int(sum(rbd_df[level])) > 0
-    }
-    rbd_levels = dict(sorted(rbd_counts.items()))
-
-    num_rbd_levels = len(rbd_levels)
-
-    graph_slide_layout = presentation.slide_layouts[8]
-    slide = presentation.slides.add_slide(graph_slide_layout)
-    title = slide.shapes.title
-
-    title.text_frame.text = "Receptor Binding Domain"
-    title.text_frame.paragraphs[0].font.bold = True
+    rbd_levels = dict(
+        sorted(
+            (level, seq_count)
+            for level, seq_count in plot_counts["rbd_level"].items()
+            if seq_count > 0
+        )
+    )
 
-    chart_placeholder = slide.placeholders[1]
-    # Plotting may have failed to create an individual figure
-    plot_path = plot_dict["rbd_level"]["plot_path"]
-    if os.path.exists(plot_path):
-        chart_placeholder.insert_picture(plot_path)
-    body = slide.placeholders[2]
+    body = add_graph_slide(
+        presentation,
+        graph_slide_layout,
+        "Receptor Binding Domain",
+        plot_paths["rbd_level"],
+    )
 
     summary = "\n"
     summary += "{num_rbd_levels} RBD levels are observed*.\n".format(
-        num_rbd_levels=num_rbd_levels,
+        num_rbd_levels=len(rbd_levels),
     )
 
-    for level in rbd_levels:
-        seq_count = int(sum(rbd_df[level].dropna()))
+    for level, seq_count in rbd_levels.items():
         summary += "  - Level {level} ({seq_count})\n".format(
             level=level, seq_count=seq_count
         )
 
-    summary += "\n*Excluding small lineages (N<{})".format(min_cluster_size)
-    body.text_frame.text = summary
-
-    # Adjust font size of body
-    for paragraph in body.text_frame.paragraphs:
-        for run in paragraph.runs:
-            run.font.size = pptx.util.Pt(14)
+    summary += "\n" + footnote
+    set_summary_text(body, summary)
 
     # ---------------------------------------------------------------------
-    # Parents Summary (Clade)
+    # Parents Summary (Clade, Lineage)
 
-    parents_df = plot_dict["parents_clade"]["df"]
-
-    parents = list(parents_df.columns)
-    parents.remove("epiweek")
-
-    parents_counts = {p: int(sum(parents_df[p])) for p in parents}
-    parents = sorted(parents_counts, key=parents_counts.get, reverse=True)
-
-    num_parents = len(parents)
-
-    graph_slide_layout = presentation.slide_layouts[8]
-    slide = presentation.slides.add_slide(graph_slide_layout)
-    title = slide.shapes.title
-
-    title.text_frame.text = "Parents (Clade)"
-    title.text_frame.paragraphs[0].font.bold = True
-
-    chart_placeholder = slide.placeholders[1]
-    # Plotting may have failed to create an individual figure
-    plot_path = plot_dict["parents_clade"]["plot_path"]
-    if os.path.exists(plot_path):
-        chart_placeholder.insert_picture(plot_path)
-    body = slide.placeholders[2]
+    for parent_type in ["clade", "lineage"]:
 
-    summary = "\n"
-    summary += "There are {num_parents} clade combinations*.\n".format(
-        num_parents=num_parents
-    )
+        label = "parents_{}".format(parent_type)
+        parents = sort_by_count(plot_counts[label])
 
-    for parent in parents:
-        seq_count = int(sum(parents_df[parent].dropna()))
-        summary += "  - {parent} ({seq_count})\n".format(
-            parent=parent, seq_count=seq_count
+        body = add_graph_slide(
+            presentation,
+            graph_slide_layout,
+            "Parents ({})".format(parent_type.title()),
+            plot_paths[label],
         )
 
-    summary += "\n*Excluding small lineages (N<{})".format(min_cluster_size)
-    body.text_frame.text = summary
-
-    # Adjust font size of body
-    for paragraph in body.text_frame.paragraphs:
-        for run in paragraph.runs:
-            run.font.size = pptx.util.Pt(14)
-
-    # ---------------------------------------------------------------------
-    # Parents Summary (Lineage)
-
-    parents_df = plot_dict["parents_lineage"]["df"]
-
-    parents = list(parents_df.columns)
-    parents.remove("epiweek")
-
-    parents_counts = {p: int(sum(parents_df[p])) for p in parents}
-    parents = sorted(parents_counts, key=parents_counts.get, reverse=True)
-
-    num_parents = len(parents)
-
-    graph_slide_layout = presentation.slide_layouts[8]
-    slide = presentation.slides.add_slide(graph_slide_layout)
-    title = slide.shapes.title
-
-    title.text_frame.text = "Parents (Lineage)"
-    title.text_frame.paragraphs[0].font.bold = True
-
-    chart_placeholder = slide.placeholders[1]
-    # Plotting may have failed to create an individual figure
-    plot_path = plot_dict["parents_lineage"]["plot_path"]
-    if os.path.exists(plot_path):
-        chart_placeholder.insert_picture(plot_path)
-    body = slide.placeholders[2]
-
-    summary = "\n"
-    summary += "There are {num_parents} lineage combinations*.\n".format(
-        num_parents=num_parents
-    )
-
-    for parent in parents:
-        seq_count = int(sum(parents_df[parent].dropna()))
-        summary += "  - {parent} ({seq_count})\n".format(
-            parent=parent, seq_count=seq_count
+        summary = "\n"
+        summary += "There are {num_parents} {parent_type} combinations*.\n".format(
+            num_parents=len(parents), parent_type=parent_type
         )
 
-    summary += "\n*Excluding small lineages (N<{})".format(min_cluster_size)
-    body.text_frame.text = summary
-
-    # Adjust font size of body
-    for paragraph in body.text_frame.paragraphs:
-        for run in paragraph.runs:
-            run.font.size = pptx.util.Pt(14)
-
-    # ---------------------------------------------------------------------
-    # Breakpoints Clade Summary
-
-    graph_slide_layout = presentation.slide_layouts[8]
-    slide = presentation.slides.add_slide(graph_slide_layout)
-    title = slide.shapes.title
-
-    title.text_frame.text = "Breakpoints (Clade)"
-    title.text_frame.paragraphs[0].font.bold = True
+        for parent, seq_count in parents.items():
+            summary += "  - {parent} ({seq_count})\n".format(
+                parent=parent, seq_count=seq_count
+            )
 
-    chart_placeholder = slide.placeholders[1]
-    # Plotting may have failed to create an individual figure
-    plot_path = plot_dict["breakpoints_clade"]["plot_path"]
-    if os.path.exists(plot_path):
-        chart_placeholder.insert_picture(plot_path)
-    body = slide.placeholders[2]
+        summary += "\n" + footnote
+        set_summary_text(body, summary)
 
     # ---------------------------------------------------------------------
-    # Breakpoints Lineage Summary
-
-    graph_slide_layout = presentation.slide_layouts[8]
-    slide = presentation.slides.add_slide(graph_slide_layout)
-    title = slide.shapes.title
+    # Breakpoints Summary (Clade, Lineage)
 
-    title.text_frame.text = "Breakpoints (Lineage)"
-    title.text_frame.paragraphs[0].font.bold = True
+    for parent_type in ["clade", "lineage"]:
 
-    chart_placeholder = slide.placeholders[1]
-    # Plotting may have failed to create an individual figure
-    plot_path = plot_dict["breakpoints_lineage"]["plot_path"]
-    if os.path.exists(plot_path):
-        chart_placeholder.insert_picture(plot_path)
-    body = slide.placeholders[2]
+        label = "breakpoints_{}".format(parent_type)
+        add_graph_slide(
+            presentation,
+            graph_slide_layout,
+            "Breakpoints ({})".format(parent_type.title()),
+            plot_paths[label],
+        )
 
     # ---------------------------------------------------------------------
     # Footer
 
-    # Versions
+    # Versions, which are identical for all strains
+    linelist_df = pd.read_csv(
+        linelist,
+        sep="\t",
+        usecols=["pipeline_version", "recombinant_classifier_dataset"],
+        nrows=1,
+    )
     pipeline_version = linelist_df["pipeline_version"].values[0]
     recombinant_classifier_dataset = linelist_df[
         "recombinant_classifier_dataset"
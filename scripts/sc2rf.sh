@@ -37,6 +37,16 @@ while [[ $# -gt 0 ]]; do
       shift # past argument
       shift # past value
       ;;
+    --shard)
+      shard=$2
+      shift # past argument
+      shift # past value
+      ;;
+    --shards)
+      shards=$2
+      shift # past argument
+      shift # past value
+      ;;
     -*|--*)
       arg=$1
       value=$2
@@ -67,6 +77,17 @@ sc2rf="sc2rf/sc2rf.py"
 primers_name=${primers_name:-primers}
 sc2rf_args+=("--csvfile $output_csv")
 
+# Select this shard's chunk of the alignment, by sequence index (1-based)
+shard=${shard:-0}
+shards=${shards:-1}
+if [[ $shards -gt 1 ]]; then
+  num_seqs=$(grep -c "^>" $alignment)
+  shard_size=$(( (num_seqs + shards - 1) / shards ))
+  shard_start=$(( shard * shard_size + 1 ))
+  shard_end=$(( (shard + 1) * shard_size ))
+  sc2rf_args+=("--select-sequences ${shard_start}-${shard_end}")
+fi
+
 # Add primers
 if [[ "${primers}" ]]; then
   cp $primers sc2rf/${primers_name}.bed
@@ -77,6 +98,11 @@ fi
 #log_rebuild=${log%.*}_rebuild
 #python3 sc2rf.py --rebuild-examples 1> ${log_rebuild}.log 2> ${log_rebuild}.err
 
+# Send the scan to a running sc2rf service, if there is one (see --serve)
+if [[ "${SC2RF_SOCKET}" && -S "${SC2RF_SOCKET}" ]]; then
+  sc2rf_args+=("--connect ${SC2RF_SOCKET}")
+fi
+
 echo "python3 $sc2rf ${alignment} ${sc2rf_args[@]}" > ${output_ansi}
 python3 $sc2rf ${alignment} ${sc2rf_args[@]} 1>> ${output_ansi} 2> ${log};
 
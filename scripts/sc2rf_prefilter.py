@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+import argparse
+import click
+import json
+import os
+import pandas as pd
+from collections import Counter
+from functions import create_logger
+
+# Defaults of the sc2rf arguments that determine the first pass scan
+SC2RF_CLADES = ["20I", "20H", "20J", "21I", "21J", "BA.1", "BA.2", "BA.3"]
+SC2RF_PARENTS = "2-4"
+SC2RF_UNIQUE = 2
+SC2RF_MUTATION_THRESHOLD = 0.75
+
+
+def parse_sc2rf_args(sc2rf_args):
+    """Parse the sc2rf arguments of a mode that affect candidate selection."""
+
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--clades", "-c", nargs="*", default=SC2RF_CLADES)
+    parser.add_argument("--parents", "-p", default=SC2RF_PARENTS)
+    parser.add_argument("--unique", "-u", type=int, default=SC2RF_UNIQUE)
+    parser.add_argument(
+        "--mutation-threshold", "-t", type=float, default=SC2RF_MUTATION_THRESHOLD
+    )
+    parser.add_argument("--enable-deletions", "-d", action="store_true")
+    parser.add_argument("--force-all-parents", "-f", action="store_true")
+    args, _unknown = parser.parse_known_args(sc2rf_args)
+    return args
+
+
+def min_parents(interval):
+    """Lower limit of an sc2rf interval (ex. 2, 2-4, 2-, -4)."""
+    lower = interval.split("-")[0]
+    return int(lower) if lower else 0
+
+
+def unique_mutations(virus_properties, clades, mutation_threshold, deletions):
+    """
+    Find the mutations unique to each clade, the same way as sc2rf.
+
+    Mutations are keyed by coordinate and alt (ex. 241T), so that both
+    notations of virus_properties.json can be compared to nextclade.
+    """
+
+    with open(virus_properties) as infile:
+        variants = json.load(infile)["variants"]
+
+    examples = []
+    for variant in variants:
+        if (
+            "all" not in clades
+            and variant["NextstrainClade"] not in clades
+            and variant["PangoLineage"] not in clades
+        ):
+            continue
+
+        subs = {}
+        for m in variant["mutations"]:
+            mutation = m["mutation"].strip()
+            if m["proportion"] < mutation_threshold or not mutation:
+                continue
+            alt = mutation[-1]
+            if (alt != "-" or deletions) and alt != ".":
+                coord = int(mutation[1:-1] if mutation[0].isalpha() else mutation[:-1])
+                subs[coord] = "{}{}".format(coord, alt)
+        examples.append(set(subs.values()))
+
+    unique = []
+    for i, subs in enumerate(examples):
+        others = set().union(*[s for j, s in enumerate(examples) if j != i])
+        unique.append(subs - others)
+
+    return unique
+
+
+def sample_mutations(substitutions, deletions=None):
+    """Convert nextclade substitutions (and deletions) to coordinate and alt."""
+
+    mutations = [s[1:] for s in substitutions.split(",") if s]
+    if deletions:
+        for deletion in deletions.split(","):
+            if not deletion:
+                continue
+            start, _, end = deletion.partition("-")
+            end = end if end else start
+            mutations += ["{}-".format(c) for c in range(int(start), int(end) + 1)]
+    return mutations
+
+
+@click.command(
+    context_settings=dict(ignore_unknown_options=True, allow_extra_args=True)
+)
+@click.option("--nextclade", help="Nextclade qc table (tsv)", required=True)
+@click.option("--output", help="Output list of candidate strains", required=True)
+@click.option(
+    "--virus-properties",
+    help="sc2rf clade mutations (json)",
+    required=False,
+    default="sc2rf/virus_properties.json",
+)
+@click.option("--log", help="Logfile", required=False)
+@click.argument("sc2rf_args", nargs=-1, type=click.UNPROCESSED)
+def main(nextclade, output, virus_properties, log, sc2rf_args):
+    """
+    Select candidate recombinants for an sc2rf mode from nextclade substitutions.
+
+    A strain is kept if it has enough unique mutations of enough of the mode's
+    clades to pass the first pass scan of sc2rf.
+    """
+
+    logger = create_logger(logfile=log)
+
+    outdir = os.path.dirname(output)
+    if not os.path.exists(outdir) and outdir != "":
+        os.makedirs(outdir)
+
+    args = parse_sc2rf_args(list(sc2rf_args))
+    num_parents = min_parents(args.parents)
+
+    # -------------------------------------------------------------------------
+    # Import
+
+    logger.info("Parsing nextclade: {}".format(nextclade))
+    cols = ["seqName", "substitutions"]
+    if args.enable_deletions:
+        cols.append("deletions")
+    df = pd.read_csv(nextclade, sep="\t", usecols=cols, dtype=str)
+    df.fillna("", inplace=True)
+
+    # -------------------------------------------------------------------------
+    # Match unique mutations
+
+    if args.force_all_parents or num_parents == 0 or args.unique <= 0:
+        logger.info("All strains are candidates, mode has no minimum of matches.")
+        candidates = list(df["seqName"])
+
+    else:
+        logger.info("Parsing clade mutations: {}".format(virus_properties))
+        unique = unique_mutations(
+            virus_properties,
+            args.clades,
+            args.mutation_threshold,
+            args.enable_deletions,
+        )
+
+        # The clades of each unique mutation
+        mutation_clades = {}
+        for i, mutations in enumerate(unique):
+            for mutation in mutations:
+                mutation_clades.setdefault(mutation, []).append(i)
+
+        deletions = df["deletions"] if args.enable_deletions else [None] * len(df)
+        candidates = []
+        for strain, substitutions, strain_deletions in zip(
+            df["seqName"], df["substitutions"], deletions
+        ):
+            counts = Counter(
+                i
+                for mutation in sample_mutations(substitutions, strain_deletions)
+                for i in mutation_clades.get(mutation, [])
+            )
+            matches = [i for i, count in counts.items() if count >= args.unique]
+            if len(matches) >= num_parents:
+                candidates.append(strain)
+
+    logger.info(
+        "Selected {} of {} strains as candidates.".format(len(candidates), len(df))
+    )
+
+    with open(output, "w") as outfile:
+        outfile.write("".join(strain + "\n" for strain in candidates))
+
+
+if __name__ == "__main__":
+    main()
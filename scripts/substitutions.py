@@ -0,0 +1,142 @@
+import logging
+import numpy as np
+import pandas as pd
+import re
+
+logger = logging.getLogger(__name__)
+
+NO_DATA_CHAR = "NA"
+
+# A substitution (ex. C241T) is packed into one integer as:
+#   position << 16 | ord(ref) << 8 | ord(alt)
+# so that sorting the codes sorts substitutions by position. Missing
+# substitutions (NA) are encoded as 0, which is not a valid position.
+POS_SHIFT = 16
+REF_SHIFT = 8
+BASE_MASK = 0xFF
+NO_DATA_CODE = 0
+# Codes are unsigned 32-bit, which leaves 16 bits for the position
+MAX_POS = 1 << 16
+VALID_BASES = np.frombuffer(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ*-", dtype=np.uint8)
+LABEL_REGEX = re.compile(r"\|[^,]*")
+
+
+def parse_subs(subs):
+    """
+    Parse substitutions into codes, as a matrix of bytes with one row per
+    substitution, so they are parsed at once rather than one by one.
+
+    :param subs: bytes array of substitutions without labels (ex. C241T)
+    :return: array of codes (uint32), array of whether each is valid (bool)
+    """
+    lengths = np.char.str_len(subs)
+    width = subs.dtype.itemsize
+    chars = subs.view(np.uint8).reshape(len(subs), width)
+
+    ref = chars[:, 0]
+    alt = chars[np.arange(len(subs)), np.maximum(lengths - 1, 0)]
+    valid = (lengths >= 3) & np.isin(ref, VALID_BASES) & np.isin(alt, VALID_BASES)
+
+    # The position is the digits between the ref and alt base, accumulated one
+    # column at a time
+    pos = np.zeros(len(subs), dtype=np.uint32)
+    for col in range(1, width - 1):
+        inner = col < lengths - 1
+        digit = chars[:, col] - np.uint8(ord("0"))
+        valid &= ~inner | (digit <= 9)
+        pos = np.where(inner, pos * 10 + digit, pos)
+    valid &= (pos > 0) & (lengths - 2 <= len(str(MAX_POS)))
+    valid &= pos < MAX_POS
+
+    codes = (pos << POS_SHIFT) | (ref.astype(np.uint32) << REF_SHIFT) | alt
+    return np.where(valid, codes, NO_DATA_CODE).astype(np.uint32), valid
+
+
+def encode_subs(subs, chunk_size=10000):
+    """
+    Parse a column of csv substitutions (ex. C241T,A385G) into integer codes.
+
+    Labels (ex. C241T|Omicron/BA.2/21L) are removed, and missing values (NA)
+    are encoded as 0. Malformed substitutions are logged and skipped. Rows are
+    parsed in chunks, so memory does not grow with the number of rows.
+
+    :param subs: array of csv substitutions, one per row
+    :param chunk_size: int, number of rows parsed at once
+    :return: series of codes, indexed by the row position of each substitution
+    """
+    subs = list(subs)
+    rows, codes = [], []
+    num_invalid, invalid = 0, []
+
+    for start in range(0, len(subs), chunk_size):
+        chunk = [
+            NO_DATA_CHAR if pd.isnull(csv) or csv == "" else csv
+            for csv in subs[start : start + chunk_size]
+        ]
+        chunk_rows = np.repeat(
+            np.arange(start, start + len(chunk), dtype=np.uint32),
+            [csv.count(",") + 1 for csv in chunk],
+        )
+        # Characters that are not ascii are replaced, and invalidate a substitution
+        chunk_subs = LABEL_REGEX.sub("", ",".join(chunk))
+        chunk_subs = np.array(
+            chunk_subs.encode("ascii", errors="replace").split(b","), dtype="S"
+        )
+        chunk_codes, valid = parse_subs(chunk_subs)
+
+        # Rows without substitutions are kept as NA
+        keep = valid | (chunk_subs == NO_DATA_CHAR.encode())
+        if not keep.all():
+            num_invalid += np.count_nonzero(~keep)
+            invalid += [sub.decode() for sub in chunk_subs[~keep][:5]]
+        rows.append(chunk_rows[keep])
+        codes.append(chunk_codes[keep])
+
+    if num_invalid:
+        logger.warning(
+            "Skipped {} malformed substitutions (ex. {})".format(
+                num_invalid, ",".join(invalid[:5])
+            )
+        )
+
+    if not codes:
+        return pd.Series(np.array([], dtype=np.uint32), dtype=np.uint32)
+    return pd.Series(np.concatenate(codes), index=np.concatenate(rows))
+
+
+def group_subs(codes, num_rows):
+    """
+    Group substitution codes back into one array per row.
+
+    :param codes: series of codes indexed by row position (see encode_subs)
+    :param num_rows: int, number of rows
+    :return: list of arrays of codes, in the order they appear in each row
+    """
+    rows = codes.index.values
+    order = np.argsort(rows, kind="stable")
+    bounds = np.searchsorted(rows[order], np.arange(1, num_rows))
+    return np.split(codes.values[order], bounds)
+
+
+def sub_positions(codes):
+    """Return the genomic position of substitution codes."""
+    return np.asarray(codes) >> POS_SHIFT
+
+
+def decode_subs(codes):
+    """
+    Convert substitution codes back to strings (ex. C241T).
+
+    :param codes: iterable of codes
+    :return: list of substitutions
+    """
+    return [
+        NO_DATA_CHAR
+        if code == NO_DATA_CODE
+        else "{}{}{}".format(
+            chr((code >> REF_SHIFT) & BASE_MASK),
+            code >> POS_SHIFT,
+            chr(code & BASE_MASK),
+        )
+        for code in codes
+    ]
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+import click
+import csv
+import os
+import sys
+
+SORT_COL = "Nextclade_pango"
+JOIN_COL = "strain"
+
+DEFAULT_COLS = ["strain", "date", "country"]
+NEXTCLADE_COLS = [
+    "privateNucMutations.reversionSubstitutions",
+    "privateNucMutations.unlabeledSubstitutions",
+    "privateNucMutations.labeledSubstitutions",
+    "substitutions",
+]
+# These nextclade columns are always placed last, after any extra columns
+NEXTCLADE_LINEAGE_COLS = ["clade", "Nextclade_pango"]
+NEXTCLADE_RENAME = {"clade": "Nextclade_clade"}
+
+# csvtk ignores lines starting with this character
+COMMENT_CHAR = "#"
+
+# Whitespace that forces quoting at the start of a field (Go's unicode.IsSpace)
+LEADING_SPACE = "\t\n\v\f\r \u0085\u00a0"
+
+csv.field_size_limit(sys.maxsize)
+
+
+def read_table(path, cols=None):
+    """
+    Read a TSV as the header and rows of strings, keeping only cols if given.
+    """
+    with open(path, newline="") as infile:
+        lines = (line for line in infile if not line.startswith(COMMENT_CHAR))
+        reader = csv.reader(lines, delimiter="\t")
+        header = next(reader)
+        if not cols:
+            return header, [row for row in reader if row]
+
+        missing = [col for col in cols if col not in header]
+        if missing:
+            raise click.ClickException(
+                "Column(s) not found in {}: {}".format(path, ",".join(missing))
+            )
+        col_i = [header.index(col) for col in cols]
+        return cols, [[row[i] for i in col_i] for row in reader if row]
+
+
+def hash_join(left_header, left_rows, right_header, right_rows, key=JOIN_COL):
+    """
+    Inner join two tables on key, in the order of the left table.
+
+    All matches of duplicated keys in the right table are kept, and the key
+    column is only kept from the left table (same as csvtk join).
+    """
+    left_key = left_header.index(key)
+    right_key = right_header.index(key)
+    right_cols = [i for i in range(len(right_header)) if i != right_key]
+
+    right_index = {}
+    for row in right_rows:
+        right_index.setdefault(row[right_key], []).append([row[i] for i in right_cols])
+
+    header = left_header + [right_header[i] for i in right_cols]
+    rows = [
+        left_row + right_row
+        for left_row in left_rows
+        for right_row in right_index.get(left_row[left_key], [])
+    ]
+    return header, rows
+
+
+def format_field(field):
+    """Quote a field the same way as the Go csv writer used by csvtk."""
+    if field == "":
+        return field
+    if (
+        field == "\\."
+        or "\t" in field
+        or '"' in field
+        or "\r" in field
+        or "\n" in field
+        or field[0] in LEADING_SPACE
+    ):
+        return '"' + field.replace('"', '""') + '"'
+    return field
+
+
+def write_table(outfile, header, rows):
+    """Stream a table to an open file as TSV."""
+    outfile.write("\t".join(format_field(f) for f in header) + "\n")
+    for row in rows:
+        outfile.write("\t".join(format_field(f) for f in row) + "\n")
+
+
+@click.command()
+@click.option("--nextclade", help="Nextclade metadata (tsv)", required=True)
+@click.option("--sc2rf", help="sc2rf recombinants stats (tsv)", required=True)
+@click.option("--rbd-levels", help="RBD levels (tsv)", required=True)
+@click.option("--output", help="Output summary (tsv)", required=True)
+@click.option("--extra-cols", help="Extra metadata columns (csv)", required=False)
+@click.option("--ncov-recombinant-version", help="Pipeline version", required=True)
+@click.option("--nextclade-version", help="Nextclade version", required=True)
+@click.option("--nextclade-dataset", help="Nextclade dataset", required=True)
+def main(
+    nextclade,
+    sc2rf,
+    rbd_levels,
+    output,
+    extra_cols,
+    ncov_recombinant_version,
+    nextclade_version,
+    nextclade_dataset,
+):
+    """Summarize results from pipeline tools."""
+
+    outdir = os.path.dirname(output)
+    if not os.path.exists(outdir) and outdir != "":
+        os.makedirs(outdir)
+
+    # Select and rename columns from nextclade
+    cols = DEFAULT_COLS + NEXTCLADE_COLS
+    if extra_cols:
+        cols += extra_cols.split(",")
+    cols += NEXTCLADE_LINEAGE_COLS
+
+    header, rows = read_table(nextclade, cols=cols)
+    header = [NEXTCLADE_RENAME.get(col, col) for col in header]
+
+    # Add the sc2rf and rbd levels results
+    sc2rf_header, sc2rf_rows = read_table(sc2rf)
+    header, rows = hash_join(header, rows, sc2rf_header, sc2rf_rows)
+
+    rbd_header, rbd_rows = read_table(rbd_levels)
+    header, rows = hash_join(header, rows, rbd_header, rbd_rows)
+
+    # Stable sort by lineage
+    sort_i = header.index(SORT_COL)
+    rows.sort(key=lambda row: row[sort_i])
+
+    # Add versions
+    header += ["ncov-recombinant_version", "nextclade_version", "nextclade_dataset"]
+    versions = [ncov_recombinant_version, nextclade_version, nextclade_dataset]
+
+    with open(output, "w") as outfile:
+        write_table(outfile, header, (row + versions for row in rows))
+
+
+if __name__ == "__main__":
+    main()
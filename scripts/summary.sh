@@ -36,6 +36,10 @@ while [[ $# -gt 0 ]]; do
       shift # past argument
       shift # past value
       ;;
+    --python)
+      python=true
+      shift # past argument
+      ;;
     -*|--*)
       echo "Unknown option $1"
       exit 1
@@ -52,6 +56,29 @@ ncov_recombinant_ver="${git_tag}:${git_commit}"
 # Nextclade version
 nextclade_ver=$(nextclade --version | cut -d " " -f 2)
 
+# The python join (--python) is meant to replace the csvtk pipeline, once its
+# output has been diffed against csvtk on real builds (with and without extra cols)
+if [[ $python ]]; then
+
+  # Only pass extra columns if they were specified
+  extra_cols_arg=""
+  if [[ $extra_cols ]]; then
+    extra_cols_arg="--extra-cols ${extra_cols}"
+  fi
+
+  python3 scripts/summary.py \
+    --nextclade ${nextclade} \
+    --sc2rf ${sc2rf} \
+    --rbd-levels ${rbd_levels} \
+    --output ${output} \
+    --ncov-recombinant-version "${ncov_recombinant_ver}" \
+    --nextclade-version "${nextclade_ver}" \
+    --nextclade-dataset "${nextclade_dataset}" \
+    ${extra_cols_arg}
+
+  exit $?
+fi
+
 sort_col="Nextclade_pango"
 default_cols="strain,date,country"
 nextclade_cols="privateNucMutations.reversionSubstitutions,privateNucMutations.unlabeledSubstitutions,privateNucMutations.labeledSubstitutions,substitutions"
@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 import click
 import pandas as pd
+import numpy as np
 import os
+import time
+from functions import create_logger
 
 NO_DATA_CHAR = "NA"
 VALIDATE_COLS = ["status", "lineage", "parents_clade", "breakpoints"]
@@ -11,68 +14,95 @@ VALIDATE_COLS = ["status", "lineage", "parents_clade", "breakpoints"]
 @click.option("--expected", help="Expected linelist (TSV)", required=True)
 @click.option("--observed", help="Observed linelist (TSV)", required=True)
 @click.option("--outdir", help="Output directory", required=True)
+@click.option("--log", help="Output log file.", required=False)
 def main(
     expected,
     observed,
     outdir,
+    log,
 ):
     """Validate output"""
 
+    # create logger
+    logger = create_logger(logfile=log)
+
     # Check for output directory
     if not os.path.exists(outdir):
         os.makedirs(outdir)
 
     # Import Dataframes
+    start_time = time.time()
     expected_df = pd.read_csv(expected, sep="\t")
     observed_df = pd.read_csv(observed, sep="\t")
 
     expected_df.fillna(NO_DATA_CHAR, inplace=True)
     observed_df.fillna(NO_DATA_CHAR, inplace=True)
+    logger.info(
+        "Imported {} expected and {} observed strains: {:.3f}s".format(
+            len(expected_df), len(observed_df), time.time() - start_time
+        )
+    )
+
+    # Align the expected and observed values of each strain, using the
+    # first record if a strain appears more than once
+    start_time = time.time()
+    merge_cols = ["strain"] + VALIDATE_COLS
+    validate_df = (
+        observed_df[["strain"]]
+        .merge(
+            observed_df[merge_cols].drop_duplicates("strain"),
+            on="strain",
+            how="left",
+        )
+        .merge(
+            expected_df[merge_cols].drop_duplicates("strain"),
+            on="strain",
+            how="left",
+            suffixes=("_observed", "_expected"),
+            indicator=True,
+        )
+    )
+    has_expected = (validate_df["_merge"] == "both").values
+
+    # Validate observed values
+    fail_df = pd.DataFrame(
+        {
+            col: has_expected
+            & (validate_df[col + "_expected"] != validate_df[col + "_observed"])
+            for col in VALIDATE_COLS
+        }
+    )
+
+    fail_cols = pd.Series("", index=validate_df.index)
+    expected_vals = pd.Series("", index=validate_df.index)
+    observed_vals = pd.Series("", index=validate_df.index)
+    for col in VALIDATE_COLS:
+        fail_cols += np.where(fail_df[col], col + ";", "")
+        expected_vals += np.where(
+            fail_df[col], validate_df[col + "_expected"].astype(str) + ";", ""
+        )
+        observed_vals += np.where(
+            fail_df[col], validate_df[col + "_observed"].astype(str) + ";", ""
+        )
+
+    status = np.where(
+        has_expected,
+        np.where(fail_df.any(axis="columns"), "Fail", "Pass"),
+        "No Expected Values",
+    )
 
     output_data = {
-        "strain": [],
-        "status": [],
-        "fail_cols": [],
-        "expected": [],
-        "observed": [],
+        "strain": list(validate_df["strain"]),
+        "status": list(status),
+        # Remove the trailing separator
+        "fail_cols": list(fail_cols.str[:-1]),
+        "expected": list(expected_vals.str[:-1]),
+        "observed": list(observed_vals.str[:-1]),
     }
 
-    # Validate observed values
-    for rec in observed_df.iterrows():
-        strain = rec[1]["strain"]
-        fail_cols = []
-        expected_vals = []
-        observed_vals = []
-
-        # Check if this in the validation table
-        if strain not in expected_df["strain"].values:
-            status = "No Expected Values"
-        else:
-
-            # Check if all observed values match the expected values
-            match = True
-
-            for col in VALIDATE_COLS:
-                exp_val = expected_df[expected_df["strain"] == strain][col].values[0]
-                obs_val = observed_df[observed_df["strain"] == strain][col].values[0]
-
-                if exp_val != obs_val:
-                    match = False
-                    fail_cols.append(col)
-                    expected_vals.append(exp_val)
-                    observed_vals.append(obs_val)
-
-            # Check if any columns failed matching
-            if match:
-                status = "Pass"
-            else:
-                status = "Fail"
-
-        output_data["strain"].append(strain)
-        output_data["status"].append(status)
-        output_data["fail_cols"].append(";".join(fail_cols))
-        output_data["expected"].append(";".join(expected_vals))
-        output_data["observed"].append(";".join(observed_vals))
+    logger.info("Compared values: {:.3f}s".format(time.time() - start_time))
+    for col, num_fail in fail_df.sum().astype(int).items():
+        logger.info("Mismatches in {}: {}".format(col, num_fail))
 
     # Table of validation
     output_df = pd.DataFrame(output_data)